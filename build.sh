@@ -11,6 +11,10 @@ echo "Port: $PORT"
 echo "Applying database migrations..."
 python manage.py migrate
 
+# Fill the daily sales rollup from existing sales on first deploy
+echo "Building sales rollup..."
+python manage.py rebuild_sales_rollup --if-empty
+
 # Create superuser if specified in environment variables
 if [[ -n "$DJANGO_SUPERUSER_USERNAME" && -n "$DJANGO_SUPERUSER_EMAIL" && -n "$DJANGO_SUPERUSER_PASSWORD" ]]; then
   echo "Creating superuser..."
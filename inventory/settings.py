@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from datetime import timedelta
 from pathlib import Path
 import os
+import sys
 import dj_database_url
 from dotenv import load_dotenv
 
@@ -98,6 +99,7 @@ SIMPLE_JWT = {
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Make sure this is second
+    'inventory_api.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -149,6 +151,97 @@ DATABASE_OPTIONS = {
     'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),
 }
 
+# Cache shared by every worker when REDIS_URL is set; otherwise each process
+# keeps its own local memory cache
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+
+# Sale order numbers reserved per worker process at a time
+ORDER_NUMBER_BLOCK_SIZE = int(os.environ.get('ORDER_NUMBER_BLOCK_SIZE', '50'))
+
+# Sales written per transaction by the offline batch ingest endpoint
+SALE_BATCH_CHUNK_SIZE = int(os.environ.get('SALE_BATCH_CHUNK_SIZE', '100'))
+
+# Idempotency-Key replay for sale and payment writes (see inventory_api/idempotency.py)
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', '60'))
+IDEMPOTENCY_LRU_SIZE = int(os.environ.get('IDEMPOTENCY_LRU_SIZE', '1024'))
+
+# Barcode scan index: rebuild after this many seconds at most, and check the
+# database for changes made by other workers this often
+SCAN_INDEX_MAX_AGE = int(os.environ.get('SCAN_INDEX_MAX_AGE', '300'))
+SCAN_INDEX_CHECK_INTERVAL = float(os.environ.get('SCAN_INDEX_CHECK_INTERVAL', '1'))
+
+# Rows read per round trip by the streaming report exports
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '2000'))
+
+# Background report jobs (see inventory_api/reports.py): a running job is
+# taken over by another worker after REPORT_JOB_TIMEOUT seconds, and
+# finished jobs are deleted after REPORT_JOB_RETENTION_HOURS
+REPORT_JOB_TIMEOUT = int(os.environ.get('REPORT_JOB_TIMEOUT', '900'))
+REPORT_JOB_MAX_ATTEMPTS = int(os.environ.get('REPORT_JOB_MAX_ATTEMPTS', '3'))
+REPORT_JOB_RETENTION_HOURS = int(os.environ.get('REPORT_JOB_RETENTION_HOURS', '168'))
+REPORT_WORKER_POLL_INTERVAL = float(os.environ.get('REPORT_WORKER_POLL_INTERVAL', '2'))
+
+# Products at or below this quantity count as low stock (as in the frontend)
+LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', '5'))
+
+# Statistics endpoint cache (see inventory_api/stats_cache.py): seconds a
+# result is kept, and seconds one request may spend recomputing a stale one
+# while others are served the stale result
+STATS_CACHE_TIMEOUT = int(os.environ.get('STATS_CACHE_TIMEOUT', '300'))
+STATS_CACHE_LOCK_TIMEOUT = int(os.environ.get('STATS_CACHE_LOCK_TIMEOUT', '30'))
+
+# Coalescing of identical concurrent analytics computations (see
+# inventory_api/singleflight.py): seconds to wait for the computing request,
+# and seconds between checks for its result from other workers
+SINGLEFLIGHT_TIMEOUT = int(os.environ.get('SINGLEFLIGHT_TIMEOUT', '30'))
+SINGLEFLIGHT_POLL_INTERVAL = float(os.environ.get('SINGLEFLIGHT_POLL_INTERVAL', '0.05'))
+
+# Columnar store of sale lines for the analytics group-bys (see
+# inventory_api/columnar.py): where its files live, seconds between checks
+# that it still matches the database, seconds after which it is rewritten
+# from scratch, and seconds between syncs of ``sync_columnar --loop``
+COLUMNAR_DIR = os.environ.get('COLUMNAR_DIR', os.path.join(BASE_DIR, 'var', 'columnar'))
+COLUMNAR_VERIFY_INTERVAL = int(os.environ.get('COLUMNAR_VERIFY_INTERVAL', '60'))
+COLUMNAR_MAX_AGE = int(os.environ.get('COLUMNAR_MAX_AGE', '3600'))
+COLUMNAR_SYNC_INTERVAL = float(os.environ.get('COLUMNAR_SYNC_INTERVAL', '10'))
+
+# Seconds a stored demand forecast is served before the single-product
+# endpoint recomputes it (see inventory_api/forecasting.py)
+FORECAST_MAX_AGE = int(os.environ.get('FORECAST_MAX_AGE', '86400'))
+
+# Per-view query and latency budgets, keyed by URL name (see
+# inventory_api/middleware.py). 'warn' logs requests over budget, 'raise'
+# fails those over their query budget (the default under `manage.py test`;
+# latency is only logged), 'off' disables the checks.
+QUERY_BUDGET_MODE = os.environ.get(
+    'QUERY_BUDGET_MODE', 'raise' if sys.argv[1:2] == ['test'] else 'warn'
+)
+QUERY_BUDGETS = {
+    'default': {
+        'queries': int(os.environ.get('QUERY_BUDGET_DEFAULT_QUERIES', '30')),
+        'ms': int(os.environ.get('QUERY_BUDGET_DEFAULT_MS', '1000')),
+    },
+    'product-scan': {'queries': 3, 'ms': 50},
+    'sale-batch': {'queries': 500, 'ms': 15000},
+    'generate-report': {'queries': 100, 'ms': 10000},
+    'batch-demand-forecast': {'queries': 30, 'ms': 10000},
+}
+# Log a query repeated this many times within one request as a likely N+1
+QUERY_DUPLICATE_THRESHOLD = int(os.environ.get('QUERY_DUPLICATE_THRESHOLD', '5'))
+
+# Sharded stock counters for hot products (see inventory_api/stock.py)
+STOCK_SHARD_COUNT = int(os.environ.get('STOCK_SHARD_COUNT', '8'))
+STOCK_SHARD_AUTO_PROMOTE = os.environ.get('STOCK_SHARD_AUTO_PROMOTE', 'True') == 'True'
+STOCK_LOCK_WAIT_THRESHOLD_MS = int(os.environ.get('STOCK_LOCK_WAIT_THRESHOLD_MS', '50'))
+STOCK_SHARD_PROMOTE_AFTER = int(os.environ.get('STOCK_SHARD_PROMOTE_AFTER', '20'))
+
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS']
 CORS_ALLOW_HEADERS = [
@@ -157,6 +250,7 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
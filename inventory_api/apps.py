@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+
+
+class InventoryApiConfig(AppConfig):
+    name = 'inventory_api'
+
+    def ready(self):
+        # Keep the barcode scan index in step with product changes
+        from . import closed_periods, reports, rollups, scan_index, stats_cache
+        scan_index.connect_signals()
+        # Start report jobs afresh after edits the data watermark cannot see
+        reports.connect_signals()
+        # Take deleted sale lines out of the daily sales rollup
+        rollups.connect_signals()
+        # Mark cached statistics stale after sales and stock changes
+        stats_cache.connect_signals()
+        # Forget stored cash reports of days whose payments changed
+        closed_periods.connect_signals()
@@ -0,0 +1,274 @@
+"""
+Batched checkout engine for point-of-sale baskets.
+
+A sale is written with a fixed number of queries no matter how many lines
+the basket has: products are locked in primary-key order (so two terminals
+selling overlapping baskets cannot deadlock), sale items, stock movements
+and payments are bulk-inserted, and stock is decremented with a single
+set-based UPDATE. Products in sharded stock mode skip the row lock and are
+decremented on one of their counter shards instead (see stock.py).
+"""
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Payment, Product, Sale, SaleItem, StockMovement
+from .order_numbers import allocate_order_numbers
+from .rollups import record_lines, sale_line
+from .stock import InsufficientStock, adjust_stock, record_lock_wait
+
+
+def fetch_products(product_ids):
+    """Load every product referenced by a basket with one query."""
+    return Product.objects.in_bulk(set(product_ids))
+
+
+def quantities_by_product(items_data):
+    """Total quantity per product id, in a stable order."""
+    quantities = OrderedDict()
+    for item in items_data:
+        product_id = item['product'].pk
+        quantities[product_id] = quantities.get(product_id, 0) + item['quantity']
+    return quantities
+
+
+def lock_products(product_ids):
+    """
+    Lock the given product rows in primary-key order and return them by id.
+
+    Must be called inside a transaction. The fixed lock order is what keeps
+    concurrent checkouts with overlapping baskets free of deadlocks. Sharded
+    products are not locked; they are returned by a second query only when
+    some requested product was not locked, with their stock_shards set.
+
+    The lock wait counts towards sharding only when a single row was
+    locked: a wait on several rows cannot be put down to one of them, and
+    charging it to all would shard every product bought with a hot one.
+    """
+    start = time.perf_counter()
+    locked = {
+        product.pk: product
+        for product in Product.objects.select_for_update().filter(
+            pk__in=product_ids, stock_shards=0
+        ).order_by('pk').only('id', 'name', 'quantity', 'stock_shards')
+    }
+    if len(locked) == 1:
+        record_lock_wait(list(locked), time.perf_counter() - start)
+
+    missing = [product_id for product_id in product_ids if product_id not in locked]
+    if missing:
+        for product in Product.objects.filter(pk__in=missing).only('id', 'name', 'quantity', 'stock_shards'):
+            locked[product.pk] = product
+    return locked
+
+
+def check_stock(locked_products, quantities, remaining=None):
+    """
+    Raise a ValidationError if any locked product cannot cover its quantity.
+
+    ``remaining`` optionally overrides the locked quantities, for checking
+    several sales in a row against the same locked products.
+    """
+    for product_id, quantity in quantities.items():
+        product = locked_products.get(product_id)
+        if product is None:
+            raise serializers.ValidationError(f"Product with ID {product_id} does not exist")
+        available = product.quantity if remaining is None else remaining[product_id]
+        # Sharded products are checked by the conditional shard update itself
+        if not product.stock_shards and quantity > available:
+            raise serializers.ValidationError(
+                f"Insufficient stock for product {product.name}. Available: {available}"
+            )
+
+
+def decrement_stock(quantities, locked_products=None):
+    """
+    Subtract every quantity from its product.
+
+    Unsharded products are updated with one UPDATE statement; sharded ones
+    (known from ``locked_products``) each decrement one of their shards.
+    """
+    sharded = {}
+    if locked_products:
+        sharded = {
+            product_id: locked_products[product_id].stock_shards
+            for product_id in quantities
+            if locked_products[product_id].stock_shards
+        }
+    for product_id, shards in sharded.items():
+        try:
+            adjust_stock(product_id, -quantities[product_id], shards=shards)
+        except InsufficientStock as e:
+            raise serializers.ValidationError(str(e))
+
+    rows = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in sharded}
+    if not rows:
+        return 0
+    delta = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in rows.items()],
+        output_field=IntegerField(),
+    )
+    return Product.objects.filter(pk__in=list(rows)).update(quantity=F('quantity') - delta)
+
+
+def build_payments(sale, payments_data, user=None):
+    """
+    Build unsaved Payment rows for a new sale and the resulting totals.
+
+    Only up to the sale total is recorded as payment; any excess is change
+    and is not stored. Returns ``(payments, amount_paid, has_credit)`` where
+    ``amount_paid`` excludes credit, which is not money at hand.
+    """
+    payments = []
+    amount_paid = Decimal('0')
+    has_credit = False
+    total_to_record = sale.total_amount
+    for payment_data in payments_data:
+        if total_to_record <= 0:
+            break
+        payment_data = dict(payment_data)
+        # Automatically assign the same terminal as the sale if not provided
+        if not payment_data.get('terminal'):
+            payment_data['terminal'] = sale.terminal
+        if user is not None:
+            payment_data['created_by'] = user
+        payment_amount = min(payment_data['amount'], total_to_record)
+        payment_data['amount'] = payment_amount
+        payments.append(Payment(sale=sale, **payment_data))
+        total_to_record -= payment_amount
+        if payment_data['payment_method'] == 'credit':
+            has_credit = True
+        else:
+            amount_paid += payment_amount
+    return payments, amount_paid, has_credit
+
+
+def write_sales(entries, locked_products, user=None):
+    """
+    Insert sales with their items, stock movements and payments in bulk,
+    and add them to the daily sales rollup.
+
+    ``entries`` are ``(sale_data, items_data, payments_data)`` tuples whose
+    stock has already been checked against ``locked_products``. Must run
+    inside the transaction that locked them. The number of queries does not
+    depend on how many sales or lines are written.
+    """
+    sales = []
+    sale_payments = []
+    for (sale_data, items_data, payments_data), order_number in zip(
+        entries, allocate_order_numbers(len(entries))
+    ):
+        sale = Sale(order_number=order_number, **sale_data)
+        payments, amount_paid, has_credit = build_payments(sale, payments_data, user)
+        if payments:
+            # Totals are known before the insert, so the sale row is written once
+            sale.amount_paid = amount_paid
+            sale.status = Sale.payment_status(amount_paid, sale.total_amount, has_credit)
+        sales.append(sale)
+        sale_payments.append(payments)
+    Sale.objects.bulk_create(sales)
+
+    sale_items = [
+        [
+            SaleItem(
+                sale=sale,
+                product=item['product'],
+                quantity=item['quantity'],
+                unit_price=item['unit_price'],
+                unit_cost=item['product'].cost_price,
+            )
+            for item in items_data
+        ]
+        for sale, (_, items_data, _) in zip(sales, entries)
+    ]
+    SaleItem.objects.bulk_create([item for items in sale_items for item in items])
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            product=item.product,
+            movement_type='out',
+            quantity=item.quantity,
+            reason='sale',
+            notes=f'Sale #{sale.id}',
+            unit_price=item.unit_price,
+            unit_cost=item.unit_cost,
+            sale_item=item,
+            created_by=sale.created_by,
+        )
+        for sale, items in zip(sales, sale_items)
+        for item in items
+    ])
+    decrement_stock(
+        quantities_by_product(item for _, items_data, _ in entries for item in items_data),
+        locked_products
+    )
+    record_lines(
+        sale_line(
+            timezone.localdate(sale.created_at), item.product, sale.terminal_id,
+            sale.created_by_id, item.quantity, item.unit_price, item.unit_cost
+        )
+        for sale, items in zip(sales, sale_items)
+        for item in items
+    )
+    Payment.objects.bulk_create([payment for payments in sale_payments for payment in payments])
+
+    # Serve responses from what was just written instead of re-querying
+    for sale, items, payments in zip(sales, sale_items, sale_payments):
+        sale._prefetched_objects_cache = {'items': items, 'payments': payments}
+    return sales
+
+
+def checkout(sale_data, items_data, payments_data=(), user=None):
+    """
+    Create a sale with its items, stock movements and payments.
+
+    ``items_data`` are validated SaleItemSerializer dicts whose ``product``
+    is already resolved. The whole write runs in one transaction and issues
+    the same number of queries for a one-line and a two-hundred-line basket.
+    """
+    quantities = quantities_by_product(items_data)
+
+    with transaction.atomic():
+        locked = lock_products(list(quantities))
+        check_stock(locked, quantities)
+        [sale] = write_sales([(sale_data, items_data, payments_data)], locked, user)
+    return sale
+
+
+def checkout_many(entries, user=None):
+    """
+    Create several sales in one transaction, skipping those that lack stock.
+
+    Returns one ``(sale, error)`` pair per entry: ``sale`` is None when the
+    entry was rejected and ``error`` says why. Stock is checked sale by sale
+    against what the earlier sales of the batch left.
+    """
+    quantities = quantities_by_product(
+        item for _, items_data, _ in entries for item in items_data
+    )
+    results = []
+    with transaction.atomic():
+        locked = lock_products(list(quantities))
+        remaining = {product_id: product.quantity for product_id, product in locked.items()}
+        accepted = []
+        for entry in entries:
+            sale_quantities = quantities_by_product(entry[1])
+            try:
+                check_stock(locked, sale_quantities, remaining)
+            except serializers.ValidationError as e:
+                results.append([None, e.detail])
+                continue
+            for product_id, quantity in sale_quantities.items():
+                remaining[product_id] -= quantity
+            result = [None, None]
+            results.append(result)
+            accepted.append((entry, result))
+
+        sales = write_sales([entry for entry, _ in accepted], locked, user)
+        for sale, (_, result) in zip(sales, accepted):
+            result[0] = sale
+    return [tuple(result) for result in results]
@@ -0,0 +1,278 @@
+"""
+Statistics of closed business periods, computed once and kept.
+
+A day, month or year that ended before today (in TIME_ZONE) gets no new
+sales or payments, so its figures are stored in ClosedPeriodStats the
+first time they are asked for and read from there afterwards. A date range
+is covered by the largest closed periods that fit (whole years, then whole
+months, then days); only today is computed live and added on top.
+
+Closed periods change only when history is edited: rebuilding the sales
+rollup for a range, or saving or deleting a past payment, deletes the
+stored periods that contain it. Renaming a customer, cashier or terminal
+does not update cash reports already stored.
+"""
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncYear
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .fast_serializers import serialize_queryset
+from .models import ClosedPeriodStats, DailySalesRollup, Payment
+from .serializers import PaymentSerializer
+
+# Seconds clients may reuse figures of closed periods without revalidating.
+# Edits to history invalidate stored periods, so this stays short.
+CLOSED_MAX_AGE = 5 * 60
+
+_TRUNC = {'sales_month': TruncMonth, 'sales_year': TruncYear}
+_CENT = Decimal('0.01')
+
+
+def period_start(kind, day):
+    """First day of the period of ``kind`` that contains ``day``"""
+    if kind == 'sales_year':
+        return day.replace(month=1, day=1)
+    if kind == 'sales_month':
+        return day.replace(day=1)
+    return day
+
+
+def period_end(kind, start):
+    """Last day of the period of ``kind`` starting on ``start``"""
+    if kind == 'sales_year':
+        return start.replace(month=12, day=31)
+    if kind == 'sales_month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return start
+
+
+def is_closed(end_date):
+    """Whether every day up to end_date is over"""
+    return end_date < timezone.localdate()
+
+
+def etag_for(data):
+    return hashlib.sha256(json.dumps(data, cls=JSONEncoder, sort_keys=True).encode()).hexdigest()
+
+
+def _pieces(start, end):
+    """The largest sales periods, in order, that exactly cover start..end"""
+    pieces = []
+    day = start
+    while day <= end:
+        for kind in ('sales_year', 'sales_month', 'sales_day'):
+            if period_start(kind, day) == day and period_end(kind, day) <= end:
+                break
+        pieces.append((kind, day))
+        day = period_end(kind, day) + timedelta(days=1)
+    return pieces
+
+
+def _stored(pieces, materialize):
+    """Stored rows by (kind, start), computing and storing missing ones"""
+    if not pieces:
+        return {}
+    rows = {
+        (row.kind, row.period_start): row
+        for row in ClosedPeriodStats.objects.filter(
+            kind__in={kind for kind, _ in pieces},
+            period_start__in={start for _, start in pieces},
+        )
+    }
+    missing = [piece for piece in pieces if piece not in rows]
+    if missing:
+        if not is_closed(max(period_end(kind, start) for kind, start in missing)):
+            raise ValueError('Only closed periods can be stored')
+        created = [
+            ClosedPeriodStats(kind=kind, period_start=start, data=data, etag=etag_for(data))
+            for (kind, start), data in materialize(missing).items()
+        ]
+        # A concurrent request may store the same periods; either copy will do
+        ClosedPeriodStats.objects.bulk_create(created, ignore_conflicts=True)
+        rows.update({(row.kind, row.period_start): row for row in created})
+    return rows
+
+
+def _sales_data(totals):
+    return {
+        'total_sales': str((totals.get('total_sales') or Decimal('0')).quantize(_CENT)),
+        'total_cost': str((totals.get('total_cost') or Decimal('0')).quantize(_CENT)),
+        'items_sold': totals.get('items_sold') or 0,
+    }
+
+
+def _materialize_sales(pieces):
+    starts_by_kind = defaultdict(list)
+    for kind, start in pieces:
+        starts_by_kind[kind].append(start)
+    data = {}
+    for kind, starts in starts_by_kind.items():
+        period = _TRUNC[kind]('date') if kind in _TRUNC else F('date')
+        totals = {
+            row['period']: row
+            for row in DailySalesRollup.objects.filter(
+                date__range=[min(starts), period_end(kind, max(starts))]
+            ).annotate(period=period).filter(period__in=starts).values('period').annotate(
+                total_sales=Sum('revenue'),
+                total_cost=Sum('cost'),
+                items_sold=Sum('quantity'),
+            ).order_by()
+        }
+        for start in starts:
+            data[(kind, start)] = _sales_data(totals.get(start, {}))
+    return data
+
+
+def _live_sales(day):
+    return _sales_data(DailySalesRollup.objects.filter(date=day).aggregate(
+        total_sales=Sum('revenue'),
+        total_cost=Sum('cost'),
+        items_sold=Sum('quantity'),
+    ))
+
+
+def sales_by_period(start, end, kind):
+    """
+    Sales, cost and units sold from start to end per calendar period of
+    ``kind`` ('sales_month' or 'sales_year'), as ``(period_start, totals)``
+    pairs, plus the ETag of the figures and whether they are all closed
+    """
+    today = timezone.localdate()
+    end = min(end, today)
+    groups = []
+    day = start
+    while day <= end:
+        group_start = period_start(kind, day)
+        group_end = min(period_end(kind, group_start), end)
+        groups.append((group_start, day, group_end))
+        day = group_end + timedelta(days=1)
+
+    pieces = {
+        group_start: _pieces(first, min(last, today - timedelta(days=1)))
+        for group_start, first, last in groups
+    }
+    stored = _stored([piece for group in pieces.values() for piece in group], _materialize_sales)
+    live = _live_sales(today) if end == today else None
+
+    periods = []
+    etags = []
+    for group_start, first, last in groups:
+        parts = [stored[piece].data for piece in pieces[group_start]]
+        etags += [stored[piece].etag for piece in pieces[group_start]]
+        if last == today:
+            parts.append(live)
+            etags.append(etag_for(live))
+        periods.append((group_start, {
+            'total_sales': sum((Decimal(part['total_sales']) for part in parts), Decimal('0')),
+            'total_cost': sum((Decimal(part['total_cost']) for part in parts), Decimal('0')),
+            'items_sold': sum(part['items_sold'] for part in parts),
+        }))
+    return periods, etag_for(etags), live is None
+
+
+def _day_bounds(days):
+    return (
+        timezone.make_aware(datetime.combine(min(days), time.min)),
+        timezone.make_aware(datetime.combine(max(days) + timedelta(days=1), time.min)),
+    )
+
+
+def _cash_data(payments):
+    """Cash report figures of one day from its serialized payments"""
+    summary = defaultdict(lambda: {'total_amount': Decimal('0'), 'count': 0})
+    for payment in payments:
+        entry = summary[payment['payment_method']]
+        entry['total_amount'] += Decimal(payment['amount'])
+        entry['count'] += 1
+    return {
+        'summary': [
+            {'payment_method': method, 'total_amount': str(entry['total_amount']), 'count': entry['count']}
+            for method, entry in sorted(summary.items())
+        ],
+        'payments': payments,
+    }
+
+
+def _payments(days):
+    """Serialized payments of some days, newest first, by local day"""
+    lower, upper = _day_bounds(days)
+    payments = Payment.objects.filter(
+        created_at__gte=lower, created_at__lt=upper
+    ).annotate(day=TruncDate('created_at')).filter(day__in=days)
+    by_day = defaultdict(list)
+    for payment in serialize_queryset(PaymentSerializer, payments):
+        by_day[timezone.localdate(parse_datetime(payment['created_at']))].append(payment)
+    return by_day
+
+
+def _materialize_cash(pieces):
+    by_day = _payments([start for _, start in pieces])
+    return {piece: _cash_data(by_day.get(piece[1], [])) for piece in pieces}
+
+
+def cash_report(start, end):
+    """
+    Payment summary per method and the payments themselves (newest first)
+    from start to end, plus the ETag of the figures and whether they are
+    all closed
+    """
+    today = timezone.localdate()
+    closed_days = []
+    day = min(end, today - timedelta(days=1))
+    while day >= start:
+        closed_days.append(day)
+        day -= timedelta(days=1)
+    stored = _stored([('cash_day', day) for day in closed_days], _materialize_cash)
+    days = [stored[('cash_day', day)].data for day in closed_days]
+    etags = [stored[('cash_day', day)].etag for day in closed_days]
+    if start <= today <= end:
+        live = _cash_data(_payments([today]).get(today, []))
+        days.insert(0, live)
+        etags.insert(0, etag_for(live))
+
+    summary = defaultdict(lambda: {'total_amount': Decimal('0'), 'count': 0})
+    for data in days:
+        for entry in data['summary']:
+            summary[entry['payment_method']]['total_amount'] += Decimal(entry['total_amount'])
+            summary[entry['payment_method']]['count'] += entry['count']
+    return {
+        'summary': [
+            {'payment_method': method, 'total_amount': entry['total_amount'], 'count': entry['count']}
+            for method, entry in sorted(summary.items())
+        ],
+        'payments': [payment for data in days for payment in data['payments']],
+    }, etag_for(etags), is_closed(end)
+
+
+def invalidate_sales(start_date, end_date):
+    """Forget stored sales periods that contain any day from start_date to end_date"""
+    ClosedPeriodStats.objects.filter(
+        Q(kind='sales_day', period_start__range=[start_date, end_date])
+        | Q(kind='sales_month', period_start__range=[period_start('sales_month', start_date), end_date])
+        | Q(kind='sales_year', period_start__range=[period_start('sales_year', start_date), end_date])
+    ).delete()
+
+
+def invalidate_cash(start_date, end_date):
+    """Forget stored cash reports of the days from start_date to end_date"""
+    ClosedPeriodStats.objects.filter(kind='cash_day', period_start__range=[start_date, end_date]).delete()
+
+
+def _payment_changed(sender, instance, **kwargs):
+    day = timezone.localdate(instance.created_at)
+    if is_closed(day):
+        invalidate_cash(day, day)
+
+
+def connect_signals():
+    post_save.connect(_payment_changed, sender=Payment, dispatch_uid='closed_periods_Payment_save')
+    post_delete.connect(_payment_changed, sender=Payment, dispatch_uid='closed_periods_Payment_delete')
@@ -0,0 +1,410 @@
+"""
+Columnar store of sale lines for the analytics group-bys.
+
+Every sale line (SaleItem, or stock-out movement with reason 'sale' and
+no sale item, as in rollups.py) is one row of a set of flat binary
+columns under COLUMNAR_DIR: business day (days since 1970-01-01 in
+TIME_ZONE), product, category, terminal and cashier ids, units, and
+revenue and cost in integer cents. Workers map the columns read-only with
+``numpy.memmap`` and group-by queries are vectorized NumPy over them, so a
+multi-year report is a few milliseconds of array arithmetic instead of a
+grouped SQL query and thousands of Decimal objects.
+
+Requests only map the store meta.json points to, which may be behind
+the database but is always a complete store; with no store yet, the
+group-bys sum the daily sales rollup instead. ``sync`` brings the store
+up to date and is run by the ``sync_columnar`` command next to the web
+server and by the report worker before sales reports, never in a
+request. A store that is current costs three index lookups and no lock;
+otherwise lines with ids above the last ones stored are appended, under
+an ``fcntl`` lock shared by all processes on the host. The store is
+rewritten from scratch when:
+
+- the sales rollup was rebuilt (which is how edits and deletions of sale
+  lines are applied, see rollups.py), bumping the 'columnar' version in
+  the database (see versions.py);
+- the lines stored no longer match the database (a line committed after
+  lines with higher ids were appended, or lines were deleted), which is
+  checked at most every COLUMNAR_VERIFY_INTERVAL seconds;
+- it is older than COLUMNAR_MAX_AGE seconds. Rows take the product's
+  category when they are stored, so this bounds how long they keep a
+  former one.
+
+Rewrites go to a new directory that meta.json is then switched to, so
+readers never see a half-written store.
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+from . import versions
+from .models import DailySalesRollup, SaleItem, StockMovement
+
+GENERATION = 'columnar'
+
+COLUMNS = {
+    'date': np.int32,
+    'product': np.int32,
+    'category': np.int32,
+    'terminal': np.int32,
+    'user': np.int32,
+    'quantity': np.int64,
+    'revenue': np.int64,
+    'cost': np.int64,
+}
+DIMENSIONS = ('date', 'product', 'category', 'terminal', 'user')
+MEASURES = ('quantity', 'revenue', 'cost')
+
+# Lines read from the database per round trip
+_CHUNK = 10000
+_EPOCH = date(1970, 1, 1).toordinal()
+# np.bincount sums in float64, which is exact for integers below this
+_EXACT = 2 ** 53
+_CENT = Decimal('0.01')
+
+_lock = threading.Lock()
+_mapped = {'key': None, 'arrays': None}
+
+
+def _path(*parts):
+    return os.path.join(settings.COLUMNAR_DIR, *parts)
+
+
+def _read_meta():
+    try:
+        with open(_path('meta.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(meta):
+    tmp = _path(f'meta.json.{os.getpid()}')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _path('meta.json'))
+
+
+def _cents(amount):
+    return int(amount * 100)
+
+
+def _line_rows(rows):
+    """
+    Column arrays of some (day, product, category, terminal, user,
+    quantity, price, cost) rows
+    """
+    days, products, categories, terminals, users, quantities, prices, costs = zip(*rows)
+    quantity = np.array(quantities, dtype=np.int64)
+    columns = {
+        'date': np.array([day.toordinal() - _EPOCH for day in days], dtype=np.int32),
+        'product': np.array(products, dtype=np.int32),
+        'category': np.array(categories, dtype=np.int32),
+        'terminal': np.array(terminals, dtype=np.int32),
+        'user': np.array(users, dtype=np.int32),
+        'quantity': quantity,
+        'revenue': quantity * np.array([_cents(price) for price in prices], dtype=np.int64),
+        'cost': quantity * np.array([_cents(cost) for cost in costs], dtype=np.int64),
+    }
+    return columns
+
+
+def _items(after_id, last_id):
+    return SaleItem.objects.filter(id__gt=after_id, id__lte=last_id).values_list(
+        TruncDate('sale__created_at'), 'product_id',
+        Coalesce('product__category_id', Value(0)),
+        Coalesce('sale__terminal_id', Value(0)),
+        Coalesce('sale__created_by_id', Value(0)),
+        'quantity', 'unit_price', 'unit_cost',
+    ).order_by('id')
+
+
+def _movements():
+    # The movements rollups.is_rollup_movement counts as sale lines
+    return StockMovement.objects.filter(movement_type='out', reason='sale', sale_item__isnull=True)
+
+
+def _movement_lines(after_id, last_id):
+    return _movements().filter(id__gt=after_id, id__lte=last_id).values_list(
+        TruncDate('created_at'), 'product_id',
+        Coalesce('product__category_id', Value(0)),
+        Value(0),
+        Coalesce('created_by_id', Value(0)),
+        'quantity', 'unit_price', 'unit_cost',
+    ).order_by('id')
+
+
+def _newest(model, after_id):
+    """Highest id of ``model`` above after_id, or None; a primary key range probe"""
+    return model.objects.filter(id__gt=after_id).aggregate(newest=Max('id'))['newest']
+
+
+def _append(segment, rows, lines):
+    """Append lines to the column files after their first ``rows`` rows; returns the new row count"""
+    iterator = lines.iterator(chunk_size=_CHUNK)
+    while True:
+        chunk = [line for _, line in zip(range(_CHUNK), iterator)]
+        if not chunk:
+            return rows
+        columns = _line_rows(chunk)
+        for name, values in columns.items():
+            with open(_path(segment, f'{name}.bin'), 'r+b') as f:
+                # Drops what an interrupted append left past the stored rows
+                f.truncate(rows * values.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        rows += len(chunk)
+
+
+def _extend(meta):
+    """
+    Append the lines added since ``meta`` was written and return the meta
+    data describing the result. The last ids are the highest of all sale
+    items and stock movements seen, sale lines or not.
+    """
+    rows, item_rows = meta['rows'], meta['item_rows']
+    last_item = _newest(SaleItem, meta['last_item_id'])
+    if last_item is not None:
+        rows = _append(meta['segment'], rows, _items(meta['last_item_id'], last_item))
+        item_rows += rows - meta['rows']
+    last_movement = _newest(StockMovement, meta['last_movement_id'])
+    if last_movement is not None:
+        rows = _append(meta['segment'], rows, _movement_lines(meta['last_movement_id'], last_movement))
+    return dict(
+        meta, rows=rows, item_rows=item_rows, movement_rows=rows - item_rows,
+        last_item_id=last_item or meta['last_item_id'],
+        last_movement_id=last_movement or meta['last_movement_id'],
+    )
+
+
+def _rebuild(generation):
+    segment = f'{time.time_ns()}-{os.getpid()}'
+    os.makedirs(_path(segment))
+    for name in COLUMNS:
+        open(_path(segment, f'{name}.bin'), 'wb').close()
+    now = time.time()
+    meta = _extend({
+        'segment': segment,
+        'rows': 0,
+        'item_rows': 0,
+        'movement_rows': 0,
+        'last_item_id': 0,
+        'last_movement_id': 0,
+        'generation': generation,
+        'built_at': now,
+        'verified_at': now,
+    })
+    _write_meta(meta)
+    for name in os.listdir(settings.COLUMNAR_DIR):
+        if name != segment and os.path.isdir(_path(name)):
+            # Workers that still map the old files keep them until they remap
+            shutil.rmtree(_path(name), ignore_errors=True)
+    return meta
+
+
+def _update(meta):
+    """Append new lines, or None if the stored lines no longer match the database"""
+    extended = _extend(meta)
+    if time.time() - meta['verified_at'] > settings.COLUMNAR_VERIFY_INTERVAL:
+        if (
+            SaleItem.objects.filter(id__lte=extended['last_item_id']).count() != extended['item_rows']
+            or _movements().filter(id__lte=extended['last_movement_id']).count() != extended['movement_rows']
+        ):
+            return None
+        extended['verified_at'] = time.time()
+    if extended != meta:
+        _write_meta(extended)
+    return extended
+
+
+def _stale(meta, generation):
+    return (
+        meta is None
+        or meta['generation'] != generation
+        or time.time() - meta['built_at'] > settings.COLUMNAR_MAX_AGE
+    )
+
+
+def _current(meta, generation):
+    """Whether the store ``meta`` describes needs neither writing nor verifying"""
+    return (
+        not _stale(meta, generation)
+        and time.time() - meta['verified_at'] <= settings.COLUMNAR_VERIFY_INTERVAL
+        and _newest(SaleItem, meta['last_item_id']) is None
+        and _newest(StockMovement, meta['last_movement_id']) is None
+    )
+
+
+def sync(rebuild=False):
+    """Bring the store up to date with the database and return its meta data"""
+    os.makedirs(settings.COLUMNAR_DIR, exist_ok=True)
+    generation = versions.get(GENERATION)
+    # meta.json is replaced atomically, so it can be read without the lock
+    meta = _read_meta()
+    if not rebuild and _current(meta, generation):
+        return meta
+    with open(_path('lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Another worker may have written the store while this one waited
+            meta = _read_meta()
+            if rebuild or _stale(meta, generation):
+                return _rebuild(generation)
+            return _update(meta) or _rebuild(generation)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _map(meta):
+    key = (meta['segment'], meta['rows'])
+    with _lock:
+        if _mapped['key'] != key:
+            _mapped['arrays'] = {
+                # Plain arrays over the mapping index faster than np.memmap ones
+                name: (
+                    np.asarray(np.memmap(_path(meta['segment'], f'{name}.bin'), dtype=dtype, mode='r', shape=(meta['rows'],)))
+                    if meta['rows'] else np.empty(0, dtype=dtype)
+                )
+                for name, dtype in COLUMNS.items()
+            }
+            _mapped['key'] = key
+        return _mapped['arrays']
+
+
+def facts():
+    """
+    Every sale line as read-only arrays by column name, as of the last
+    sync, or None if there is no store yet
+    """
+    meta = _read_meta()
+    if meta is None:
+        return None
+    try:
+        return _map(meta)
+    except FileNotFoundError:
+        # A sync rewrote the store since meta.json was read
+        meta = _read_meta()
+        return _map(meta) if meta else None
+
+
+def _selection(arrays, start_date, end_date):
+    dates = arrays['date']
+    return (dates >= start_date.toordinal() - _EPOCH) & (dates <= end_date.toordinal() - _EPOCH)
+
+
+def _money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def _rollup(start_date, end_date):
+    # The same sale lines, summed per day in the database (see rollups.py)
+    return DailySalesRollup.objects.filter(date__range=[start_date, end_date])
+
+
+def _rollup_sums(row):
+    return {
+        'quantity': row['quantity'] or 0,
+        'revenue': (row['revenue'] or Decimal(0)).quantize(_CENT),
+        'cost': (row['cost'] or Decimal(0)).quantize(_CENT),
+    }
+
+
+def totals(start_date, end_date):
+    """Units, revenue and cost of the sale lines from start_date to end_date"""
+    arrays = facts()
+    if arrays is None:
+        return _rollup_sums(_rollup(start_date, end_date).aggregate(
+            quantity=Sum('quantity'), revenue=Sum('revenue'), cost=Sum('cost')
+        ))
+    selected = _selection(arrays, start_date, end_date)
+    return {
+        'quantity': int(arrays['quantity'][selected].sum()),
+        'revenue': _money(arrays['revenue'][selected].sum()),
+        'cost': _money(arrays['cost'][selected].sum()),
+    }
+
+
+def group_by(dimension, start_date, end_date):
+    """
+    Units, revenue and cost of the sale lines from start_date to end_date
+    per value of ``dimension`` (a date for 'date', else an id, 0 for none),
+    in order of that value
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f'Unknown dimension {dimension!r}')
+    arrays = facts()
+    if arrays is None:
+        field = 'date' if dimension == 'date' else f'{dimension}_id'
+        return [
+            {'key': row[field], **_rollup_sums(row)}
+            for row in _rollup(start_date, end_date).values(field).annotate(
+                quantity=Sum('quantity'), revenue=Sum('revenue'), cost=Sum('cost')
+            ).order_by(field)
+        ]
+    selected = _selection(arrays, start_date, end_date)
+    keys = arrays[dimension][selected].astype(np.int64)
+    if not len(keys):
+        return []
+    # Ids and days are dense small numbers, so every key gets a slot
+    lowest = keys.min()
+    keys -= lowest
+    present = np.flatnonzero(np.bincount(keys))
+    sums = {}
+    for name in MEASURES:
+        values = arrays[name][selected]
+        if np.abs(values).sum() < _EXACT:
+            sums[name] = np.rint(np.bincount(keys, weights=values)[present]).astype(np.int64)
+        else:
+            totals = np.zeros(present[-1] + 1, dtype=np.int64)
+            np.add.at(totals, keys, values)
+            sums[name] = totals[present]
+    values = present + lowest
+    return [
+        {
+            'key': date.fromordinal(int(value) + _EPOCH) if dimension == 'date' else int(value),
+            'quantity': int(quantity),
+            'revenue': _money(revenue),
+            'cost': _money(cost),
+        }
+        for value, quantity, revenue, cost in zip(values, sums['quantity'], sums['revenue'], sums['cost'])
+    ]
+
+
+def group_by_name(dimension, model, start_date, end_date):
+    """
+    ``group_by`` per name of the ``model`` instances ``dimension`` holds ids
+    of (None for none or deleted ones), most revenue first. Instances with
+    the same name are counted together, as when grouped by name in SQL.
+    """
+    rows = group_by(dimension, start_date, end_date)
+    names = dict(model.objects.filter(pk__in=[row['key'] for row in rows]).values_list('pk', 'name'))
+    by_name = {}
+    for row in rows:
+        name = names.get(row['key'])
+        total = by_name.setdefault(name, {'key': name, 'quantity': 0, 'revenue': Decimal('0.00'), 'cost': Decimal('0.00')})
+        for measure in MEASURES:
+            total[measure] += row[measure]
+    return sorted(by_name.values(), key=lambda row: row['revenue'], reverse=True)
+
+
+def invalidate():
+    """Have the store rewritten from scratch by the next sync"""
+    versions.bump(GENERATION)
+
+
+def invalidate_on_commit():
+    versions.bump_on_commit(GENERATION)
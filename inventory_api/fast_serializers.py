@@ -0,0 +1,236 @@
+"""
+Compiled, values()-based rendering for read-only lists.
+
+Rendering a big list through a ModelSerializer builds a model instance per
+row and walks every field's get_attribute/to_representation. For flat
+serializers that is unnecessary: ``compile_serializer`` turns the field
+list into one ``values_list()`` projection and generates a function that
+maps each result tuple straight to the output dict.
+
+The output is identical to the serializer's: fields keep their order,
+values go through the same field's ``to_representation`` (skipped only
+where it is the identity for what the database returns), missing related
+objects follow DRF's null/default/skip rules, and method fields run the
+serializer's own ``get_<name>`` against a lightweight stand-in object
+built from the columns listed in ``Meta.field_sources``.
+
+Serializers with nested serializers, hyperlinks or method fields without
+``field_sources`` do not compile; callers fall back to the serializer.
+"""
+import threading
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.response import Response
+
+# Fields whose to_representation returns database values unchanged
+_IDENTITY_FIELDS = (
+    serializers.IntegerField,
+    serializers.CharField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+)
+
+
+class _Row:
+    """Attribute bag standing in for a model instance in method fields"""
+
+
+class CannotCompile(Exception):
+    pass
+
+
+class CompiledSerializer:
+    def __init__(self, lookups, row):
+        self.lookups = lookups
+        self.row = row
+
+    def serialize(self, queryset):
+        row = self.row
+        return [row(values) for values in queryset.prefetch_related(None).values_list(*self.lookups)]
+
+
+class _Compiler:
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.model = serializer.Meta.model
+        self.lookups = []
+        self.positions = {}
+        self.namespace = {'_Row': _Row}
+        self.lines = []
+
+    def column(self, lookup):
+        """Position of ``lookup`` in the values_list tuple"""
+        if lookup not in self.positions:
+            self.positions[lookup] = len(self.lookups)
+            self.lookups.append(lookup)
+        return self.positions[lookup]
+
+    def resolve(self, path):
+        """
+        Split a dotted source into its nullable relations and final column.
+
+        Returns ``(relations, lookup)`` where ``relations`` are the lookups
+        of every relation crossed, to test for a missing related object.
+        """
+        opts = self.model._meta
+        segments = path.split('.')
+        chain = []
+        relations = []
+        for index, segment in enumerate(segments):
+            try:
+                field = opts.get_field(segment)
+            except FieldDoesNotExist:
+                raise CannotCompile(f'{path} is not a model field')
+            if field.many_to_many or field.one_to_many or not field.concrete:
+                raise CannotCompile(f'{path} crosses a to-many relation')
+            chain.append(segment)
+            if index < len(segments) - 1:
+                if not field.is_relation:
+                    raise CannotCompile(f'{path} reads through a non-relation')
+                relations.append('__'.join(chain))
+                opts = field.related_model._meta
+        return relations, '__'.join(chain)
+
+    def converter(self, name, field):
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+            return None
+        if isinstance(field, serializers.RelatedField):
+            raise CannotCompile(f'{name} is a {type(field).__name__}')
+        if isinstance(field, serializers.ChoiceField) and not all(
+            isinstance(choice, str) for choice in field.choices
+        ):
+            self.namespace[f'_c_{name}'] = field.to_representation
+            return f'_c_{name}'
+        if isinstance(field, _IDENTITY_FIELDS):
+            return None
+        self.namespace[f'_c_{name}'] = field.to_representation
+        return f'_c_{name}'
+
+    def add_field(self, name, field):
+        if isinstance(field, serializers.SerializerMethodField):
+            self.add_method_field(name, field)
+            return
+        if isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField)):
+            raise CannotCompile(f'{name} is nested')
+        if field.source == '*':
+            raise CannotCompile(f'{name} reads the whole object')
+
+        relations, lookup = self.resolve(field.source)
+        position = self.column(lookup)
+        convert = self.converter(name, field)
+        value = f'v[{position}]' if convert is None else f'(None if v[{position}] is None else {convert}(v[{position}]))'
+
+        if not relations:
+            self.lines.append(f'    d[{name!r}] = {value}')
+            return
+        # A missing related object: DRF's get_attribute falls back to the
+        # default, then null, then leaves the field out
+        missing = ' or '.join(f'v[{self.column(relation)}] is None' for relation in relations)
+        self.lines.append(f'    if {missing}:')
+        if field.default is not empty:
+            self.namespace[f'_d_{name}'] = field.get_default
+            self.lines.append(f'        d[{name!r}] = _d_{name}()')
+        elif field.allow_null:
+            self.lines.append(f'        d[{name!r}] = None')
+        elif not field.required:
+            self.lines.append('        pass')
+        else:
+            raise CannotCompile(f'{name} has no fallback for a missing {relations[-1]}')
+        self.lines.append('    else:')
+        self.lines.append(f'        d[{name!r}] = {value}')
+
+    def add_method_field(self, name, field):
+        paths = getattr(self.serializer.Meta, 'field_sources', {}).get(name)
+        if paths is None:
+            raise CannotCompile(f'{name} has no Meta.field_sources')
+
+        # Build the stand-in object: nested attribute bags for relations,
+        # None where the related object is missing
+        tree = {}
+        for path in paths:
+            relations, lookup = self.resolve(path)
+            node = tree
+            for relation in relations:
+                node = node.setdefault(relation.rsplit('__', 1)[-1], (relation, {}))[1]
+            node[lookup.rsplit('__', 1)[-1]] = (lookup, None)
+
+        self.lines.append('    o = _Row()')
+        self._build('o', tree, '    ')
+        self.namespace[f'_m_{name}'] = getattr(self.serializer, field.method_name)
+        self.lines.append(f'    d[{name!r}] = _m_{name}(o)')
+
+    def _build(self, target, tree, indent):
+        for attribute, (lookup, subtree) in tree.items():
+            position = self.column(lookup)
+            if subtree is None:
+                self.lines.append(f'{indent}{target}.{attribute} = v[{position}]')
+                continue
+            child = f'{target}_{attribute}'
+            self.lines.append(f'{indent}if v[{position}] is None:')
+            self.lines.append(f'{indent}    {target}.{attribute} = None')
+            self.lines.append(f'{indent}else:')
+            self.lines.append(f'{indent}    {child} = {target}.{attribute} = _Row()')
+            self._build(child, subtree, indent + '    ')
+
+    def compile(self, field_names):
+        fields = self.serializer.fields
+        self.lines.append('def row(v):')
+        self.lines.append('    d = {}')
+        for name in field_names:
+            field = fields[name]
+            if not field.write_only:
+                self.add_field(name, field)
+        self.lines.append('    return d')
+        exec('\n'.join(self.lines), self.namespace)
+        return CompiledSerializer(tuple(self.lookups), self.namespace['row'])
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_serializer(serializer_class, field_names=None):
+    """
+    Compile ``serializer_class`` (limited to ``field_names``, in the
+    serializer's field order) or return None if it cannot be compiled
+    """
+    # A context-free instance: compiled rows are shared across requests
+    serializer = serializer_class(context={})
+    names = tuple(
+        name for name in serializer.fields
+        if field_names is None or name in field_names
+    )
+    key = (serializer_class, names)
+    if key in _compiled:
+        return _compiled[key]
+    try:
+        compiled = _Compiler(serializer).compile(names)
+    except CannotCompile:
+        compiled = None
+    with _compiled_lock:
+        _compiled[key] = compiled
+    return compiled
+
+
+def serialize_queryset(serializer_class, queryset, field_names=None):
+    """Render ``queryset`` like ``serializer_class(queryset, many=True).data``"""
+    compiled = compile_serializer(serializer_class, field_names)
+    if compiled is None:
+        return serializer_class(queryset, many=True).data
+    return compiled.serialize(queryset)
+
+
+class FastListMixin:
+    """Viewset mixin that renders unpaginated lists through a compiled serializer"""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        fields = list(self.get_serializer().fields)
+        return Response(serialize_queryset(self.get_serializer_class(), queryset, fields))
@@ -0,0 +1,114 @@
+"""
+Demand forecasts for the whole catalog at once.
+
+A product's forecast is the mean quantity moved per day over its last
+WINDOW days with stock movements in the past HISTORY_DAYS days, rounded
+down (the moving average DemandForecastView used to compute per request);
+with fewer such days it is 0, and with none there is no forecast.
+
+``forecast`` reads the movements of all the products in one grouped query,
+pivots them into a product x day NumPy matrix and computes every forecast
+with array operations, then upserts them into DemandForecast. The
+``forecast_demand`` command refreshes the whole catalog (run it daily);
+the single-product endpoint reads the stored forecast and recomputes only
+one older than FORECAST_MAX_AGE seconds.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DemandForecast, Product, StockMovement
+
+HISTORY_DAYS = 90
+WINDOW = 7
+# Placeholder until forecasts are scored against what was sold
+CONFIDENCE = 0.7
+RESTOCK_AFTER = timedelta(days=7)
+
+_UPSERT_BATCH = 1000
+
+
+def _matrix(product_ids, since, catalog):
+    """
+    Quantities moved, and whether anything was moved, per product (rows in
+    ``product_ids`` order) and local day from ``since`` to today. With
+    ``catalog`` the ids are all products and are not sent to the database.
+    """
+    first_day = timezone.localdate(since)
+    shape = (len(product_ids), (timezone.localdate() - first_day).days + 1)
+    quantities = np.zeros(shape, dtype=np.int64)
+    moved = np.zeros(shape, dtype=bool)
+
+    movements = StockMovement.objects.filter(created_at__gte=since)
+    if not catalog:
+        movements = movements.filter(product_id__in=product_ids.tolist())
+    rows = list(movements.values_list('product_id', TruncDate('created_at')).annotate(
+        quantity=Sum('quantity'), count=Count('id')
+    ).order_by())
+    if not rows:
+        return quantities, moved
+
+    products, days, sums, _ = zip(*rows)
+    products = np.array(products, dtype=np.int64)
+    rows_index = np.searchsorted(product_ids, products).clip(max=len(product_ids) - 1)
+    # Products created since product_ids was read are left out
+    known = product_ids[rows_index] == products
+    days_index = np.array([(day - first_day).days for day in days], dtype=np.int64)
+    quantities[rows_index[known], days_index[known]] = np.array(sums, dtype=np.int64)[known]
+    moved[rows_index[known], days_index[known]] = True
+    return quantities, moved
+
+
+def forecast(product_ids=None):
+    """
+    Compute and store the forecasts of some products (all by default) and
+    return them as DemandForecast instances in product id order
+    """
+    now = timezone.now()
+    catalog = product_ids is None
+    if catalog:
+        product_ids = Product.objects.values_list('id', flat=True)
+    product_ids = np.unique(np.array(list(product_ids), dtype=np.int64))
+    if not len(product_ids):
+        return []
+    quantities, moved = _matrix(product_ids, now - timedelta(days=HISTORY_DAYS), catalog)
+
+    # Days with movements from each day to the last one, so that the last
+    # WINDOW of them are those counted WINDOW or fewer
+    remaining = np.cumsum(moved[:, ::-1], axis=1)[:, ::-1]
+    recent = moved & (remaining <= WINDOW)
+    history = moved.sum(axis=1)
+    totals = np.where(recent, quantities, 0).sum(axis=1)
+    forecasts = np.where(history >= WINDOW, np.maximum(totals, 0) // WINDOW, 0)
+
+    restock_date = timezone.localdate(now) + RESTOCK_AFTER
+    results = [
+        DemandForecast(
+            product_id=int(product_id),
+            forecast_quantity=int(quantity),
+            confidence_score=CONFIDENCE,
+            history_days=int(days),
+            suggested_restock_date=restock_date,
+            computed_at=now,
+        )
+        for product_id, quantity, days in zip(product_ids, forecasts, history)
+    ]
+    DemandForecast.objects.bulk_create(
+        results,
+        batch_size=_UPSERT_BATCH,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['forecast_quantity', 'confidence_score', 'history_days', 'suggested_restock_date', 'computed_at'],
+    )
+    return results
+
+
+def current(product):
+    """The product's stored forecast, recomputed if older than FORECAST_MAX_AGE"""
+    stale = timezone.now() - timedelta(seconds=settings.FORECAST_MAX_AGE)
+    stored = DemandForecast.objects.filter(product=product, computed_at__gte=stale).first()
+    return stored or forecast([product.pk])[0]
@@ -0,0 +1,222 @@
+"""
+Idempotency-Key support for write endpoints.
+
+Terminals on flaky networks retry POSTs they never saw a response for. When
+such a request carries an ``Idempotency-Key`` header, the first attempt
+runs normally and its response is stored; every retry with the same key
+gets the stored response back without touching the write path. Stored
+responses are kept for IDEMPOTENCY_KEY_TTL_HOURS and removed by the
+``purge_idempotency_keys`` command.
+
+Completed keys are looked up in a small per-process LRU first and in the
+IdempotencyKey table second. The table row is inserted before the write
+runs, so a retry that arrives while the first attempt is still in flight
+gets a 409 instead of a second sale. The response is saved on the row in
+the transaction of the write itself: a worker that dies before it commits
+leaves neither the write nor the response, and a retry that takes the key
+over once IDEMPOTENCY_LOCK_TIMEOUT has passed starts from scratch.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class _ResponseCache:
+    """Thread-safe LRU of completed responses for this worker process"""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= timezone.now():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def set(self, cache_key, entry):
+        if not self.size:
+            return
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_responses = _ResponseCache(settings.IDEMPOTENCY_LRU_SIZE)
+
+
+def request_fingerprint(request):
+    """Hash of what the request asks for, to spot a key reused for another request"""
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    payload = f'{request.method}\n{request.path}\n{body}'
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replay(entry, request_hash):
+    if entry['request_hash'] != request_hash:
+        return Response(
+            {'error': f'{HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(entry['body'], status=entry['code'], headers={'Idempotent-Replayed': 'true'})
+
+
+def _entry(row):
+    return {
+        'request_hash': row.request_hash,
+        'code': row.response_code,
+        'body': row.response_body,
+        'expires_at': row.expires_at,
+    }
+
+
+def _claim(user, key, request_hash, path):
+    """
+    Insert an in-progress row for the key, or return the existing one.
+
+    Returns ``(row, claimed)``. An in-progress row whose lock is older than
+    IDEMPOTENCY_LOCK_TIMEOUT (its worker died) or a row that has expired
+    is taken over.
+    """
+    now = timezone.now()
+    fields = {
+        'request_hash': request_hash,
+        'request_path': path[:MAX_KEY_LENGTH],
+        'status': 'in_progress',
+        'response_code': None,
+        'response_body': None,
+        'locked_at': now,
+        'expires_at': now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+    }
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, **fields), True
+    except IntegrityError:
+        pass
+
+    row = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if row is None:
+        # Purged in between; let the retry start over
+        return None, False
+
+    # Expired, or left in progress by a worker that died mid-request
+    stale_lock = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    takeover = IdempotencyKey.objects.filter(pk=row.pk).filter(
+        Q(expires_at__lte=now) | Q(status='in_progress', locked_at__lt=stale_lock)
+    ).update(**fields)
+    if takeover:
+        for field, value in fields.items():
+            setattr(row, field, value)
+        return row, True
+    return row, False
+
+
+def _store(row, response):
+    """
+    Save a finished response on its key row, or release the key on a server
+    error. Returns whether the response was saved.
+    """
+    if response.status_code >= 500:
+        IdempotencyKey.objects.filter(pk=row.pk).delete()
+        return False
+    # Round-trip through the renderer's encoder so a replay renders the same JSON
+    body = json.loads(json.dumps(response.data, cls=JSONEncoder))
+    IdempotencyKey.objects.filter(pk=row.pk).update(
+        status='completed', response_code=response.status_code, response_body=body
+    )
+    row.response_code = response.status_code
+    row.response_body = body
+    return True
+
+
+def idempotent(view_method):
+    """
+    Make a view write method replay its response for a repeated Idempotency-Key.
+
+    Requests without the header are passed straight through. Only
+    authenticated requests are keyed; keys are scoped per user.
+    """
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        request_hash = request_fingerprint(request)
+        entry = _responses.get((request.user.pk, key))
+        if entry is not None:
+            return _replay(entry, request_hash)
+
+        row, claimed = _claim(request.user, key, request_hash, request.path)
+        if row is None:
+            return Response(
+                {'error': 'Request is being retried concurrently, please retry'},
+                status=status.HTTP_409_CONFLICT
+            )
+        if not claimed:
+            if row.status == 'in_progress':
+                return Response(
+                    {'error': f'A request with this {HEADER} is still being processed'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            entry = _entry(row)
+            _responses.set((request.user.pk, key), entry)
+            return _replay(entry, request_hash)
+
+        try:
+            # The write and its stored response commit together
+            with transaction.atomic():
+                response = view_method(view, request, *args, **kwargs)
+                stored = _store(row, response)
+        except Exception:
+            IdempotencyKey.objects.filter(pk=row.pk).delete()
+            raise
+        if stored:
+            _responses.set((row.user_id, row.key), _entry(row))
+        return response
+    return wrapper
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys in batches and return how many were removed"""
+    removed = 0
+    while True:
+        expired = list(IdempotencyKey.objects.filter(
+            expires_at__lte=timezone.now()
+        ).values_list('pk', flat=True)[:batch_size])
+        if not expired:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=expired).delete()[0]
@@ -0,0 +1,94 @@
+"""
+Measure queries and time per checkout for growing basket sizes.
+
+Run with: python manage.py bench_checkout --sizes 1,10,50,200
+
+Everything is written inside a transaction that is rolled back at the end,
+so the command is safe to run against a development database.
+"""
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from inventory_api.models import Product, Sale, SaleItem
+from inventory_api.serializers import SaleSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark SaleSerializer checkouts: query count and latency per basket size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,50,200',
+                            help='Comma-separated basket sizes (number of lines)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Checkouts per basket size')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Also run the per-line SaleItem.save path for comparison')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+        try:
+            with transaction.atomic():
+                products = self._create_products(max(sizes))
+                self.stdout.write(f"{'path':<8} {'lines':>6} {'queries':>8} {'ms/checkout':>12}")
+                for size in sizes:
+                    self._report('batched', size, self._run_batched, products[:size], options['repeat'])
+                    if options['legacy']:
+                        self._report('legacy', size, self._run_legacy, products[:size], options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _create_products(self, count):
+        Product.objects.bulk_create([
+            Product(
+                name=f'Bench product {i}',
+                sku=f'BENCH-CHECKOUT-{i}',
+                quantity=1_000_000,
+                unit_price=Decimal('10.00'),
+                cost_price=Decimal('6.00'),
+            )
+            for i in range(count)
+        ])
+        return list(Product.objects.filter(sku__startswith='BENCH-CHECKOUT-').order_by('pk'))
+
+    def _report(self, label, size, runner, products, repeat):
+        queries = 0
+        elapsed = 0.0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                runner(products)
+                elapsed += time.perf_counter() - start
+            queries = len(ctx.captured_queries)
+        self.stdout.write(f'{label:<8} {size:>6} {queries:>8} {elapsed / repeat * 1000:>12.2f}')
+
+    def _run_batched(self, products):
+        data = {
+            'total_amount': str(Decimal('10.00') * len(products)),
+            'items': [
+                {'product_id': product.pk, 'quantity': 1, 'unit_price': '10.00'}
+                for product in products
+            ],
+            'payments': [{'payment_method': 'cash', 'amount': str(Decimal('10.00') * len(products))}],
+        }
+        serializer = SaleSerializer(data=data, context={})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    def _run_legacy(self, products):
+        sale = Sale.objects.create(total_amount=Decimal('10.00') * len(products))
+        for product in products:
+            SaleItem.objects.create(
+                sale=sale,
+                product=Product.objects.get(pk=product.pk),
+                quantity=1,
+                unit_price=Decimal('10.00'),
+            )
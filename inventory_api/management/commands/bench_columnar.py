@@ -0,0 +1,100 @@
+"""
+Compare the columnar store's group-bys with the same reports grouped in SQL.
+
+Run with: python manage.py bench_columnar --days 1095 --repeat 5
+
+The store is synced first (a full rewrite with --rebuild), then every
+report is computed both ways over the last --days days, timed, and checked
+to give the same figures.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.utils import timezone
+
+from inventory_api import columnar
+from inventory_api.models import Category, DailySalesRollup, Product
+
+
+def _orm_totals(rows):
+    totals = rows.aggregate(quantity=Sum('quantity'), revenue=Sum('revenue'), cost=Sum('cost'))
+    return [{'key': None, **totals}]
+
+
+def _orm_grouped(rows, field):
+    return [
+        {'key': row[field], 'quantity': row['quantity'], 'revenue': row['revenue'], 'cost': row['cost']}
+        for row in rows.values(field).annotate(
+            quantity=Sum('quantity'), revenue=Sum('revenue'), cost=Sum('cost')
+        ).order_by(field)
+    ]
+
+
+def _orm_category(rows):
+    names = dict(Category.objects.values_list('pk', 'name'))
+    totals = {}
+    for row in _orm_grouped(rows, 'category_id'):
+        name = names.get(row['key'])
+        total = totals.setdefault(name, {'key': name, 'quantity': 0, 'revenue': 0, 'cost': 0})
+        for measure in columnar.MEASURES:
+            total[measure] += row[measure]
+    return list(totals.values())
+
+
+def _normalized(rows):
+    """Rows keyed and rounded to cents, so both paths compare equal"""
+    return {
+        str(row['key']): (row['quantity'] or 0, round(float(row['revenue'] or 0), 2), round(float(row['cost'] or 0), 2))
+        for row in rows
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark sales group-bys: columnar store against SQL over the daily rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1095,
+                            help='Length of the reported period, ending today')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs of every report per path')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rewrite the store from scratch before measuring')
+
+    def handle(self, *args, **options):
+        end_date = timezone.localdate()
+        start_date = end_date - timedelta(days=options['days'])
+        rows = DailySalesRollup.objects.filter(date__range=[start_date, end_date])
+
+        started = time.perf_counter()
+        meta = columnar.sync(rebuild=options['rebuild'])
+        self.stdout.write(
+            f"Synced {meta['rows']} sale lines in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+
+        reports = [
+            ('totals', lambda: _orm_totals(rows),
+             lambda: [{'key': None, **columnar.totals(start_date, end_date)}]),
+            ('product', lambda: _orm_grouped(rows, 'product__name'),
+             lambda: columnar.group_by_name('product', Product, start_date, end_date)),
+            ('category', lambda: _orm_category(rows),
+             lambda: columnar.group_by_name('category', Category, start_date, end_date)),
+            ('date', lambda: _orm_grouped(rows, 'date'),
+             lambda: columnar.group_by('date', start_date, end_date)),
+        ]
+        self.stdout.write(f"{'report':<10} {'groups':>7} {'sql ms':>9} {'columnar ms':>12} {'speedup':>8}")
+        for name, orm, fast in reports:
+            orm_ms, expected = self._time(orm, options['repeat'])
+            fast_ms, actual = self._time(fast, options['repeat'])
+            if _normalized(expected) != _normalized(actual):
+                raise CommandError(f'{name}: the columnar store disagrees with SQL')
+            speedup = orm_ms / fast_ms if fast_ms else float('inf')
+            self.stdout.write(f'{name:<10} {len(actual):>7} {orm_ms:>9.2f} {fast_ms:>12.2f} {speedup:>7.1f}x')
+
+    def _time(self, run, repeat):
+        result = run()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return (time.perf_counter() - started) / repeat * 1000, result
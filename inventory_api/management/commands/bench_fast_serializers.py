@@ -0,0 +1,86 @@
+"""
+Compare rows/sec of the compiled list renderer against the DRF serializers.
+
+Run with: python manage.py bench_fast_serializers --rows 5000
+
+Seeds payments and stock movements inside a transaction that is rolled
+back, renders them both ways, checks the JSON is byte-identical and reports
+rows per second for each path.
+"""
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from inventory_api.checkout import checkout_many
+from inventory_api.fast_serializers import compile_serializer
+from inventory_api.models import Customer, Payment, Product, StockMovement, User
+from inventory_api.serializers import PaymentSerializer, StockMovementSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark compiled values() rendering against ModelSerializer rendering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Sales to seed (one payment and one movement each)')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._seed(options['rows'])
+                self.stdout.write(f"{'serializer':<26} {'rows':>7} {'drf rows/s':>12} {'fast rows/s':>12} {'speedup':>8}")
+                for serializer_class, queryset in (
+                    (PaymentSerializer, Payment.objects.select_related('created_by', 'sale__customer')),
+                    (StockMovementSerializer, StockMovement.objects.select_related('product', 'created_by')),
+                ):
+                    self._compare(serializer_class, queryset, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, rows):
+        user = User.objects.create(username='bench-fast-serializers', role='admin')
+        customer = Customer.objects.create(name='Bench customer')
+        product = Product.objects.create(
+            name='Bench product', sku='BENCH-FAST-SERIALIZERS', quantity=rows,
+            unit_price=Decimal('2.00'), cost_price=Decimal('1.00'),
+        )
+        checkout_many([
+            (
+                {'total_amount': Decimal('2.00'), 'customer': customer if i % 2 else None, 'created_by': user},
+                [{'product': product, 'quantity': 1, 'unit_price': Decimal('2.00')}],
+                [{'payment_method': 'cash', 'amount': Decimal('2.00')}],
+            )
+            for i in range(rows)
+        ], user=user)
+
+    def _compare(self, serializer_class, queryset, repeat):
+        compiled = compile_serializer(serializer_class)
+        if compiled is None:
+            raise CommandError(f'{serializer_class.__name__} does not compile')
+
+        renderer = JSONRenderer()
+        drf_best = fast_best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            drf = serializer_class(queryset.all(), many=True).data
+            drf_best = min(drf_best, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            fast = compiled.serialize(queryset.all())
+            fast_best = min(fast_best, time.perf_counter() - start)
+
+        if renderer.render(drf) != renderer.render(fast):
+            raise CommandError(f'{serializer_class.__name__}: compiled output differs')
+        rows = len(fast)
+        self.stdout.write(
+            f'{serializer_class.__name__:<26} {rows:>7} {rows / drf_best:>12.0f} '
+            f'{rows / fast_best:>12.0f} {drf_best / fast_best:>7.1f}x'
+        )
@@ -0,0 +1,114 @@
+"""
+Stress one hot product from several processes and check stock is conserved.
+
+Run with: python manage.py bench_stock_contention --processes 8 --sales 500
+
+Each process records 'out' stock movements against the same product as fast
+as it can. The command reports sales per second and verifies that the final
+quantity equals the starting stock minus every successful sale, and that
+oversells were rejected instead of clamped. Pass --shards N to run the same
+load against a product in sharded stock mode and compare. Use PostgreSQL
+for meaningful numbers; SQLite serialises all writers.
+"""
+import multiprocessing
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from inventory_api.models import Product, StockMovement
+from inventory_api.stock import InsufficientStock, shard_product, total_stock
+
+SKU = 'BENCH-HOT-SKU'
+
+
+def _sell(args):
+    product_id, sales, quantity = args
+    connections.close_all()
+    sold = rejected = errors = 0
+    for _ in range(sales):
+        try:
+            StockMovement.objects.create(
+                product_id=product_id,
+                movement_type='out',
+                quantity=quantity,
+                reason='sale',
+                notes='bench_stock_contention',
+            )
+            sold += 1
+        except InsufficientStock:
+            rejected += 1
+        except OperationalError:
+            errors += 1
+    connections.close_all()
+    return sold, rejected, errors
+
+
+class Command(BaseCommand):
+    help = 'Measure sales/sec on a single hot product from concurrent processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--sales', type=int, default=200, help='Sales attempted per process')
+        parser.add_argument('--quantity', type=int, default=1, help='Units per sale')
+        parser.add_argument('--stock', type=int, default=None,
+                            help='Starting stock (default: enough for 90%% of the attempted sales)')
+        parser.add_argument('--shards', type=int, default=0,
+                            help='Put the product in sharded stock mode with this many shards')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark product and movements')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        sales = options['sales']
+        quantity = options['quantity']
+        attempted = processes * sales
+        stock = options['stock']
+        if stock is None:
+            stock = int(attempted * quantity * 0.9)
+
+        product = self._setup(stock)
+        if options['shards']:
+            shard_product(product.pk, options['shards'])
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        start = time.perf_counter()
+        with context.Pool(processes) as pool:
+            results = pool.map(_sell, [(product.pk, sales, quantity)] * processes)
+        elapsed = time.perf_counter() - start
+
+        sold = sum(result[0] for result in results)
+        rejected = sum(result[1] for result in results)
+        errors = sum(result[2] for result in results)
+
+        final_stock = total_stock(product.pk)
+        movements = StockMovement.objects.filter(product=product, movement_type='out').count()
+        expected = stock - sold * quantity
+
+        self.stdout.write(f'processes:      {processes}')
+        self.stdout.write(f'stock shards:   {options["shards"] or "off"}')
+        self.stdout.write(f'attempted:      {attempted}')
+        self.stdout.write(f'sold:           {sold}')
+        self.stdout.write(f'rejected:       {rejected} (insufficient stock)')
+        self.stdout.write(f'db errors:      {errors}')
+        self.stdout.write(f'elapsed:        {elapsed:.2f}s')
+        self.stdout.write(f'sales/sec:      {sold / elapsed:.1f}')
+        self.stdout.write(f'final stock:    {final_stock} (expected {expected})')
+
+        conserved = final_stock == expected and movements == sold and final_stock >= 0
+        if not options['keep']:
+            product.delete()
+        if not conserved:
+            raise CommandError('Stock was not conserved')
+        self.stdout.write(self.style.SUCCESS('Stock conserved'))
+
+    def _setup(self, stock):
+        Product.objects.filter(sku=SKU).delete()
+        return Product.objects.create(
+            name='Benchmark hot product',
+            sku=SKU,
+            quantity=stock,
+            unit_price=Decimal('1.00'),
+            cost_price=Decimal('0.50'),
+        )
@@ -0,0 +1,121 @@
+"""
+Fail when a list endpoint's query count grows with its row count.
+
+Run with: python manage.py check_list_queries [--rows 20]
+
+Each list endpoint is requested twice, once over --rows sales (with their
+items, payments and stock movements) and once over twice as many, and the
+two query counts must match. This is the N+1 regression check for the
+planned querysets in query_plans.py; run it in CI or before deploying.
+Everything is written inside a transaction that is rolled back.
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from inventory_api import views
+from inventory_api.checkout import checkout_many
+from inventory_api.models import Category, Customer, Product, ProductBarcode, Supplier, Terminal, User
+
+ENDPOINTS = (
+    ('sales', views.SaleViewSet, ''),
+    ('sales', views.SaleViewSet, 'view=summary'),
+    ('sales', views.SaleViewSet, 'view=summary&expand=items,payments'),
+    ('sales', views.SaleViewSet, 'page_size=500'),
+    ('payments', views.PaymentViewSet, ''),
+    ('stock-movements', views.StockMovementViewSet, ''),
+    ('products', views.ProductViewSet, ''),
+    ('products', views.ProductViewSet, 'view=summary'),
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def seed_sales(user, rows, tag):
+    """
+    Write ``rows`` products, one two-line paid sale per product (with
+    their items, payments and stock movements) and a barcode each
+    """
+    category = Category.objects.create(name=f'Check category {tag}')
+    supplier = Supplier.objects.create(name=f'Check supplier {tag}')
+    customer = Customer.objects.create(name=f'Check customer {tag}')
+    terminal = Terminal.objects.create(name=f'Check terminal {tag}')
+    products = [
+        Product.objects.create(
+            name=f'Check product {tag}{i}',
+            sku=f'CHECK-{tag}-{i}',
+            quantity=1000,
+            unit_price=Decimal('2.00'),
+            cost_price=Decimal('1.00'),
+            category=category,
+            supplier=supplier,
+        )
+        for i in range(rows)
+    ]
+    ProductBarcode.objects.bulk_create([
+        ProductBarcode(product=product, code=f'CHECK-{tag}-{product.pk}') for product in products
+    ])
+    checkout_many([
+        (
+            {'total_amount': Decimal('6.00'), 'customer': customer, 'terminal': terminal, 'created_by': user},
+            [
+                {'product': product, 'quantity': 1, 'unit_price': Decimal('2.00')},
+                {'product': products[(i + 1) % rows], 'quantity': 2, 'unit_price': Decimal('2.00')},
+            ],
+            [{'payment_method': 'cash', 'amount': Decimal('6.00')}],
+        )
+        for i, product in enumerate(products)
+    ], user=user)
+
+
+def list_request(user, endpoint):
+    """The rendered response of a list endpoint from ENDPOINTS"""
+    name, viewset, params = endpoint
+    request = APIRequestFactory().get(f'/api/{name}/' + (f'?{params}' if params else ''))
+    force_authenticate(request, user=user)
+    response = viewset.as_view({'get': 'list'})(request)
+    response.render()
+    return response
+
+
+class Command(BaseCommand):
+    help = 'Check that list endpoints run a constant number of queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20, help='Sales in the smaller of the two runs')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        failures = []
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username='check-list-queries', role='admin')
+                seed_sales(user, rows, 'A')
+                before = [self._count(user, endpoint) for endpoint in ENDPOINTS]
+                seed_sales(user, rows, 'B')
+                after = [self._count(user, endpoint) for endpoint in ENDPOINTS]
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'endpoint':<52} {rows:>6} {rows * 2:>6}")
+        for (name, _, params), small, large in zip(ENDPOINTS, before, after):
+            label = f'/{name}/' + (f'?{params}' if params else '')
+            self.stdout.write(f'{label:<52} {small:>6} {large:>6}')
+            if large != small:
+                failures.append(label)
+        if failures:
+            raise CommandError(f"Query count grows with row count: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('Query counts are constant'))
+
+    def _count(self, user, endpoint):
+        with CaptureQueriesContext(connection) as ctx:
+            response = list_request(user, endpoint)
+        if response.status_code != 200:
+            raise CommandError(f'/{endpoint[0]}/?{endpoint[2]} returned {response.status_code}')
+        return len(ctx.captured_queries)
@@ -0,0 +1,32 @@
+"""
+Forecast the demand of every product and store the forecasts.
+
+Run with: python manage.py forecast_demand [--product ID ...]
+
+Meant to run daily (cron, scheduler), so that the forecast endpoint serves
+stored forecasts instead of computing them per request. Without --product
+the whole catalog is forecast in one pass.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory_api import forecasting
+
+
+class Command(BaseCommand):
+    help = 'Compute and store demand forecasts for the whole catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append', dest='products',
+                            help='Only forecast this product id (repeatable)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        forecasts = forecasting.forecast(options['products'])
+        elapsed = (time.perf_counter() - started) * 1000
+        with_history = sum(1 for forecast in forecasts if forecast.history_days)
+        self.stdout.write(self.style.SUCCESS(
+            f'Forecast {len(forecasts)} products ({with_history} with movements '
+            f'in the last {forecasting.HISTORY_DAYS} days) in {elapsed:.0f} ms'
+        ))
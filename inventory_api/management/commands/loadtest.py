@@ -0,0 +1,233 @@
+"""
+HTTP load test with a point-of-sale traffic mix.
+
+Run a server first (``python manage.py runserver`` or gunicorn, on SQLite or
+a local PostgreSQL with data from seed_benchmark_data), then:
+
+    python manage.py loadtest --base-url http://127.0.0.1:8000 \\
+        --username admin --password secret --clients 8 --duration 60
+
+Each simulated terminal is a thread that, like the frontend, polls the
+product list every --poll-interval seconds and otherwise picks requests
+from the mix: barcode/SKU scans, checkouts through POST /api/sales/,
+the cash report and the daily statistics. Per endpoint it reports
+throughput and p50/p95/p99 latency, and writes everything to a JSON file
+that --compare can diff against a later run.
+
+Checkouts really sell stock; point this at a benchmark database. SQLite
+allows one writer at a time, so with several clients some checkouts fail
+with "database is locked"; those show up as errors, not as latency.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import date
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Relative weights of the request types picked between polls
+MIX = (
+    ('scan', 60),
+    ('checkout', 25),
+    ('cash_report', 10),
+    ('daily_stats', 5),
+)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class _Client:
+    def __init__(self, base_url, token, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = Request(self.base_url + path, data=data, method=method)
+        request.add_header('Accept', 'application/json')
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except HTTPError as e:
+            return e.code, e.read()
+
+
+class Command(BaseCommand):
+    help = 'Load test the API with a realistic POS traffic mix and report latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--clients', type=int, default=4, help='Concurrent simulated terminals')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+        parser.add_argument('--poll-interval', type=float, default=30,
+                            help='Seconds between product list polls per client (the frontend uses 30)')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Seconds each client waits between requests')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--output', default=None, help='JSON results file (default: loadtest-<timestamp>.json)')
+        parser.add_argument('--compare', default=None, help='Earlier JSON results to compare against')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        client = _Client(options['base_url'], None, options['timeout'])
+        try:
+            status, body = client.request('POST', '/api/token/', {
+                'username': options['username'], 'password': options['password']
+            })
+        except URLError as e:
+            raise CommandError(f"Cannot reach {options['base_url']}: {e.reason}")
+        if status != 200:
+            raise CommandError(f'Login failed ({status}): {body[:200]!r}')
+        client.token = json.loads(body)['access']
+
+        status, body = client.request('GET', '/api/products/?' + urlencode({
+            'fields': 'id,sku,barcodes,quantity,unit_price'
+        }))
+        if status != 200:
+            raise CommandError(f'Could not load products ({status})')
+        products = json.loads(body)
+        if not products:
+            raise CommandError('No products to scan or sell; run seed_benchmark_data first')
+        codes = [product['sku'] for product in products]
+        codes += [code for product in products for code in product.get('barcodes', [])]
+        in_stock = [product for product in products if product['quantity'] > 10] or products
+
+        samples = {}
+        lock = threading.Lock()
+        stop_at = time.monotonic() + options['duration']
+
+        def record(endpoint, seconds, status):
+            with lock:
+                entry = samples.setdefault(endpoint, {'latencies': [], 'errors': 0, 'statuses': {}})
+                entry['latencies'].append(seconds)
+                entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+                if status >= 400:
+                    entry['errors'] += 1
+
+        def timed(endpoint, method, path, body=None, headers=None):
+            start = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, body, headers)
+            except (URLError, OSError):
+                status = 599
+            record(endpoint, time.perf_counter() - start, status)
+
+        def terminal(rng):
+            today = date.today().isoformat()
+            # Stagger the first poll like terminals opened at different times
+            next_poll = time.monotonic() + rng.uniform(0, options['poll_interval'])
+            names = [name for name, _ in MIX]
+            weights = [weight for _, weight in MIX]
+            while time.monotonic() < stop_at:
+                if time.monotonic() >= next_poll:
+                    timed('product_poll', 'GET', '/api/products/')
+                    next_poll += options['poll_interval']
+                    continue
+                kind = rng.choices(names, weights)[0]
+                if kind == 'scan':
+                    timed('scan', 'GET', f'/api/products/scan/{rng.choice(codes)}/')
+                elif kind == 'checkout':
+                    basket = rng.sample(in_stock, min(len(in_stock), rng.randint(1, 5)))
+                    items = [
+                        {'product_id': product['id'], 'quantity': 1, 'unit_price': product['unit_price']}
+                        for product in basket
+                    ]
+                    total = f"{sum(float(product['unit_price']) for product in basket):.2f}"
+                    timed('checkout', 'POST', '/api/sales/', {
+                        'total_amount': total,
+                        'items': items,
+                        'payments': [{'payment_method': 'cash', 'amount': total}],
+                    }, {'Idempotency-Key': str(uuid.uuid4())})
+                elif kind == 'cash_report':
+                    timed('cash_report', 'GET', '/api/cash-report/?' + urlencode({
+                        'start_date': today, 'end_date': today
+                    }))
+                else:
+                    timed('daily_stats', 'GET', '/api/statistics/daily/')
+                if options['think_time']:
+                    time.sleep(options['think_time'])
+
+        threads = [
+            threading.Thread(target=terminal, args=(random.Random(self.random.random()),))
+            for _ in range(options['clients'])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        results = {
+            'base_url': options['base_url'],
+            'clients': options['clients'],
+            'duration': round(elapsed, 2),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'endpoints': {},
+        }
+        for endpoint, entry in sorted(samples.items()):
+            latencies = sorted(entry['latencies'])
+            results['endpoints'][endpoint] = {
+                'requests': len(latencies),
+                'errors': entry['errors'],
+                'statuses': entry['statuses'],
+                'throughput': round(len(latencies) / elapsed, 2),
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2),
+            }
+
+        self._report(results)
+        output = options['output'] or f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f'Results written to {output}')
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                self._compare(json.load(f), results)
+
+    def _report(self, results):
+        self.stdout.write(
+            f"{'endpoint':<14} {'reqs':>7} {'errors':>7} {'req/s':>8} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+        )
+        for endpoint, stats in results['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<14} {stats['requests']:>7} {stats['errors']:>7} {stats['throughput']:>8.1f} "
+                f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}"
+            )
+
+    def _compare(self, before, after):
+        self.stdout.write('')
+        self.stdout.write(f"{'endpoint':<14} {'req/s':>16} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+        for endpoint, stats in after['endpoints'].items():
+            old = before['endpoints'].get(endpoint)
+            if old is None:
+                continue
+            cells = [
+                f"{old[key]:.1f} -> {stats[key]:.1f}"
+                for key in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+            ]
+            self.stdout.write(f'{endpoint:<14} ' + ' '.join(f'{cell:>18}' for cell in cells))
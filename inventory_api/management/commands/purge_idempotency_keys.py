@@ -0,0 +1,22 @@
+"""
+Delete expired Idempotency-Key records.
+
+Run with: python manage.py purge_idempotency_keys
+
+Keys expire IDEMPOTENCY_KEY_TTL_HOURS after they were first used. Schedule
+this hourly or daily (render.yaml runs it as a cron job).
+"""
+from django.core.management.base import BaseCommand
+
+from inventory_api.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        removed = purge_expired(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired idempotency keys'))
@@ -0,0 +1,65 @@
+"""
+Rebuild the daily sales rollup from sale items and stock movements.
+
+Run with: python manage.py rebuild_sales_rollup [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+
+Sales keep the rollup up to date as they are recorded; this fills it for
+data that predates it or was loaded or changed outside the application
+(bulk imports, raw SQL). Without dates every day from the first sale to
+today is rebuilt. --if-empty does nothing once the rollup has rows, which
+lets deploys run it unconditionally.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from inventory_api import reports, rollups
+from inventory_api.models import DailySalesRollup, Sale, StockMovement
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollup for a range of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=_parse_date, default=None, help='First day (default: first sale)')
+        parser.add_argument('--end', type=_parse_date, default=None, help='Last day (default: today)')
+        parser.add_argument('--if-empty', action='store_true', help='Only run when the rollup has no rows')
+
+    def handle(self, *args, **options):
+        if options['if_empty'] and DailySalesRollup.objects.exists():
+            self.stdout.write('Sales rollup already built; nothing to do')
+            return
+
+        start = options['start']
+        if start is None:
+            first = [
+                value for value in (
+                    Sale.objects.aggregate(first=Min('created_at'))['first'],
+                    StockMovement.objects.filter(
+                        movement_type='out', reason='sale'
+                    ).aggregate(first=Min('created_at'))['first'],
+                ) if value is not None
+            ]
+            if not first:
+                self.stdout.write('No sales to roll up')
+                return
+            start = timezone.localdate(min(first))
+        end = options['end'] or timezone.localdate()
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        with transaction.atomic():
+            rollups.rebuild(start, end)
+            transaction.on_commit(reports.invalidate)
+        rows = DailySalesRollup.objects.filter(date__range=[start, end]).count()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollup for {start} to {end}: {rows} rows'))
@@ -0,0 +1,61 @@
+"""
+Find sales whose amount_paid or status drifted from their payments.
+
+Run with: python manage.py reconcile_sale_payments [--fix]
+
+Payments update their sale incrementally, so a payment edited or deleted
+outside the API (admin, raw SQL, a failed deploy) can leave the stored
+totals out of step. This recomputes them in one pass over the database.
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import DecimalField, Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from inventory_api.models import Payment, Sale
+
+
+class Command(BaseCommand):
+    help = 'Report (and optionally fix) sales whose amount_paid/status disagree with their payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Write the recomputed totals back')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        paid = Payment.objects.filter(
+            sale=OuterRef('pk')
+        ).exclude(payment_method='credit').order_by().values('sale').annotate(
+            total=Sum('amount')
+        ).values('total')
+
+        sales = Sale.objects.filter(
+            Exists(Payment.objects.filter(sale=OuterRef('pk')))
+        ).annotate(
+            expected_paid=Coalesce(
+                Subquery(paid), Value(Decimal('0')), output_field=DecimalField(max_digits=10, decimal_places=2)
+            ),
+            has_credit=Exists(Payment.objects.filter(sale=OuterRef('pk'), payment_method='credit')),
+        ).only('id', 'order_number', 'total_amount', 'amount_paid', 'status').order_by('pk')
+
+        drifted = []
+        checked = 0
+        for sale in sales.iterator(chunk_size=options['batch_size']):
+            checked += 1
+            expected_status = Sale.payment_status(sale.expected_paid, sale.total_amount, sale.has_credit)
+            if sale.amount_paid == sale.expected_paid and sale.status == expected_status:
+                continue
+            self.stdout.write(
+                f'Sale #{sale.id} ({sale.order_number}): amount_paid {sale.amount_paid} -> {sale.expected_paid}, '
+                f'status {sale.status} -> {expected_status}'
+            )
+            sale.amount_paid = sale.expected_paid
+            sale.status = expected_status
+            drifted.append(sale)
+
+        if options['fix'] and drifted:
+            Sale.objects.bulk_update(drifted, ['amount_paid', 'status'], batch_size=options['batch_size'])
+
+        action = 'Fixed' if options['fix'] else 'Found'
+        self.stdout.write(self.style.SUCCESS(f'{action} {len(drifted)} drifted sale(s) out of {checked} checked'))
@@ -0,0 +1,55 @@
+"""
+Run queued report jobs.
+
+Run with: python manage.py run_report_worker [--once]
+
+Polls the ReportJob table every REPORT_WORKER_POLL_INTERVAL seconds and
+computes jobs one at a time. Start as many workers as needed; they claim
+jobs with SKIP LOCKED and never run the same job twice at once. --once
+drains the queue and exits, which suits a cron job. Finished jobs older
+than REPORT_JOB_RETENTION_HOURS are deleted about once an hour.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from inventory_api.reports import claim_job, purge_jobs, run_job
+
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Compute queued background report jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=None, help='Exit after this many jobs')
+
+    def handle(self, *args, **options):
+        processed = 0
+        purged_at = 0.0
+        while options['max_jobs'] is None or processed < options['max_jobs']:
+            # A long-lived process must drop connections the database closed
+            close_old_connections()
+            if time.monotonic() - purged_at >= PURGE_INTERVAL:
+                removed = purge_jobs()
+                if removed:
+                    self.stdout.write(f'Deleted {removed} old report jobs')
+                purged_at = time.monotonic()
+
+            job = claim_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(settings.REPORT_WORKER_POLL_INTERVAL)
+                continue
+
+            start = time.monotonic()
+            succeeded = run_job(job)
+            processed += 1
+            outcome = 'done' if succeeded else 'failed'
+            self.stdout.write(
+                f'Report job {job.pk} ({job.report_type}) {outcome} in {time.monotonic() - start:.1f}s'
+            )
@@ -0,0 +1,470 @@
+"""
+Generate a large, deterministic dataset for benchmarks.
+
+Run with:
+    python manage.py seed_benchmark_data --seed 1
+    python manage.py seed_benchmark_data --products 2000 --sales 50000 --movements 150000
+
+The defaults are 50k products (each with a barcode), 1M sales with their
+items and payments spread over terminals, cashiers and customers, and 5M
+stock movements in total: the 'out' movement of every sale item, one
+opening purchase per product and, to make up the rest, purchases,
+returns, adjustments and damage.
+
+The same --seed, volumes and --end-date produce the same rows. Rows are
+written in batches of --batch-size with COPY on PostgreSQL and bulk_create
+elsewhere, with explicit primary keys. Model save() hooks, signals and
+auto_now timestamps are bypassed, so the generator itself computes what
+they would have written: stock levels that match the movements, sale
+totals, amount_paid and status, and order numbers from the regular
+allocator, and the daily sales rollup is rebuilt for the seeded days.
+Everything is written in one transaction.
+
+Names, SKUs and usernames start with --prefix; a prefix can only be seeded
+once per database.
+"""
+import io
+import math
+import random
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from inventory_api import closed_periods, rollups, scan_index
+from inventory_api.models import (
+    Category, Customer, Payment, Product, ProductBarcode, Sale, SaleItem,
+    StockMovement, Supplier, Terminal, User,
+)
+from inventory_api.order_numbers import allocate_order_numbers
+
+ADJECTIVES = ('Classic', 'Fresh', 'Premium', 'Family', 'Mini', 'Large', 'Organic', 'Spicy', 'Sweet', 'Light')
+NOUNS = ('Rice', 'Soap', 'Milk', 'Bread', 'Juice', 'Tea', 'Sugar', 'Flour', 'Oil', 'Biscuits', 'Battery', 'Towel')
+
+# Basket lines per sale and units per line, with relative weights
+LINE_COUNTS = ((1, 2, 3, 4, 5, 6), (30, 25, 18, 12, 9, 6))
+LINE_QUANTITIES = ((1, 2, 3, 4, 5), (60, 20, 10, 6, 4))
+PAYMENT_METHODS = (('cash', 'mpesa', 'card', 'equity', 'mobile'), (45, 30, 12, 8, 5))
+CUSTOMER_SHARE = 0.3
+CREDIT_SHARE = 0.05
+SPLIT_SHARE = 0.1
+
+# Stock movements besides sales: (movement_type, reason, weight, min, max quantity)
+OTHER_MOVEMENTS = (
+    ('in', 'purchase', 50, 12, 120),
+    ('in', 'return', 10, 1, 3),
+    ('in', 'adjustment', 5, 1, 10),
+    ('out', 'adjustment', 10, 1, 10),
+    ('out', 'damage', 25, 1, 5),
+)
+
+MOVEMENT_FIELDS = (
+    'id', 'product_id', 'movement_type', 'quantity', 'reason', 'notes', 'unit_price', 'unit_cost',
+    'created_at', 'created_by_id', 'sale_item_id',
+)
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_value(value):
+    """A value in COPY's text format"""
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _money(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _ean13(digits):
+    """Append the EAN-13 check digit to 12 digits"""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return f'{digits}{(10 - total % 10) % 10}'
+
+
+@contextmanager
+def _timestamps_as_given(*model_classes):
+    """Stop auto_now/auto_now_add from overwriting generated timestamps"""
+    saved = []
+    for model in model_classes:
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.DateField) and (field.auto_now or field.auto_now_add):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class _Writer:
+    """Inserts row tuples with COPY on PostgreSQL and bulk_create elsewhere"""
+
+    def __init__(self):
+        self.use_copy = connection.vendor == 'postgresql'
+        self.counts = Counter()
+
+    def write(self, model, attnames, rows):
+        if not rows:
+            return
+        if self.use_copy:
+            self._copy(model, attnames, rows)
+        else:
+            model.objects.bulk_create([model(**dict(zip(attnames, row))) for row in rows])
+        self.counts[model] += len(rows)
+
+    def _copy(self, model, attnames, rows):
+        quote = connection.ops.quote_name
+        fields = [model._meta.get_field(name) for name in attnames]
+        # Columns the generator leaves out get their model default
+        defaults = [
+            field for field in model._meta.concrete_fields
+            if field.attname not in attnames and field.has_default()
+        ]
+        columns = ', '.join(quote(field.column) for field in fields + defaults)
+        tail = ''.join(
+            '\t' + _copy_value(field.get_db_prep_save(field.get_default(), connection))
+            for field in defaults
+        )
+        buffer = io.StringIO()
+        write = buffer.write
+        for row in rows:
+            write('\t'.join(map(_copy_value, row)))
+            write(tail)
+            write('\n')
+        sql = f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN'
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):
+                buffer.seek(0)
+                raw.copy_expert(sql, buffer)
+            else:
+                # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+
+class Command(BaseCommand):
+    help = 'Generate a large deterministic benchmark dataset with bulk inserts (COPY on PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--sales', type=int, default=1_000_000)
+        parser.add_argument('--movements', type=int, default=5_000_000,
+                            help='Total stock movements, including the one per sale item')
+        parser.add_argument('--customers', type=int, default=20_000)
+        parser.add_argument('--terminals', type=int, default=20)
+        parser.add_argument('--cashiers', type=int, default=25)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--suppliers', type=int, default=200)
+        parser.add_argument('--days', type=int, default=365, help='Days of history the sales are spread over')
+        parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                            help='Last day of history, YYYY-MM-DD (default: today)')
+        parser.add_argument('--batch-size', type=int, default=20_000, help='Rows per COPY/bulk_create')
+        parser.add_argument('--prefix', default='BENCH', help='Prefix of generated SKUs, names and usernames')
+
+    def handle(self, *args, **options):
+        if options['products'] < 1 or options['days'] < 1:
+            raise CommandError('--products and --days must be at least 1')
+        if options['products'] >= 10_000_000:
+            raise CommandError('At most 9,999,999 products fit the generated barcodes')
+        self.options = options
+        self.prefix = options['prefix']
+        if Product.objects.filter(sku__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Products with the {self.prefix} prefix already exist; pick another --prefix')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.writer = _Writer()
+        end_date = options['end_date'] or timezone.localdate()
+        self.first_day = timezone.make_aware(datetime.combine(end_date - timedelta(days=options['days'] - 1), datetime.min.time()))
+
+        started = time.monotonic()
+        written = (Category, Supplier, Customer, Terminal, Product, ProductBarcode, Sale, SaleItem, Payment, StockMovement)
+        with _timestamps_as_given(*written), transaction.atomic():
+            self._dimensions()
+            self._products()
+            self._sales()
+            self._other_movements()
+            self._opening_stock()
+            self._reset_sequences(written)
+            # Nor do they reach the sales rollup, which is rebuilt for the period,
+            # or the stored cash reports of those days
+            rollups.rebuild(timezone.localdate(self.first_day), end_date)
+            closed_periods.invalidate_cash(timezone.localdate(self.first_day), end_date)
+            # bulk inserts send no signals
+            transaction.on_commit(scan_index.invalidate)
+
+        elapsed = time.monotonic() - started
+        total = sum(self.writer.counts.values())
+        for model in written:
+            self.stdout.write(f'{model.__name__:<16} {self.writer.counts[model]:>10}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s, '
+            f"{'COPY' if self.writer.use_copy else 'bulk_create'})"
+        ))
+
+    def _next_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def _timestamp(self, position, count, opening=8, closing=20):
+        """
+        The ``position``-th of ``count`` increasing timestamps spread over
+        the business hours of every day
+        """
+        offset = (position + self.rng.random()) / count * self.options['days']
+        day = int(offset)
+        hours = opening + (offset - day) * (closing - opening)
+        return self.first_day + timedelta(days=day, hours=hours)
+
+    def _write_batches(self, model, attnames, rows):
+        for start in range(0, len(rows), self.batch_size):
+            self.writer.write(model, attnames, rows[start:start + self.batch_size])
+
+    def _dimensions(self):
+        options = self.options
+        rng = self.rng
+        opened = self.first_day
+        prefix = self.prefix
+
+        category_id = self._next_id(Category)
+        self.category_ids = list(range(category_id, category_id + options['categories']))
+        self._write_batches(Category, ('id', 'name', 'description', 'created_at', 'updated_at'), [
+            (pk, f'{prefix} category {i}', '', opened, opened) for i, pk in enumerate(self.category_ids)
+        ])
+
+        supplier_id = self._next_id(Supplier)
+        self.supplier_ids = list(range(supplier_id, supplier_id + options['suppliers']))
+        self._write_batches(Supplier, (
+            'id', 'name', 'contact_person', 'email', 'phone', 'address', 'tax_id', 'payment_terms',
+            'created_at', 'updated_at',
+        ), [
+            (
+                pk, f'{prefix} supplier {i}', f'Contact {i}', f'supplier{i}@example.com',
+                f'07{rng.randrange(10 ** 8):08d}', f'{i} Industrial Area', '', '', opened, opened,
+            )
+            for i, pk in enumerate(self.supplier_ids)
+        ])
+
+        customer_id = self._next_id(Customer)
+        self.customer_ids = list(range(customer_id, customer_id + options['customers']))
+        self._write_batches(Customer, ('id', 'name', 'email', 'phone', 'address', 'created_at', 'updated_at'), [
+            (pk, f'{prefix} customer {i}', '', f'07{rng.randrange(10 ** 8):08d}', '', opened, opened)
+            for i, pk in enumerate(self.customer_ids)
+        ])
+
+        terminal_id = self._next_id(Terminal)
+        self.terminal_ids = list(range(terminal_id, terminal_id + options['terminals']))
+        self._write_batches(Terminal, ('id', 'name', 'is_active', 'created_at', 'updated_at'), [
+            (pk, f'{prefix} terminal {i}', True, opened, opened) for i, pk in enumerate(self.terminal_ids)
+        ])
+
+        # Few enough for the ORM; none of them can log in
+        password = make_password(None)
+        usernames = [f'{prefix.lower()}-cashier-{i}' for i in range(options['cashiers'])]
+        if User.objects.filter(username__in=usernames).exists():
+            raise CommandError(f'Users named {usernames[0]}... already exist; pick another --prefix')
+        User.objects.bulk_create([User(username=name, role='staff', password=password) for name in usernames])
+        self.cashier_ids = list(User.objects.filter(username__in=usernames).order_by('pk').values_list('pk', flat=True))
+        if not (self.terminal_ids and self.cashier_ids):
+            raise CommandError('--terminals and --cashiers must be at least 1')
+        self.stdout.write('Wrote categories, suppliers, customers, terminals and cashiers')
+
+    def _products(self):
+        rng = self.rng
+        count = self.options['products']
+        first_id = self._next_id(Product)
+        self.product_ids = list(range(first_id, first_id + count))
+        # Prices in cents, log-uniform between 0.50 and 500.00
+        self.prices = [int(math.exp(rng.uniform(math.log(50), math.log(50_000)))) for _ in range(count)]
+        self.costs = costs = [int(price * rng.uniform(0.5, 0.85)) or 1 for price in self.prices]
+        # Sales concentrate on a few popular products, not the lowest ids
+        self.popularity = list(range(count))
+        rng.shuffle(self.popularity)
+        self.units_in = [0] * count
+        self.units_out = [0] * count
+
+        opened = self.first_day
+        rows = []
+        for i, pk in enumerate(self.product_ids):
+            rows.append((
+                pk, f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}', f'{self.prefix}-{i:07d}', '',
+                0, _money(self.prices[i]), _money(costs[i]), 0,
+                rng.choice(self.category_ids) if self.category_ids else None,
+                rng.choice(self.supplier_ids) if self.supplier_ids else None,
+                opened, opened,
+            ))
+        self._write_batches(Product, (
+            'id', 'name', 'sku', 'description', 'quantity', 'unit_price', 'cost_price', 'stock_shards',
+            'category_id', 'supplier_id', 'created_at', 'updated_at',
+        ), rows)
+
+        # In-store EAN-13 range (leading 2), made distinct per prefix
+        base = f'2{zlib.crc32(self.prefix.encode()) % 10_000:04d}'
+        barcode_id = self._next_id(ProductBarcode)
+        self._write_batches(ProductBarcode, ('id', 'product_id', 'code', 'created_at'), [
+            (barcode_id + i, pk, _ean13(f'{base}{i:07d}'), opened) for i, pk in enumerate(self.product_ids)
+        ])
+        self.stdout.write(f'Wrote {count} products with barcodes')
+
+    def _popular_product(self):
+        return self.popularity[int(len(self.popularity) * self.rng.random() ** 3)]
+
+    def _payments(self, total):
+        """(method, cents) payments for a sale of ``total`` cents"""
+        rng = self.rng
+        methods, weights = PAYMENT_METHODS
+        roll = rng.random()
+        if roll < CREDIT_SHARE:
+            deposit = total * rng.randrange(0, 6) // 10
+            return ([('cash', deposit)] if deposit else []) + [('credit', total - deposit)]
+        if roll < CREDIT_SHARE + SPLIT_SHARE and total > 1:
+            first = max(1, total * rng.randrange(1, 10) // 10)
+            second = rng.choices(methods, weights)[0]
+            return [('cash', first), (second if second != 'cash' else 'mpesa', total - first)]
+        return [(rng.choices(methods, weights)[0], total)]
+
+    def _sales(self):
+        rng = self.rng
+        count = self.options['sales']
+        sale_id = self._next_id(Sale)
+        item_id = self._next_id(SaleItem)
+        payment_id = self._next_id(Payment)
+        self.movement_id = self._next_id(StockMovement)
+        line_counts, line_weights = LINE_COUNTS
+        quantities, quantity_weights = LINE_QUANTITIES
+
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            sales, items, payments, movements = [], [], [], []
+            for offset, order_number in enumerate(allocate_order_numbers(size)):
+                created_at = self._timestamp(start + offset, count)
+                terminal_id = rng.choice(self.terminal_ids)
+                cashier_id = rng.choice(self.cashier_ids)
+                customer_id = (
+                    rng.choice(self.customer_ids)
+                    if self.customer_ids and rng.random() < CUSTOMER_SHARE else None
+                )
+                total = 0
+                picked = set()
+                for _ in range(rng.choices(line_counts, line_weights)[0]):
+                    index = self._popular_product()
+                    if index in picked:
+                        continue
+                    picked.add(index)
+                    quantity = rng.choices(quantities, quantity_weights)[0]
+                    total += self.prices[index] * quantity
+                    self.units_out[index] += quantity
+                    product_id = self.product_ids[index]
+                    price, cost = _money(self.prices[index]), _money(self.costs[index])
+                    items.append((item_id, sale_id, product_id, quantity, price, cost))
+                    movements.append((
+                        self.movement_id, product_id, 'out', quantity, 'sale', f'Sale #{sale_id}',
+                        price, cost, created_at, cashier_id, item_id,
+                    ))
+                    item_id += 1
+                    self.movement_id += 1
+
+                amount_paid = 0
+                has_credit = False
+                for method, amount in self._payments(total):
+                    if method == 'credit':
+                        has_credit = True
+                    else:
+                        amount_paid += amount
+                    payments.append((
+                        payment_id, sale_id, method, _money(amount), '', terminal_id, created_at, cashier_id,
+                    ))
+                    payment_id += 1
+                sales.append((
+                    sale_id, order_number, Sale.payment_status(amount_paid, total, has_credit),
+                    _money(total), _money(amount_paid), terminal_id, customer_id, created_at, cashier_id,
+                ))
+                sale_id += 1
+
+            self.writer.write(Sale, (
+                'id', 'order_number', 'status', 'total_amount', 'amount_paid', 'terminal_id', 'customer_id',
+                'created_at', 'created_by_id',
+            ), sales)
+            self._write_batches(SaleItem, ('id', 'sale_id', 'product_id', 'quantity', 'unit_price', 'unit_cost'), items)
+            self._write_batches(Payment, (
+                'id', 'sale_id', 'payment_method', 'amount', 'notes', 'terminal_id', 'created_at', 'created_by_id',
+            ), payments)
+            self._write_batches(StockMovement, MOVEMENT_FIELDS, movements)
+            self.stdout.write(f'Wrote {start + size}/{count} sales')
+
+    def _other_movements(self):
+        rng = self.rng
+        written = self.writer.counts[StockMovement]
+        count = max(0, self.options['movements'] - written - len(self.product_ids))
+        kinds = [kind[:2] + kind[3:] for kind in OTHER_MOVEMENTS]
+        weights = [kind[2] for kind in OTHER_MOVEMENTS]
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            rows = []
+            for offset in range(size):
+                movement_type, reason, low, high = rng.choices(kinds, weights)[0]
+                index = rng.randrange(len(self.product_ids))
+                quantity = rng.randint(low, high)
+                if movement_type == 'in':
+                    self.units_in[index] += quantity
+                else:
+                    self.units_out[index] += quantity
+                rows.append((
+                    self.movement_id, self.product_ids[index], movement_type, quantity, reason, '',
+                    _money(self.prices[index]), _money(self.costs[index]),
+                    self._timestamp(start + offset, count), rng.choice(self.cashier_ids), None,
+                ))
+                self.movement_id += 1
+            self.writer.write(StockMovement, MOVEMENT_FIELDS, rows)
+        self.stdout.write(f'Wrote {count} purchase, return, adjustment and damage movements')
+
+    def _opening_stock(self):
+        """
+        Open every product with enough stock that it never goes negative,
+        and set Product.quantity to what its movements add up to
+        """
+        rng = self.rng
+        opened = self.first_day
+        cashier_id = self.cashier_ids[0]
+        rows = []
+        products = []
+        for index, pk in enumerate(self.product_ids):
+            opening = self.units_out[index] + rng.randint(5, 200)
+            rows.append((
+                self.movement_id, pk, 'in', opening, 'purchase', 'Opening stock',
+                _money(self.prices[index]), _money(self.costs[index]), opened, cashier_id, None,
+            ))
+            self.movement_id += 1
+            products.append(Product(pk=pk, quantity=opening + self.units_in[index] - self.units_out[index]))
+        self._write_batches(StockMovement, MOVEMENT_FIELDS, rows)
+        Product.objects.bulk_update(products, ['quantity'], batch_size=1000)
+        self.stdout.write('Wrote opening stock and product quantities')
+
+    def _reset_sequences(self, model_classes):
+        """Move id sequences past the explicit ids (PostgreSQL)"""
+        statements = connection.ops.sequence_reset_sql(no_style(), model_classes)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -0,0 +1,38 @@
+"""
+Show how often identical analytics requests were coalesced.
+
+Run with: python manage.py singleflight_stats [name ...] [--reset]
+
+For each single-flight name (the statistics endpoints by default) prints
+the calls made, how many shared another request's computation instead of
+running their own, and the coalescing ratio. Counts are read from the
+shared cache (REDIS_URL) only, where every worker keeps them; without one
+each worker counts in its own memory, out of this command's reach, and
+the command refuses to run.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory_api.singleflight import coalescing_stats, reset_stats, shared_cache
+
+DEFAULT_NAMES = ('daily', 'monthly', 'yearly', 'sales-analytics', 'dairy-stats')
+
+
+class Command(BaseCommand):
+    help = 'Report the single-flight coalescing ratio of the analytics endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Names to report (default: {', '.join(DEFAULT_NAMES)})")
+        parser.add_argument('--reset', action='store_true', help='Zero the counts after reporting them')
+
+    def handle(self, *args, **options):
+        if not shared_cache():
+            raise CommandError('Counts are kept per worker process; set REDIS_URL to share them')
+        names = options['names'] or DEFAULT_NAMES
+        self.stdout.write(f"{'name':<18} {'calls':>9} {'coalesced':>10} {'ratio':>7}")
+        for name in names:
+            stats = coalescing_stats(name)
+            self.stdout.write(
+                f"{name:<18} {stats['calls']:>9} {stats['coalesced']:>10} {stats['ratio']:>7.1%}"
+            )
+            if options['reset']:
+                reset_stats(name)
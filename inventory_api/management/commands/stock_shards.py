@@ -0,0 +1,55 @@
+"""
+Manage sharded stock counters for hot products.
+
+Run with:
+    python manage.py stock_shards --list
+    python manage.py stock_shards --promote 12 --shards 8
+    python manage.py stock_shards --demote 12
+    python manage.py stock_shards --rollup
+
+--rollup copies the sum of each sharded product's shards into
+Product.quantity; it runs every minute (see render.yaml) so product lists
+and reports see fresh stock for sharded products.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory_api.models import Product
+from inventory_api.stock import refresh_rollups, shard_product, total_stock, unshard_product
+
+
+class Command(BaseCommand):
+    help = 'Promote, demote, list and roll up sharded stock counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--promote', type=int, metavar='PRODUCT_ID', help='Shard this product')
+        parser.add_argument('--shards', type=int, default=None, help='Shard count for --promote')
+        parser.add_argument('--demote', type=int, metavar='PRODUCT_ID', help='Fold shards back onto the product')
+        parser.add_argument('--rollup', action='store_true', help='Refresh Product.quantity of sharded products')
+        parser.add_argument('--list', action='store_true', help='List sharded products')
+
+    def handle(self, *args, **options):
+        if not any(options[name] for name in ('promote', 'demote', 'rollup', 'list')):
+            raise CommandError('Nothing to do: pass --promote, --demote, --rollup or --list')
+
+        if options['promote']:
+            if shard_product(options['promote'], options['shards']):
+                self.stdout.write(self.style.SUCCESS(f"Product {options['promote']} is now sharded"))
+            else:
+                self.stdout.write(f"Product {options['promote']} was already sharded")
+
+        if options['demote']:
+            if unshard_product(options['demote']):
+                self.stdout.write(self.style.SUCCESS(f"Product {options['demote']} is no longer sharded"))
+            else:
+                self.stdout.write(f"Product {options['demote']} was not sharded")
+
+        if options['rollup']:
+            updated = refresh_rollups()
+            self.stdout.write(self.style.SUCCESS(f'Refreshed stock rollup of {updated} product(s)'))
+
+        if options['list']:
+            for product in Product.objects.filter(stock_shards__gt=0).only('name', 'sku', 'quantity', 'stock_shards'):
+                self.stdout.write(
+                    f'{product.id:>6} {product.sku:<20} shards={product.stock_shards:<3} '
+                    f'stock={total_stock(product.pk):<8} rollup={product.quantity}'
+                )
@@ -0,0 +1,51 @@
+"""
+Bring the columnar store of sale lines up to date (see columnar.py).
+
+Run with: python manage.py sync_columnar [--rebuild] [--loop]
+
+Requests only read the store, so this runs on every host that serves
+them: once, or with --loop every COLUMNAR_SYNC_INTERVAL seconds next to
+the web server. --rebuild rewrites the store from scratch first.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from inventory_api import columnar
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Sync the columnar store of sale lines with the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Rewrite the store from scratch')
+        parser.add_argument('--loop', action='store_true', help='Keep syncing until stopped')
+
+    def handle(self, *args, **options):
+        rebuild = options['rebuild']
+        while True:
+            # A long-lived process must drop connections the database closed
+            close_old_connections()
+            start = time.monotonic()
+            try:
+                meta = columnar.sync(rebuild=rebuild)
+            except Exception:
+                if not options['loop']:
+                    raise
+                # Requests keep reading the previous store meanwhile
+                logger.exception('Columnar sync failed')
+            else:
+                if options['verbosity'] > 1 or not options['loop']:
+                    self.stdout.write(
+                        f"Columnar store has {meta['rows']} sale lines "
+                        f"({(time.monotonic() - start) * 1000:.0f} ms)"
+                    )
+            rebuild = False
+            if not options['loop']:
+                break
+            time.sleep(settings.COLUMNAR_SYNC_INTERVAL)
@@ -0,0 +1,111 @@
+"""
+Per-request query and latency instrumentation.
+
+QueryBudgetMiddleware counts the SQL queries a request runs and the time
+spent in the database, in response rendering (JSON serialization) and in
+total, and reports them in a ``Server-Timing`` header that browser dev
+tools display per request.
+
+Each view (by URL name, e.g. ``sale-list``) has a budget in
+QUERY_BUDGETS, falling back to the ``default`` entry. A request over its
+query budget is logged as a warning with QUERY_BUDGET_MODE = 'warn'
+(production) and raises QueryBudgetExceeded with 'raise' (tests), so an
+N+1 regression fails the test that exercises it. Latency depends on the
+machine (and DEBUG), so a request over its ``ms`` budget is only ever
+logged. Queries repeated with identical SQL
+within one request are logged with their count, which points straight at
+the N+1 loop.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('inventory_api.performance')
+
+# IN (%s, %s, ...) lists differ in length between otherwise identical queries
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class _QueryRecorder:
+    """execute_wrapper that counts and times every query"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[_IN_LIST.sub('IN (...)', sql)] += 1
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.QUERY_BUDGET_MODE == 'off':
+            return self.get_response(request)
+
+        recorder = _QueryRecorder()
+        request._render_seconds = 0.0
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"',
+            f'serialize;dur={request._render_seconds * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        self.check_budget(request, recorder, total)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time it
+        render_start = time.perf_counter()
+
+        def rendered(response):
+            request._render_seconds = time.perf_counter() - render_start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def check_budget(self, request, recorder, total):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.url_name if match else None
+        budgets = settings.QUERY_BUDGETS
+        budget = budgets.get(view_name, budgets.get('default', {}))
+
+        repeated = [
+            (count, sql) for sql, count in recorder.fingerprints.most_common()
+            if count >= settings.QUERY_DUPLICATE_THRESHOLD
+        ]
+        for count, sql in repeated:
+            logger.warning('%s %s ran the same query %d times: %s', request.method, request.path, count, sql[:500])
+
+        prefix = f"{request.method} {request.path} [{view_name}] over budget"
+        if 'ms' in budget and total * 1000 > budget['ms']:
+            logger.warning('%s: %.0fms (budget %dms)', prefix, total * 1000, budget['ms'])
+        if 'queries' in budget and recorder.count > budget['queries']:
+            message = f"{prefix}: {recorder.count} queries (budget {budget['queries']})"
+            if settings.QUERY_BUDGET_MODE == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.20 on 2026-10-16 22:46
+
+from django.db import migrations, models
+
+# Legacy order numbers are 'PD' plus 6 random digits, so allocated numbers
+# start at 7 digits and can never collide with them.
+FIRST_ORDER_NUMBER = 1000000
+SEQUENCE_NAME = 'inventory_api_sale_order_number_seq'
+
+
+def create_order_number_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME} START WITH {FIRST_ORDER_NUMBER}'
+        )
+    else:
+        OrderNumberCounter = apps.get_model('inventory_api', 'OrderNumberCounter')
+        OrderNumberCounter.objects.get_or_create(name='sale', defaults={'next_value': FIRST_ORDER_NUMBER})
+
+
+def drop_order_number_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0016_customer_sale_customer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_order_number_sequence, drop_order_number_sequence),
+    ]
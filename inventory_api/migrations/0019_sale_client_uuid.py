@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0018_product_stock_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='client_uuid',
+            field=models.UUIDField(blank=True, help_text='Id assigned by the terminal, used to ignore replayed offline sales', null=True, unique=True),
+        ),
+    ]
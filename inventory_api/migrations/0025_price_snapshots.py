@@ -0,0 +1,50 @@
+# Generated by Django 4.2.20 on 2026-10-16 23:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_prices(apps, schema_editor):
+    """
+    Fill the new price columns from the products' current prices, the best
+    record there is of what earlier rows were moved at. Sale items keep
+    their own unit_price.
+    """
+    Product = apps.get_model('inventory_api', 'Product')
+    StockMovement = apps.get_model('inventory_api', 'StockMovement')
+    SaleItem = apps.get_model('inventory_api', 'SaleItem')
+
+    def product_field(name):
+        return Subquery(Product.objects.filter(pk=OuterRef('product_id')).values(name)[:1])
+
+    StockMovement.objects.filter(unit_price__isnull=True).update(
+        unit_price=product_field('unit_price'),
+        unit_cost=product_field('cost_price'),
+    )
+    SaleItem.objects.filter(unit_cost__isnull=True).update(unit_cost=product_field('cost_price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0024_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='saleitem',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.20 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separate from the backfill: PostgreSQL refuses to alter a table with
+    # pending trigger events from updates in the same transaction
+
+    dependencies = [
+        ('inventory_api', '0025_price_snapshots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='saleitem',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+    ]
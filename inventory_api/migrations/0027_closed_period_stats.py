@@ -0,0 +1,31 @@
+# Generated by Django 4.2.20 on 2026-10-16 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0026_price_snapshots_not_null'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClosedPeriodStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sales_day', 'Sales per day'), ('sales_month', 'Sales per month'), ('sales_year', 'Sales per year'), ('cash_day', 'Cash report per day')], max_length=20)),
+                ('period_start', models.DateField()),
+                ('data', models.JSONField()),
+                ('etag', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['kind', 'period_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='closedperiodstats',
+            constraint=models.UniqueConstraint(fields=('kind', 'period_start'), name='closedperiodstats_key'),
+        ),
+    ]
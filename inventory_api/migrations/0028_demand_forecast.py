@@ -0,0 +1,29 @@
+# Generated by Django 4.2.20 on 2026-10-16 23:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0027_closed_period_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('forecast_quantity', models.IntegerField(default=0)),
+                ('confidence_score', models.FloatField(default=0)),
+                ('history_days', models.IntegerField(default=0)),
+                ('suggested_restock_date', models.DateField()),
+                ('computed_at', models.DateTimeField()),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='demand_forecast', to='inventory_api.product')),
+            ],
+            options={
+                'ordering': ['product'],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.20 on 2026-10-16 23:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Movements linked per pass
+BATCH = 5000
+
+
+def link_sale_items(apps, schema_editor):
+    """
+    Link the movements sales wrote (notes 'Sale #<id>') to their items: in
+    id order, each to the next item of its sale with the same product, the
+    last such item once they are used up (edits used to write another
+    movement), or else any item of the sale (its product was changed).
+    Movements of sales with no items left stay unlinked.
+    """
+    StockMovement = apps.get_model('inventory_api', 'StockMovement')
+    SaleItem = apps.get_model('inventory_api', 'SaleItem')
+
+    used = {}
+    after = 0
+    while True:
+        movements = list(StockMovement.objects.filter(
+            id__gt=after, movement_type='out', reason='sale',
+            notes__startswith='Sale #', sale_item__isnull=True,
+        ).only('id', 'product_id', 'notes').order_by('id')[:BATCH])
+        if not movements:
+            return
+        after = movements[-1].id
+        sale_ids = {}
+        for movement in movements:
+            try:
+                sale_ids[movement.id] = int(movement.notes[len('Sale #'):].split()[0])
+            except (IndexError, ValueError):
+                pass
+        items = {}
+        for item_id, sale_id, product_id in SaleItem.objects.filter(
+            sale_id__in=set(sale_ids.values())
+        ).values_list('id', 'sale_id', 'product_id').order_by('id'):
+            items.setdefault((sale_id, product_id), []).append(item_id)
+            items.setdefault((sale_id, None), []).append(item_id)
+        linked = []
+        for movement in movements:
+            sale_id = sale_ids.get(movement.id)
+            candidates = items.get((sale_id, movement.product_id))
+            if candidates:
+                key = (sale_id, movement.product_id)
+                index = used.get(key, 0)
+                used[key] = index + 1
+                movement.sale_item_id = candidates[min(index, len(candidates) - 1)]
+            elif items.get((sale_id, None)):
+                movement.sale_item_id = items[(sale_id, None)][0]
+            else:
+                continue
+            linked.append(movement)
+        StockMovement.objects.bulk_update(linked, ['sale_item'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0028_demand_forecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='sale_item',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='stock_movements', to='inventory_api.saleitem'),
+        ),
+        migrations.RunPython(link_sale_items, migrations.RunPython.noop),
+    ]
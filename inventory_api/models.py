@@ -1,6 +1,11 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 # Customer model for loyal/credit customers
@@ -102,6 +107,10 @@ class Product(models.Model):
     quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     cost_price = models.DecimalField(max_digits=10, decimal_places=2)
+    stock_shards = models.PositiveSmallIntegerField(
+        default=0,
+        help_text=_('Number of stock counter shards; 0 keeps stock on the product row')
+    )
     
     # Relationships
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
@@ -118,6 +127,39 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [models.Index(fields=['created_at', 'id'], name='product_created_id_idx')]
+
+
+class ProductBarcode(models.Model):
+    """A scannable barcode for a product, in addition to its SKU"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='barcodes')
+    code = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.code} -> {self.product_id}"
+
+    class Meta:
+        ordering = ['code']
+
+
+class ProductStockShard(models.Model):
+    """
+    One slice of a hot product's stock.
+
+    Sales decrement a single shard so concurrent checkouts lock different
+    rows; Product.quantity is kept as a periodically refreshed rollup.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shard_rows')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+
+    def __str__(self):
+        return f"{self.product_id}#{self.shard}: {self.quantity}"
+
+    class Meta:
+        unique_together = ('product', 'shard')
+        ordering = ['product', 'shard']
 
 
 class StockMovement(models.Model):
@@ -140,21 +182,73 @@ class StockMovement(models.Model):
     quantity = models.IntegerField()
     reason = models.CharField(max_length=20, choices=REASON_CHOICES)
     notes = models.TextField(blank=True)
+    # Prices when the stock moved (the sale price for sale lines), so
+    # analytics neither join Product nor change when its prices do
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    # The sale item this movement takes out of stock, if any. The id is
+    # kept when the item is deleted, so that the movement is never taken
+    # for a sale line of its own (see rollups.py).
+    sale_item = models.ForeignKey(
+        'SaleItem', on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='stock_movements'
+    )
     # Timestamps and audit
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
+    @property
+    def stock_effect(self):
+        """Signed change this movement makes to product quantity"""
+        return self.quantity if self.movement_type == 'in' else -self.quantity
+
     def save(self, *args, **kwargs):
-        """Update product quantity on stock movement"""
-        if self.movement_type == 'in':
-            self.product.quantity += self.quantity
-        else:
-            self.product.quantity = max(0, self.product.quantity - self.quantity)
-        self.product.save()
-        super().save(*args, **kwargs)
+        """
+        Update product quantity on stock movement.
+
+        Stock is changed with atomic conditional UPDATEs; taking a product
+        below zero raises stock.InsufficientStock. Editing a movement applies
+        only the difference to what it previously recorded. Sale lines of
+        their own are added to the daily sales rollup (see rollups.py).
+        Prices not given are taken from the product.
+        """
+        from . import rollups
+        from .stock import adjust_stock
+
+        if self.unit_price is None:
+            self.unit_price = self.product.unit_price
+        if self.unit_cost is None:
+            self.unit_cost = self.product.cost_price
+        with transaction.atomic():
+            if self._state.adding:
+                quantity = adjust_stock(self.product_id, self.stock_effect)
+                super().save(*args, **kwargs)
+                if rollups.is_rollup_movement(self):
+                    rollups.record_lines([rollups.sale_line(
+                        timezone.localdate(self.created_at), self.product, None,
+                        self.created_by_id, self.quantity, self.unit_price, self.unit_cost
+                    )])
+            else:
+                previous = StockMovement.objects.only(
+                    'product_id', 'movement_type', 'quantity', 'reason', 'sale_item_id'
+                ).get(pk=self.pk)
+                if previous.product_id != self.product_id:
+                    adjust_stock(previous.product_id, -previous.stock_effect)
+                    quantity = adjust_stock(self.product_id, self.stock_effect)
+                else:
+                    quantity = adjust_stock(self.product_id, self.stock_effect - previous.stock_effect)
+                super().save(*args, **kwargs)
+                if rollups.is_rollup_movement(previous) or rollups.is_rollup_movement(self):
+                    rollups.rebuild_product_day(
+                        timezone.localdate(self.created_at), [previous.product_id, self.product_id]
+                    )
+        # Sharded products have no single quantity to report back
+        if quantity is not None and StockMovement.product.is_cached(self):
+            self.product.quantity = quantity
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['created_at', 'id'], name='stockmovement_created_id_idx')]
 
 class Terminal(models.Model):
     """Point of Sale terminal/register"""
@@ -169,6 +263,25 @@ class Terminal(models.Model):
     class Meta:
         ordering = ['name']
 
+class OrderNumberCounter(models.Model):
+    """Fallback order number counter for databases without sequences"""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+class DataVersion(models.Model):
+    """
+    Version number of some derived data, bumped when what it is derived from
+    changes, so that every worker sees the change (see versions.py)
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
 class Sale(models.Model):
     """Track sales transactions"""
     STATUS_CHOICES = (
@@ -179,6 +292,10 @@ class Sale(models.Model):
     
 
     order_number = models.CharField(max_length=16, unique=True, blank=True, null=True)
+    client_uuid = models.UUIDField(
+        unique=True, null=True, blank=True,
+        help_text=_('Id assigned by the terminal, used to ignore replayed offline sales')
+    )
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='paid')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -189,19 +306,93 @@ class Sale(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            import random, string
-            self.order_number = 'PD' + ''.join(random.choices(string.digits, k=6))
+            from .order_numbers import allocate_order_number
+            self.order_number = allocate_order_number()
         super().save(*args, **kwargs)
 
     @property
     def balance_due(self):
         return self.total_amount - self.amount_paid
 
+    @staticmethod
+    def payment_status(amount_paid, total_amount, has_credit):
+        """Status of a sale given what has been paid against it"""
+        if amount_paid >= total_amount:
+            return 'paid'
+        if amount_paid > 0 or has_credit:
+            return 'partial'
+        return 'pending'
+
+    def apply_payment(self, amount, payment_method):
+        """
+        Add one payment to amount_paid and status with a single atomic UPDATE.
+
+        Credit is excluded from amount_paid as it is not "at hand". A sale that
+        is already 'partial' stays at least 'partial', which is how earlier
+        credit payments are accounted for without re-reading them.
+        """
+        paid_delta = Decimal('0') if payment_method == 'credit' else amount
+        new_paid = F('amount_paid') + Value(paid_delta, output_field=models.DecimalField())
+        if payment_method == 'credit':
+            fallback = Value('partial')
+        else:
+            fallback = Case(When(status='partial', then=Value('partial')), default=Value('pending'))
+        Sale.objects.filter(pk=self.pk).update(
+            amount_paid=new_paid,
+            status=Case(
+                When(GreaterThanOrEqual(new_paid, F('total_amount')), then=Value('paid')),
+                When(GreaterThan(new_paid, Value(0)), then=Value('partial')),
+                default=fallback,
+                output_field=models.CharField(),
+            ),
+        )
+        self.refresh_from_db(fields=['amount_paid', 'status'])
+
+    def record_payments(self, payments):
+        """
+        Record several payments for this sale with one lock and one update.
+
+        ``payments`` are unsaved Payment instances; they are bulk-inserted and
+        the sale totals are advanced by their sum in the same transaction.
+        """
+        from .stats_cache import invalidate_on_commit
+
+        with transaction.atomic():
+            locked = Sale.objects.select_for_update().only(
+                'amount_paid', 'status', 'total_amount'
+            ).get(pk=self.pk)
+            amount_paid = locked.amount_paid
+            has_credit = self.payments.filter(payment_method='credit').exists()
+            for payment in payments:
+                payment.sale = self
+                if payment.payment_method == 'credit':
+                    has_credit = True
+                else:
+                    amount_paid += payment.amount
+            payments = Payment.objects.bulk_create(payments)
+            # bulk_create sends no signals; cached payment statistics must still go
+            invalidate_on_commit()
+            self.amount_paid = amount_paid
+            self.status = self.payment_status(amount_paid, locked.total_amount, has_credit)
+            Sale.objects.filter(pk=self.pk).update(amount_paid=self.amount_paid, status=self.status)
+        return payments
+
+    def recalculate_payments(self):
+        """Recompute amount_paid and status from every payment of the sale"""
+        totals = self.payments.aggregate(
+            paid=Sum('amount', filter=~Q(payment_method='credit')),
+            credit_count=Count('id', filter=Q(payment_method='credit')),
+        )
+        self.amount_paid = totals['paid'] or Decimal('0')
+        self.status = self.payment_status(self.amount_paid, self.total_amount, totals['credit_count'] > 0)
+        self.save(update_fields=['amount_paid', 'status'])
+
     def __str__(self):
         return f"Sale #{self.id} - {self.status} by {self.created_by.username if self.created_by else 'Unknown'}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['created_at', 'id'], name='sale_created_id_idx')]
 
 class Payment(models.Model):
     """Track individual payments for a sale"""
@@ -223,30 +414,22 @@ class Payment(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='payments_created', null=True)
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Update sale amount_paid and status
-        sale = self.sale
-        # Exclude credit payments from amount_paid as they are not "at hand"
-        total_paid = sum(p.amount for p in sale.payments.exclude(payment_method='credit'))
-        sale.amount_paid = total_paid
-        
-        # Determine status
-        has_credit = sale.payments.filter(payment_method='credit').exists()
-        
-        if total_paid >= sale.total_amount:
-            sale.status = 'paid'
-        elif total_paid > 0 or has_credit:
-            sale.status = 'partial'
-        else:
-            sale.status = 'pending'
-            
-        sale.save(update_fields=["amount_paid", "status"])
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Update sale amount_paid and status
+            if adding:
+                self.sale.apply_payment(self.amount, self.payment_method)
+            else:
+                # An edited payment may change method or amount, so start over
+                self.sale.recalculate_payments()
 
     def __str__(self):
         return f"Payment of {self.amount} for Sale #{self.sale.id} ({self.payment_method})"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['created_at', 'id'], name='payment_created_id_idx')]
 
 class SaleItem(models.Model):
     """Individual items in a sale"""
@@ -254,17 +437,193 @@ class SaleItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Product cost when sold, taken from the product if not given
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
     
     def save(self, *args, **kwargs):
-        """Create stock movement on sale"""
-        super().save(*args, **kwargs)
-        
-        # Create stock movement
-        StockMovement.objects.create(
-            product=self.product,
-            movement_type='out',
-            quantity=self.quantity,
-            reason='sale',
-            notes=f'Sale #{self.sale.id}',
-            created_by=self.sale.created_by
-        )
\ No newline at end of file
+        """
+        Create stock movement on sale.
+
+        Editing an item updates its movement instead, which applies only the
+        difference to stock (see StockMovement.save).
+        """
+        from . import rollups
+
+        if self.unit_cost is None:
+            self.unit_cost = self.product.cost_price
+        adding = self._state.adding
+        with transaction.atomic():
+            movement = None
+            if not adding:
+                previous_product_id = SaleItem.objects.values_list('product_id', flat=True).get(pk=self.pk)
+                movement = self.stock_movements.order_by('-id').first()
+            super().save(*args, **kwargs)
+
+            if movement is None:
+                # Create stock movement
+                StockMovement.objects.create(
+                    product=self.product,
+                    movement_type='out',
+                    quantity=self.quantity,
+                    reason='sale',
+                    notes=f'Sale #{self.sale.id}',
+                    unit_price=self.unit_price,
+                    unit_cost=self.unit_cost,
+                    sale_item=self,
+                    created_by=self.sale.created_by
+                )
+            else:
+                movement.product = self.product
+                movement.quantity = self.quantity
+                movement.unit_price = self.unit_price
+                movement.unit_cost = self.unit_cost
+                movement.save()
+            day = timezone.localdate(self.sale.created_at)
+            if adding:
+                rollups.record_lines([rollups.sale_line(
+                    day, self.product, self.sale.terminal_id, self.sale.created_by_id,
+                    self.quantity, self.unit_price, self.unit_cost
+                )])
+            else:
+                rollups.rebuild_product_day(day, [previous_product_id, self.product_id])
+
+
+class DailySalesRollup(models.Model):
+    """
+    Units, revenue and cost sold per business day, product, category,
+    terminal and cashier, maintained by rollups.py
+    """
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    # Plain ids with 0 for "none", as the upsert key cannot contain NULLs
+    category_id = models.IntegerField(default=0)
+    terminal_id = models.IntegerField(default=0)
+    user_id = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.date} product {self.product_id}: {self.quantity}"
+
+    class Meta:
+        ordering = ['date', 'product']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'product', 'category_id', 'terminal_id', 'user_id'],
+                name='dailysalesrollup_key'
+            ),
+        ]
+
+
+class ClosedPeriodStats(models.Model):
+    """
+    Statistics of a business day, month or year that has ended, computed
+    once and served from here (see closed_periods.py)
+    """
+    KINDS = (
+        ('sales_day', 'Sales per day'),
+        ('sales_month', 'Sales per month'),
+        ('sales_year', 'Sales per year'),
+        ('cash_day', 'Cash report per day'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    period_start = models.DateField()
+    data = models.JSONField()
+    etag = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.period_start}"
+
+    class Meta:
+        ordering = ['kind', 'period_start']
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'period_start'], name='closedperiodstats_key'),
+        ]
+
+
+class DemandForecast(models.Model):
+    """Latest demand forecast of a product, computed by forecasting.py"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='demand_forecast')
+    forecast_quantity = models.IntegerField(default=0)
+    confidence_score = models.FloatField(default=0)
+    # Days with stock movements in the history window; none means no forecast
+    history_days = models.IntegerField(default=0)
+    suggested_restock_date = models.DateField()
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.product_id}: {self.forecast_quantity}"
+
+    class Meta:
+        ordering = ['product']
+
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a write request sent with an Idempotency-Key header"""
+    STATUS_CHOICES = (
+        ('in_progress', 'In progress'),
+        ('completed', 'Completed'),
+    )
+
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    request_hash = models.CharField(max_length=64)
+    request_path = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    response_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    locked_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+
+class ReportJob(models.Model):
+    """A report computed in the background by the run_report_worker command"""
+    REPORT_TYPES = (
+        ('sales', 'Sales'),
+        ('inventory', 'Inventory'),
+    )
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    report_type = models.CharField(max_length=20, choices=REPORT_TYPES)
+    parameters = models.JSONField(default=dict)
+    watermark = models.CharField(
+        max_length=100, help_text=_('Version of the data the report was requested against')
+    )
+    cache_key = models.CharField(max_length=64, help_text=_('Hash of report type, parameters and watermark'))
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='report_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.report_type} report #{self.id} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'], name='reportjob_status_created_idx')]
+        constraints = [
+            # One live job per report, parameters and data version; failed
+            # jobs may be retried
+            models.UniqueConstraint(
+                fields=['cache_key'], condition=~Q(status='failed'), name='reportjob_live_cache_key'
+            ),
+        ]
@@ -0,0 +1,129 @@
+"""
+Querysets planned from the serializer fields a request will render.
+
+A plan walks the (possibly ?fields=-trimmed) serializer and works out what
+each field reads: plain columns go into ``only()``, forward relations read
+through (``customer.name``) become ``select_related`` joins, and nested
+list serializers become ``Prefetch`` objects with their own plan. A list
+then costs the same number of queries for 10 rows as for 10,000.
+
+Fields whose reads cannot be seen from their ``source`` (method fields,
+model properties) declare them in ``Meta.field_sources``; a field with no
+known source makes the plan load every column instead of guessing.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+class QueryPlan:
+    def __init__(self, model):
+        self.model = model
+        self.columns = {model._meta.pk.name}
+        self.select = set()
+        self.prefetch = {}
+        self.load_all = False
+
+    @classmethod
+    def for_serializer(cls, serializer, model=None):
+        """Plan for everything ``serializer`` renders"""
+        plan = cls(model or serializer.Meta.model)
+        plan.add_serializer(serializer)
+        return plan
+
+    def add_serializer(self, serializer):
+        hints = getattr(serializer.Meta, 'field_sources', {})
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if name in hints:
+                for path in hints[name]:
+                    self.add_path(path)
+                continue
+            child = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(child, serializers.ModelSerializer):
+                self.add_nested(field.source, child)
+            elif field.source == '*':
+                self.load_all = True
+            else:
+                self.add_path(field.source)
+
+    def add_path(self, path):
+        """Account for a dotted attribute path read from each row"""
+        opts = self.model._meta
+        segments = path.split('.')
+        chain = []
+        for index, segment in enumerate(segments):
+            try:
+                field = opts.get_field(segment)
+            except FieldDoesNotExist:
+                # A property or method: its reads are unknown
+                self.load_all = True
+                return
+            lookup = '__'.join(chain + [segment])
+            if field.many_to_many or field.one_to_many or not field.concrete:
+                self.prefetch.setdefault(lookup, lookup)
+                return
+            self.columns.add(lookup)
+            if not field.is_relation or index == len(segments) - 1:
+                return
+            self.select.add(lookup)
+            chain.append(segment)
+            opts = field.related_model._meta
+
+    def add_nested(self, source, serializer):
+        """Prefetch a reverse relation rendered by a nested serializer"""
+        try:
+            field = self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            self.load_all = True
+            return
+        if not field.one_to_many:
+            self.prefetch.setdefault(source, source)
+            return
+
+        back = field.field.name
+        child = QueryPlan(field.related_model)
+        child.columns.add(back)
+        child_hints = getattr(serializer.Meta, 'field_sources', {})
+        for name, child_field in serializer.fields.items():
+            if child_field.write_only:
+                continue
+            for path in child_hints.get(name, [child_field.source]):
+                if path.startswith(back + '.'):
+                    # Prefetched rows point at their parent object, so reads
+                    # through it belong to the parent's plan
+                    self.add_path(path[len(back) + 1:])
+                elif path == '*':
+                    child.load_all = True
+                else:
+                    child.add_path(path)
+        self.prefetch[source] = Prefetch(source, queryset=child.apply(field.related_model._default_manager.all()))
+
+    def apply(self, queryset):
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch.values())
+        if not self.load_all:
+            queryset = queryset.only(*sorted(self.columns))
+        return queryset
+
+
+class PlannedQuerysetMixin:
+    """
+    Viewset mixin that plans read querysets from the serializer fields.
+
+    Writes keep the full queryset, so saving a fetched instance never
+    skips deferred columns such as updated_at.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request is None or self.request.method not in ('GET', 'HEAD'):
+            return queryset
+        plan = QueryPlan.for_serializer(self.get_serializer(), queryset.model)
+        # Columns the paginator reads from the page's boundary rows
+        plan.columns.update(getattr(self.paginator, 'ordering_fields', ()))
+        return plan.apply(queryset)
@@ -0,0 +1,232 @@
+"""
+Report computations and the background job queue that runs them.
+
+Reports are identified by type, parameters and a watermark of the data
+they read, and jobs belong to the user who requested them.
+``request_report`` reuses a queued, running or finished job of the same
+user for the same report instead of computing it again; only a change to the
+underlying data (a new stock movement, an edited or added product) yields
+a new watermark and thus a new job. Jobs are run by the
+``run_report_worker`` management command, which claims them with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so several workers can share the
+queue. A job whose worker died is taken over once it has been running for
+REPORT_JOB_TIMEOUT seconds, up to REPORT_JOB_MAX_ATTEMPTS times.
+"""
+import hashlib
+import json
+import logging
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import columnar, versions
+from .models import Product, ReportJob, SaleItem, StockMovement
+
+logger = logging.getLogger(__name__)
+
+GENERATION = 'reports'
+
+
+class InvalidReport(ValueError):
+    pass
+
+
+def sales_movements(start_date, end_date):
+    """Stock sold in the date range, one row per sale line, for exports"""
+    return StockMovement.objects.filter(
+        movement_type='out',
+        reason='sale',
+        created_at__date__range=[start_date, end_date]
+    )
+
+
+def sales_report(start_date, end_date):
+    """Sales of the date range and per product name, from the columnar store"""
+    start_date, end_date = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    # Jobs run in the report worker, which keeps its own host's store
+    # current; the result is stored under the current watermark
+    columnar.sync()
+    totals = columnar.totals(start_date, end_date)
+    return {
+        'total_sales': totals['revenue'],
+        'total_items': totals['quantity'],
+        'by_product': [
+            {'product__name': row['key'], 'revenue': row['revenue'], 'quantity': row['quantity']}
+            for row in columnar.group_by_name('product', Product, start_date, end_date)
+        ],
+    }
+
+
+def inventory_report():
+    totals = Product.objects.aggregate(
+        total_products=Count('id'),
+        total_value=Sum(F('quantity') * F('cost_price')),
+        low_stock=Count('id', filter=Q(quantity__lte=settings.LOW_STOCK_THRESHOLD)),
+    )
+    return {
+        'total_products': totals['total_products'],
+        'total_value': totals['total_value'] or 0,
+        'low_stock': totals['low_stock'],
+        'by_category': list(Product.objects.values(
+            'category__name'
+        ).annotate(
+            count=Count('id'),
+            value=Sum(F('quantity') * F('cost_price'))
+        ).order_by('category__name')),
+    }
+
+
+REPORTS = {
+    'sales': sales_report,
+    'inventory': inventory_report,
+}
+
+
+def report_parameters(report_type, data):
+    """Validated, canonical parameters of a report request"""
+    if report_type not in REPORTS:
+        raise InvalidReport('Invalid report type')
+    if report_type == 'inventory':
+        return {}
+    try:
+        start_date = date.fromisoformat(str(data.get('start_date')))
+        end_date = date.fromisoformat(str(data.get('end_date')))
+    except ValueError:
+        raise InvalidReport('start_date and end_date are required (YYYY-MM-DD)')
+    if start_date > end_date:
+        raise InvalidReport('start_date must not be after end_date')
+    return {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()}
+
+
+def compute_report(report_type, parameters):
+    """The report as the JSON it is returned and stored as"""
+    data = REPORTS[report_type](**parameters)
+    return json.loads(json.dumps(data, cls=JSONEncoder))
+
+
+def data_watermark(report_type, parameters):
+    """
+    Version of the data a report reads.
+
+    New or edited products move the latest updated_at. Edits and deletions
+    of movements and sale items, deletions of products and sales recorded
+    for days already over bump the 'reports' version (see versions.py).
+    New stock movements (every sale and stock change) raise the highest
+    id, which only counts for the reports that can see them: the inventory
+    report and sales reports whose range reaches today, so a sales report
+    of days that are over keeps its job across new sales. Everything is
+    read from the database, so every worker computes the same watermark.
+    """
+    updated = Product.objects.aggregate(updated=Max('updated_at'))['updated']
+    parts = [updated.isoformat() if updated else '', str(versions.get(GENERATION))]
+    if report_type != 'sales' or date.fromisoformat(parameters['end_date']) >= timezone.localdate():
+        parts.insert(0, str(StockMovement.objects.aggregate(last=Max('id'))['last'] or 0))
+    return ':'.join(parts)
+
+
+def invalidate():
+    """Make every report requested from now on start from fresh data"""
+    versions.bump(GENERATION)
+
+
+def invalidate_on_commit():
+    versions.bump_on_commit(GENERATION)
+
+
+def _on_change(sender, created=False, **kwargs):
+    # Inserts raise the newest id or updated_at instead
+    if not created:
+        invalidate_on_commit()
+
+
+def connect_signals():
+    for model in (SaleItem, StockMovement):
+        post_save.connect(_on_change, sender=model, dispatch_uid=f'reports_{model.__name__}_save')
+    for model in (Product, SaleItem, StockMovement):
+        post_delete.connect(_on_change, sender=model, dispatch_uid=f'reports_{model.__name__}_delete')
+
+
+def cache_key(report_type, parameters, watermark, user=None):
+    payload = json.dumps([report_type, parameters, watermark, user.pk if user else None], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def find_report(report_type, parameters, user=None, watermark=None):
+    """The user's live job for this report at the current (or given) watermark, or None"""
+    key = cache_key(report_type, parameters, watermark or data_watermark(report_type, parameters), user)
+    return ReportJob.objects.exclude(status='failed').filter(cache_key=key).first()
+
+
+def request_report(report_type, parameters, user=None):
+    """
+    Return ``(job, created)``: the user's live job for this report and
+    data, or a newly queued one
+    """
+    watermark = data_watermark(report_type, parameters)
+    job = find_report(report_type, parameters, user, watermark)
+    if job is not None:
+        return job, False
+    try:
+        with transaction.atomic():
+            job = ReportJob.objects.create(
+                report_type=report_type,
+                parameters=parameters,
+                watermark=watermark,
+                cache_key=cache_key(report_type, parameters, watermark, user),
+                requested_by=user,
+            )
+        return job, True
+    except IntegrityError:
+        # Queued by a concurrent request in the meantime
+        return find_report(report_type, parameters, user, watermark), False
+
+
+def claim_job():
+    """Mark the oldest runnable job as running and return it, or None"""
+    while True:
+        now = timezone.now()
+        stale = now - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+        with transaction.atomic():
+            job = ReportJob.objects.select_for_update(skip_locked=True).filter(
+                Q(status='queued') | Q(status='running', started_at__lt=stale)
+            ).order_by('created_at', 'id').first()
+            if job is None:
+                return None
+            if job.attempts >= settings.REPORT_JOB_MAX_ATTEMPTS:
+                job.status = 'failed'
+                job.error = f'Gave up after {job.attempts} attempts'
+                job.finished_at = now
+                job.save(update_fields=['status', 'error', 'finished_at'])
+                continue
+            job.status = 'running'
+            job.started_at = now
+            job.attempts += 1
+            job.save(update_fields=['status', 'started_at', 'attempts'])
+            return job
+
+
+def run_job(job):
+    """Compute a claimed job and store its outcome; returns True on success"""
+    try:
+        result = compute_report(job.report_type, job.parameters)
+        fields = {'status': 'done', 'result': result}
+    except Exception as e:
+        logger.exception('Report job %s failed', job.pk)
+        fields = {'status': 'failed', 'error': str(e) or type(e).__name__}
+    # A job taken over by another worker meanwhile is left to that worker
+    ReportJob.objects.filter(pk=job.pk, status='running', attempts=job.attempts).update(
+        finished_at=timezone.now(), **fields
+    )
+    return fields['status'] == 'done'
+
+
+def purge_jobs():
+    """Delete finished jobs past REPORT_JOB_RETENTION_HOURS; returns how many"""
+    cutoff = timezone.now() - timedelta(hours=settings.REPORT_JOB_RETENTION_HOURS)
+    deleted, _ = ReportJob.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,196 @@
+"""
+Daily sales rollup behind the statistics and report endpoints.
+
+DailySalesRollup holds units, revenue and cost sold per business day
+(TIME_ZONE), product, category, terminal and cashier. Sales add to it in
+the same transaction that records them, with one upsert per checkout
+(``INSERT ... ON CONFLICT DO UPDATE``, which PostgreSQL and SQLite both
+support), so the stats endpoints sum a few rows per day instead of
+re-aggregating every stock movement of the period.
+
+A sale line is either a SaleItem (checkouts) or a stock-out movement with
+reason 'sale' and no ``sale_item`` (quick sales and manual stock-outs),
+each priced at the unit price and cost recorded on it. Stock-outs for
+other reasons (damage, adjustments, ...) are not sales: the stats and
+report endpoints used to count every stock-out movement, at the product's
+current prices, so their figures for periods with such movements are
+lower than before. Edits and deletions
+re-aggregate the affected day and product from those rows with
+``rebuild``, which the ``rebuild_sales_rollup`` command also uses for
+backfills. Rebuilt rows take the product's current category. A rebuild
+also has the columnar store (columnar.py) rewritten.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from . import columnar, reports, stats_cache
+from .models import DailySalesRollup, Sale, SaleItem, StockMovement
+
+KEY_COLUMNS = ('date', 'product_id', 'category_id', 'terminal_id', 'user_id')
+VALUE_COLUMNS = ('quantity', 'revenue', 'cost')
+
+# Rows per upsert statement
+_UPSERT_BATCH = 500
+# Days re-aggregated per pass of a rebuild
+_REBUILD_DAYS = 7
+
+_CENT = Decimal('0.01')
+
+
+def sale_line(day, product, terminal_id, user_id, quantity, unit_price, unit_cost):
+    """One rollup row for ``quantity`` of ``product`` sold at ``unit_price``"""
+    return (
+        day, product.pk, product.category_id or 0, terminal_id or 0, user_id or 0,
+        quantity, quantity * unit_price, quantity * unit_cost,
+    )
+
+
+def is_rollup_movement(movement):
+    """Whether a stock movement is a sale line of its own, not one of a SaleItem"""
+    return (
+        movement.movement_type == 'out'
+        and movement.reason == 'sale'
+        and movement.sale_item_id is None
+    )
+
+
+def record_lines(lines):
+    """
+    Add sale lines (tuples from ``sale_line``) to the rollup.
+
+    Lines with the same key are summed first and rows are written in key
+    order, so concurrent checkouts lock rollup rows in the same order.
+    """
+    totals = {}
+    for line in lines:
+        key, values = line[:5], line[5:]
+        current = totals.get(key)
+        totals[key] = values if current is None else tuple(map(sum, zip(current, values)))
+    if not totals:
+        return
+    past = [key[0] for key in totals if key[0] < timezone.localdate()]
+    if past:
+        _invalidate_closed(min(past), max(past))
+
+    qn = connection.ops.quote_name
+    table = qn(DailySalesRollup._meta.db_table)
+    columns = KEY_COLUMNS + VALUE_COLUMNS
+    updates = ', '.join(f'{qn(c)} = {table}.{qn(c)} + EXCLUDED.{qn(c)}' for c in VALUE_COLUMNS)
+    rows = [
+        (connection.ops.adapt_datefield_value(key[0]), *key[1:], quantity,
+         Decimal(revenue).quantize(_CENT), Decimal(cost).quantize(_CENT))
+        for key, (quantity, revenue, cost) in sorted(totals.items())
+    ]
+    placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), _UPSERT_BATCH):
+            batch = rows[start:start + _UPSERT_BATCH]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(qn(c) for c in columns)}) "
+                f"VALUES {', '.join([placeholder] * len(batch))} "
+                f"ON CONFLICT ({', '.join(qn(c) for c in KEY_COLUMNS)}) DO UPDATE SET {updates}",
+                [value for row in batch for value in row]
+            )
+
+
+def _invalidate_closed(start_date, end_date):
+    # Imported here as closed_periods depends on the serializers, which
+    # depend on the checkout and thus on this module
+    from .closed_periods import invalidate_sales
+
+    invalidate_sales(start_date, end_date)
+    # Reports of days that are over are kept across new sales
+    reports.invalidate_on_commit()
+
+
+def _day_bounds(start_date, end_date):
+    """Aware datetimes enclosing the local days from start_date to end_date"""
+    return (
+        timezone.make_aware(datetime.combine(start_date, time.min)),
+        timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min)),
+    )
+
+
+def _source_lines(start_date, end_date, product_ids=None):
+    """Sale lines of the given days re-aggregated from items and movements"""
+    start, end = _day_bounds(start_date, end_date)
+    items = SaleItem.objects.filter(sale__created_at__gte=start, sale__created_at__lt=end)
+    movements = StockMovement.objects.filter(
+        created_at__gte=start, created_at__lt=end, movement_type='out', reason='sale',
+        sale_item__isnull=True,
+    )
+    if product_ids is not None:
+        items = items.filter(product_id__in=product_ids)
+        movements = movements.filter(product_id__in=product_ids)
+
+    items = items.values_list(
+        TruncDate('sale__created_at'), 'product_id',
+        Coalesce('product__category_id', Value(0)),
+        Coalesce('sale__terminal_id', Value(0)),
+        Coalesce('sale__created_by_id', Value(0)),
+    ).annotate(
+        units=Sum('quantity'),
+        total_revenue=Sum(F('quantity') * F('unit_price')),
+        total_cost=Sum(F('quantity') * F('unit_cost')),
+    ).order_by()
+    movements = movements.values_list(
+        TruncDate('created_at'), 'product_id',
+        Coalesce('product__category_id', Value(0)),
+        Value(0),
+        Coalesce('created_by_id', Value(0)),
+    ).annotate(
+        units=Sum('quantity'),
+        total_revenue=Sum(F('quantity') * F('unit_price')),
+        total_cost=Sum(F('quantity') * F('unit_cost')),
+    ).order_by()
+    yield from items
+    yield from movements
+
+
+def rebuild(start_date, end_date, product_ids=None):
+    """
+    Recompute the rollup for the days from start_date to end_date.
+
+    With ``product_ids`` only those products' rows are replaced. Runs in
+    one transaction, a week of days per pass.
+    """
+    with transaction.atomic():
+        stats_cache.invalidate_on_commit()
+        columnar.invalidate_on_commit()
+        _invalidate_closed(start_date, end_date)
+        day = start_date
+        while day <= end_date:
+            last = min(end_date, day + timedelta(days=_REBUILD_DAYS - 1))
+            rows = DailySalesRollup.objects.filter(date__range=[day, last])
+            if product_ids is not None:
+                rows = rows.filter(product_id__in=product_ids)
+            rows.delete()
+            record_lines(_source_lines(day, last, product_ids))
+            day = last + timedelta(days=1)
+
+
+def rebuild_product_day(day, product_ids):
+    """Recompute one day of the rollup for some products"""
+    rebuild(day, day, product_ids=set(product_ids))
+
+
+def _sale_item_deleted(sender, instance, **kwargs):
+    created_at = Sale.objects.filter(pk=instance.sale_id).values_list('created_at', flat=True).first()
+    if created_at is not None:
+        rebuild_product_day(timezone.localdate(created_at), [instance.product_id])
+
+
+def _movement_deleted(sender, instance, **kwargs):
+    if is_rollup_movement(instance):
+        rebuild_product_day(timezone.localdate(instance.created_at), [instance.product_id])
+
+
+def connect_signals():
+    post_delete.connect(_sale_item_deleted, sender=SaleItem, dispatch_uid='rollups_SaleItem_delete')
+    post_delete.connect(_movement_deleted, sender=StockMovement, dispatch_uid='rollups_StockMovement_delete')
@@ -0,0 +1,167 @@
+"""
+Bulk ingest of sales queued by offline terminals.
+
+A terminal that lost connectivity replays its backlog in one request. Sales
+are read incrementally, validated against one product snapshot shared by
+the whole batch, and written in chunks of SALE_BATCH_CHUNK_SIZE, each in its
+own transaction through the batched checkout engine. Every sale carries a
+``client_uuid`` so a replayed batch reports duplicates instead of selling
+the same basket twice.
+"""
+import json
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError
+from rest_framework import serializers
+
+from .checkout import checkout, checkout_many
+from .models import Sale
+from .serializers import SaleSerializer
+
+
+class _InvalidLine:
+    def __init__(self, line_number):
+        self.line_number = line_number
+
+
+def iter_ndjson(stream):
+    """Yield one decoded sale per non-blank line of an NDJSON stream"""
+    for line_number, line in enumerate(stream or [], 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield _InvalidLine(line_number)
+
+
+def ingest_sales(records, user=None, chunk_size=None, context=None):
+    """
+    Create sales from an iterable of raw sale dicts and return one result per record.
+
+    Results are dicts with the record's ``client_uuid`` and a ``status`` of
+    'created' or 'duplicate' (both with ``id`` and ``order_number``) or
+    'failed' (with ``errors``).
+    """
+    chunk_size = chunk_size or settings.SALE_BATCH_CHUNK_SIZE
+    # One context for the whole batch, so every sale validates against the
+    # same product snapshot and terminals/customers are looked up once
+    context = dict(context or {})
+    context.setdefault('product_snapshot', {})
+    ingested = {}
+
+    results = []
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            results.extend(_ingest_chunk(chunk, user, context, ingested))
+            chunk = []
+    if chunk:
+        results.extend(_ingest_chunk(chunk, user, context, ingested))
+    return results
+
+
+def _created(client_uuid, sale, status='created'):
+    return {
+        'client_uuid': str(client_uuid),
+        'status': status,
+        'id': sale[0] if isinstance(sale, tuple) else sale.id,
+        'order_number': sale[1] if isinstance(sale, tuple) else sale.order_number,
+    }
+
+
+def _failed(client_uuid, errors):
+    return {
+        'client_uuid': str(client_uuid) if client_uuid is not None else None,
+        'status': 'failed',
+        'errors': errors,
+    }
+
+
+def _ingest_chunk(chunk, user, context, ingested):
+    results = [None] * len(chunk)
+    pending = []
+    for index, record in enumerate(chunk):
+        if isinstance(record, _InvalidLine):
+            results[index] = _failed(None, f'Invalid JSON on line {record.line_number}')
+            continue
+        if not isinstance(record, dict):
+            results[index] = _failed(None, 'Each sale must be a JSON object')
+            continue
+        try:
+            client_uuid = uuid.UUID(str(record.get('client_uuid')))
+        except ValueError:
+            results[index] = _failed(record.get('client_uuid'), {'client_uuid': ['A valid UUID is required.']})
+            continue
+        serializer = SaleSerializer(data=record, context=context)
+        if not serializer.is_valid():
+            results[index] = _failed(client_uuid, serializer.errors)
+            continue
+        pending.append((index, client_uuid, serializer.validated_data))
+
+    ingested.update({
+        client_uuid: (sale_id, order_number)
+        for client_uuid, sale_id, order_number in Sale.objects.filter(
+            client_uuid__in=[client_uuid for _, client_uuid, _ in pending]
+        ).values_list('client_uuid', 'id', 'order_number')
+    })
+
+    entries = []
+    repeats = []
+    queued = set()
+    for index, client_uuid, validated_data in pending:
+        if client_uuid in ingested:
+            results[index] = _created(client_uuid, ingested[client_uuid], status='duplicate')
+            continue
+        if client_uuid in queued:
+            repeats.append((index, client_uuid))
+            continue
+        queued.add(client_uuid)
+        sale_data = dict(validated_data)
+        items_data = sale_data.pop('items')
+        payments_data = sale_data.pop('payments', [])
+        sale_data['created_by'] = user
+        sale_data['client_uuid'] = client_uuid
+        entries.append((index, (sale_data, items_data, payments_data)))
+
+    try:
+        outcomes = checkout_many([entry for _, entry in entries], user=user)
+    except (IntegrityError, serializers.ValidationError):
+        # Something only detectable at write time (a sharded product running
+        # out, a sale replayed concurrently): isolate it sale by sale
+        outcomes = [_checkout_one(entry, user) for _, entry in entries]
+
+    for (index, (sale_data, _, _)), (sale, error) in zip(entries, outcomes):
+        client_uuid = sale_data['client_uuid']
+        if sale is None and error == 'duplicate':
+            existing = Sale.objects.values_list('id', 'order_number').get(client_uuid=client_uuid)
+            ingested[client_uuid] = existing
+            results[index] = _created(client_uuid, existing, status='duplicate')
+        elif sale is None:
+            results[index] = _failed(client_uuid, error)
+        else:
+            ingested[client_uuid] = (sale.id, sale.order_number)
+            results[index] = _created(client_uuid, sale)
+
+    # A uuid repeated within the chunk shares the outcome of its first copy
+    for index, client_uuid in repeats:
+        if client_uuid in ingested:
+            results[index] = _created(client_uuid, ingested[client_uuid], status='duplicate')
+        else:
+            results[index] = _failed(client_uuid, 'An earlier copy of this sale in the batch failed')
+    return results
+
+
+def _checkout_one(entry, user):
+    sale_data, items_data, payments_data = entry
+    try:
+        return checkout(sale_data, items_data, payments_data, user=user), None
+    except serializers.ValidationError as e:
+        return None, e.detail
+    except IntegrityError:
+        if Sale.objects.filter(client_uuid=sale_data['client_uuid']).exists():
+            return None, 'duplicate'
+        raise
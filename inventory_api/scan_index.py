@@ -0,0 +1,131 @@
+"""
+In-memory barcode/SKU index for the POS scan endpoint.
+
+Each worker process keeps a dict from every SKU and barcode to the
+product's scan payload, so a scan is a dict lookup with no database query.
+The index is rebuilt (two queries) when:
+
+- a product, barcode or category is saved or deleted in this process
+  (signals drop it straight away);
+- another process bumped the 'scan_index' version in the database (see
+  versions.py), which is checked at most every SCAN_INDEX_CHECK_INTERVAL
+  seconds;
+- it is older than SCAN_INDEX_MAX_AGE seconds, which bounds staleness
+  when products were changed with queryset.update().
+
+Stock levels are deliberately not in the index: they change with every
+sale and are checked at checkout.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from rest_framework import serializers
+
+from . import versions
+from .models import Category, Product, ProductBarcode
+
+GENERATION = 'scan_index'
+
+_price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class _ScanIndex:
+    def __init__(self):
+        self.codes = None
+        self.generation = None
+        self.built_at = 0.0
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+
+_index = _ScanIndex()
+
+
+def normalize(code):
+    return code.strip()
+
+
+def _build():
+    entries = {}
+    codes = {}
+    for product in Product.objects.values(
+        'id', 'name', 'sku', 'unit_price', 'category_id', 'category__name'
+    ).order_by():
+        entry = {
+            'id': product['id'],
+            'name': product['name'],
+            'sku': product['sku'],
+            'unit_price': _price_field.to_representation(product['unit_price']),
+            'category': product['category_id'],
+            'category_name': product['category__name'],
+            'barcodes': [],
+        }
+        entries[product['id']] = entry
+        codes[normalize(product['sku'])] = entry
+
+    for code, product_id in ProductBarcode.objects.values_list('code', 'product_id').order_by('code'):
+        entry = entries.get(product_id)
+        if entry is not None:
+            entry['barcodes'].append(code)
+            # An SKU wins over a barcode with the same text
+            codes.setdefault(normalize(code), entry)
+    return codes
+
+
+def _current():
+    now = time.monotonic()
+    index = _index
+    # Read once: invalidate() may drop the index from another thread
+    codes = index.codes
+    if codes is not None and now - index.built_at < settings.SCAN_INDEX_MAX_AGE:
+        if now - index.checked_at < settings.SCAN_INDEX_CHECK_INTERVAL:
+            return codes
+        index.checked_at = now
+        if versions.get(GENERATION) == index.generation:
+            return codes
+
+    with index.lock:
+        # Another thread may have rebuilt it while this one waited
+        codes = index.codes
+        if codes is not None and index.built_at > now:
+            return codes
+        generation = versions.get(GENERATION)
+        codes = _build()
+        index.codes = codes
+        index.generation = generation
+        index.built_at = index.checked_at = time.monotonic()
+        return codes
+
+
+def lookup(code):
+    """Scan payload for a barcode or SKU, or None if nothing matches"""
+    return _current().get(normalize(code))
+
+
+def _drop():
+    _index.codes = None
+
+
+def invalidate():
+    """Drop this worker's index and tell the other workers to drop theirs"""
+    _drop()
+    versions.bump(GENERATION)
+
+
+def invalidate_on_commit():
+    """Invalidate once the current transaction commits, so rebuilds see the change"""
+    transaction.on_commit(_drop)
+    versions.bump_on_commit(GENERATION)
+
+
+def _on_change(sender, **kwargs):
+    invalidate_on_commit()
+
+
+def connect_signals():
+    for model in (Product, ProductBarcode, Category):
+        post_save.connect(_on_change, sender=model, dispatch_uid=f'scan_index_{model.__name__}_save')
+        post_delete.connect(_on_change, sender=model, dispatch_uid=f'scan_index_{model.__name__}_delete')
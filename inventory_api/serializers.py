@@ -8,9 +8,12 @@ class CustomerSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'email', 'phone', 'address', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 from django.contrib.auth.password_validation import validate_password
+from . import scan_index
+from .checkout import checkout, fetch_products
+from .stock import InsufficientStock
 from .models import (
     User, Product, Category, Supplier,
-    StockMovement, Sale, SaleItem, BusinessSettings, Payment, Terminal
+    StockMovement, Sale, SaleItem, BusinessSettings, Payment, Terminal, ProductBarcode, ReportJob
 )
 
 class UserSerializer(serializers.ModelSerializer):
@@ -166,20 +169,112 @@ class SupplierSerializer(serializers.ModelSerializer):
         model = Supplier
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
+def requested_fields(serializer_class, request):
+    """
+    Names of the fields a read request asked for, or None for all of them.
+
+    ``?fields=a,b`` selects fields by name and ``?view=summary`` selects
+    the serializer's Meta.summary_fields; ``?expand=items`` adds fields to
+    either selection. Unknown names are ignored. Writes always use every field.
+    """
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    params = request.query_params
+    if params.get('fields'):
+        selected = {name.strip() for name in params['fields'].split(',')}
+    elif params.get('view') == 'summary' and hasattr(serializer_class.Meta, 'summary_fields'):
+        selected = set(serializer_class.Meta.summary_fields)
+    else:
+        return None
+    selected.update(name.strip() for name in params.get('expand', '').split(','))
+    return selected
+
+
+class SparseFieldsMixin:
+    """Trim a top-level serializer's output to the fields the request asked for"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        root = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if root is not None:
+            # Nested serializers always render in full
+            return fields
+        selected = requested_fields(type(self), self.context.get('request'))
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
+
+
+class BarcodeListField(serializers.ListField):
+    """A product's barcodes as a plain list of codes"""
+    child = serializers.CharField(max_length=64)
+
+    def to_representation(self, value):
+        return [barcode.code for barcode in value.all()]
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     supplier_name = serializers.CharField(source='supplier.name', read_only=True)
+    barcodes = BarcodeListField(required=False)
     
     class Meta:
         model = Product
         fields = (
-            'id', 'name', 'sku', 'description', 'quantity',
+            'id', 'name', 'sku', 'barcodes', 'description', 'quantity',
             'unit_price', 'cost_price', 'category', 'category_name',
-            'supplier', 'supplier_name', 'created_at', 'updated_at'
+            'supplier', 'supplier_name', 'stock_shards', 'created_at', 'updated_at'
         )
-        read_only_fields = ('id', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'stock_shards', 'created_at', 'updated_at')
+        summary_fields = ('id', 'name', 'sku', 'quantity', 'unit_price')
+
+    def validate_barcodes(self, value):
+        codes = [code.strip() for code in value]
+        if len(set(codes)) != len(codes):
+            raise serializers.ValidationError("Barcodes must be unique.")
+        taken = ProductBarcode.objects.filter(code__in=codes)
+        clashing_skus = Product.objects.filter(sku__in=codes)
+        if self.instance:
+            taken = taken.exclude(product=self.instance)
+            clashing_skus = clashing_skus.exclude(pk=self.instance.pk)
+        taken = list(taken.values_list('code', flat=True)) + list(clashing_skus.values_list('sku', flat=True))
+        if taken:
+            raise serializers.ValidationError(f"Already used by another product: {', '.join(sorted(taken))}")
+        return codes
 
-class StockMovementSerializer(serializers.ModelSerializer):
+    def create(self, validated_data):
+        barcodes = validated_data.pop('barcodes', None)
+        product = super().create(validated_data)
+        if barcodes is not None:
+            self._set_barcodes(product, barcodes)
+        return product
+
+    def update(self, instance, validated_data):
+        barcodes = validated_data.pop('barcodes', None)
+        product = super().update(instance, validated_data)
+        if barcodes is not None:
+            self._set_barcodes(product, barcodes)
+        return product
+
+    def _set_barcodes(self, product, codes):
+        existing = set(product.barcodes.values_list('code', flat=True))
+        product.barcodes.exclude(code__in=codes).delete()
+        ProductBarcode.objects.bulk_create([
+            ProductBarcode(product=product, code=code) for code in codes if code not in existing
+        ])
+        # bulk_create sends no signals; the scan index must still see the new codes
+        scan_index.invalidate_on_commit()
+        # Drop any barcodes prefetched before the change
+        getattr(product, '_prefetched_objects_cache', {}).pop('barcodes', None)
+
+    def validate_quantity(self, value):
+        """Sharded stock can only change through stock movements"""
+        if self.instance and self.instance.stock_shards and value != self.instance.quantity:
+            raise serializers.ValidationError(
+                "Stock for this product is sharded; record a stock movement to change it."
+            )
+        return value
+
+class StockMovementSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     
@@ -187,16 +282,25 @@ class StockMovementSerializer(serializers.ModelSerializer):
         model = StockMovement
         fields = (
             'id', 'product', 'product_name', 'movement_type',
-            'quantity', 'reason', 'notes',
+            'quantity', 'reason', 'notes', 'unit_price', 'unit_cost',
             'created_at', 'created_by', 'created_by_username'
         )
-        read_only_fields = ('id', 'created_at', 'created_by')
+        read_only_fields = ('id', 'unit_price', 'unit_cost', 'created_at', 'created_by')
 
     def create(self, validated_data):
         request = self.context.get('request')
         if request and request.user:
             validated_data['created_by'] = request.user
-        return super().create(validated_data)
+        try:
+            return super().create(validated_data)
+        except InsufficientStock as e:
+            raise serializers.ValidationError(str(e))
+
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except InsufficientStock as e:
+            raise serializers.ValidationError(str(e))
 
 # Statistics Serializers
 class DailyStatsSerializer(serializers.Serializer):
@@ -215,6 +319,10 @@ class MonthlyStatsSerializer(serializers.Serializer):
     items_sold = serializers.IntegerField()
     growth_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
 
+class YearlyStatsSerializer(MonthlyStatsSerializer):
+    month = None
+    year = serializers.DateField()
+
 class AIForecastSerializer(serializers.Serializer):
     product_id = serializers.IntegerField()
     forecast_quantity = serializers.IntegerField()
@@ -238,6 +346,7 @@ class SaleItemSerializer(serializers.ModelSerializer):
             'unit_price', 'total_price'
         )
         read_only_fields = ('id', 'product', 'total_price')
+        field_sources = {'total_price': ('quantity', 'unit_price')}
         extra_kwargs = {
             'product': {'required': False}  # Make product not required since we'll use product_id
         }
@@ -251,20 +360,25 @@ class SaleItemSerializer(serializers.ModelSerializer):
         
         product_id = data.get('product_id')
         if product_id:
-            try:
-                product = Product.objects.get(id=product_id)
-                data['product'] = product
-                
-                # Check if requested quantity is available
-                if data['quantity'] > product.quantity:
-                    raise serializers.ValidationError(
-                        f"Insufficient stock for product {product.name}. Available: {product.quantity}"
-                    )
-            except Product.DoesNotExist:
+            # SaleSerializer loads every product of the basket up front
+            products = self.context.get('product_snapshot')
+            if products is not None:
+                product = products.get(product_id)
+            else:
+                product = Product.objects.filter(id=product_id).first()
+            if product is None:
                 raise serializers.ValidationError(f"Product with ID {product_id} does not exist")
+            data['product'] = product
+            
+            # Check if requested quantity is available; a sharded product's
+            # quantity is only a rollup, so checkout checks its shards instead
+            if not product.stock_shards and data['quantity'] > product.quantity:
+                raise serializers.ValidationError(
+                    f"Insufficient stock for product {product.name}. Available: {product.quantity}"
+                )
         return data
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by_username = serializers.SerializerMethodField()
     customer_name = serializers.SerializerMethodField()
     
@@ -276,6 +390,10 @@ class PaymentSerializer(serializers.ModelSerializer):
             'customer_name'
         )
         read_only_fields = ('id', 'sale', 'created_at', 'created_by')
+        field_sources = {
+            'created_by_username': ('created_by.username',),
+            'customer_name': ('sale.customer.name',),
+        }
 
     def get_created_by_username(self, obj):
         return obj.created_by.username if obj.created_by else 'System'
@@ -285,14 +403,28 @@ class PaymentSerializer(serializers.ModelSerializer):
             return obj.sale.customer.name
         return None
 
-class SaleSerializer(serializers.ModelSerializer):
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that remembers the instances it resolved in the
+    serializer context, so validating many sales with one context looks up
+    each terminal or customer once
+    """
+    def to_internal_value(self, data):
+        cache = self.context.setdefault('related_cache', {})
+        key = (self.get_queryset().model, str(data))
+        if key not in cache:
+            cache[key] = super().to_internal_value(data)
+        return cache[key]
+
+class SaleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = SaleItemSerializer(many=True)
     payments = PaymentSerializer(many=True, required=False)
     created_by_username = serializers.SerializerMethodField()
+    terminal = CachedPrimaryKeyRelatedField(queryset=Terminal.objects.all(), required=False, allow_null=True)
     terminal_name = serializers.CharField(source='terminal.name', read_only=True)
     balance_due = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     customer_name = serializers.CharField(source='customer.name', read_only=True, allow_null=True)
-    customer = serializers.PrimaryKeyRelatedField(queryset=Customer.objects.all(), required=False, allow_null=True)
+    customer = CachedPrimaryKeyRelatedField(queryset=Customer.objects.all(), required=False, allow_null=True)
 
     class Meta:
         model = Sale
@@ -303,6 +435,11 @@ class SaleSerializer(serializers.ModelSerializer):
             'items', 'payments'
         )
         read_only_fields = ('id', 'order_number', 'created_at', 'created_by', 'amount_paid', 'status')
+        summary_fields = ('id', 'order_number', 'status', 'total_amount', 'customer', 'customer_name', 'created_at')
+        field_sources = {
+            'created_by_username': ('created_by.username',),
+            'balance_due': ('total_amount', 'amount_paid'),
+        }
 
     def get_created_by_username(self, obj):
         return obj.created_by.username if obj.created_by else 'System'
@@ -312,28 +449,37 @@ class SaleSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("This terminal is inactive.")
         return value
 
+    def to_internal_value(self, data):
+        # Resolve every product of the basket with one query before the
+        # nested item serializers validate their lines against it. A snapshot
+        # already in the context (batch ingest) is reused and extended.
+        product_ids = set()
+        items = data.get('items') if hasattr(data, 'get') else None
+        for item in items if isinstance(items, list) else []:
+            try:
+                product_ids.add(int(item.get('product_id')))
+            except (AttributeError, TypeError, ValueError):
+                continue
+        snapshot = self.context.setdefault('product_snapshot', {})
+        missing = product_ids.difference(snapshot)
+        if missing:
+            snapshot.update(fetch_products(missing))
+        return super().to_internal_value(data)
+
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         payments_data = validated_data.pop('payments', [])
         request = self.context.get('request')
+        user = None
         if request and request.user and request.user.is_authenticated:
-            validated_data['created_by'] = request.user
-        sale = Sale.objects.create(**validated_data)
-        for item_data in items_data:
-            SaleItem.objects.create(sale=sale, **item_data)
-        # Only record up to the total amount as payment (excess is not recorded, only shown as change)
-        total_to_record = sale.total_amount
-        for payment_data in payments_data:
-            if total_to_record <= 0:
-                break
-            payment_data['sale'] = sale
-            # Automatically assign the same terminal as the sale if not provided
-            if not payment_data.get('terminal'):
-                payment_data['terminal'] = sale.terminal
-            if request and request.user and request.user.is_authenticated:
-                payment_data['created_by'] = request.user
-            payment_amount = min(payment_data['amount'], total_to_record)
-            payment_data['amount'] = payment_amount
-            Payment.objects.create(**payment_data)
-            total_to_record -= payment_amount
-        return sale
+            user = request.user
+            validated_data['created_by'] = user
+        # Only up to the total amount is recorded as payment (excess is only shown as change)
+        return checkout(validated_data, items_data, payments_data, user=user)
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportJob
+        fields = ['id', 'report_type', 'parameters', 'status', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
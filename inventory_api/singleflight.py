@@ -0,0 +1,139 @@
+"""
+Single-flight coalescing of identical expensive computations.
+
+When a dozen dashboards ask for the same analytics at the same moment,
+only one request computes them and the others wait for and share its
+result. Within a worker process, waiting requests block on the leader's
+thread event. Across workers, the leader holds a lock in the shared cache
+and publishes its result there; requests in other workers poll for it
+every SINGLEFLIGHT_POLL_INTERVAL seconds. Cross-worker coalescing needs a
+cache all workers share (Redis, when REDIS_URL is set, as render.yaml
+does); with a per-process cache such as the default LocMemCache it is
+not attempted and calls are only coalesced within a worker.
+
+A request that has waited SINGLEFLIGHT_TIMEOUT seconds, or whose leader
+failed, computes the result itself. Per-name counts of calls and of calls
+that were coalesced are kept in the cache for ``coalescing_stats`` and the
+``singleflight_stats`` command, which reads them from the shared cache
+only.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+KEY_PREFIX = 'inventory_api:singleflight'
+
+_lock = threading.Lock()
+_flights = {}
+_MISSING = object()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = _MISSING
+
+
+def shared_cache():
+    """Whether the default cache is one all workers see"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _count(name, coalesced):
+    keys = [f'{KEY_PREFIX}:{name}:calls'] + ([f'{KEY_PREFIX}:{name}:coalesced'] if coalesced else [])
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+
+def _published(lock_key, token):
+    entry = cache.get(f'{lock_key}:{token}')
+    return _MISSING if entry is None else entry[0]
+
+
+def _across_workers(lock_key, compute):
+    """Compute under the shared cache lock, or wait for the worker holding it"""
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_TIMEOUT
+    while time.monotonic() < deadline:
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, timeout=settings.SINGLEFLIGHT_TIMEOUT):
+            try:
+                result = compute()
+                # Wrapped, so that a None result is told apart from no result
+                cache.set(f'{lock_key}:{token}', (result,), timeout=settings.SINGLEFLIGHT_TIMEOUT)
+                return result, False
+            finally:
+                cache.delete(lock_key)
+
+        leader = cache.get(lock_key)
+        while leader is not None and time.monotonic() < deadline:
+            result = _published(lock_key, leader)
+            if result is not _MISSING:
+                return result, True
+            if cache.get(lock_key) != leader:
+                # Finished, or failed; a result is published before the lock goes
+                result = _published(lock_key, leader)
+                if result is not _MISSING:
+                    return result, True
+                break
+            time.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+    return compute(), False
+
+
+def do(name, parameters, compute):
+    """
+    Return ``(result, coalesced)``: what ``compute()`` returns, computed
+    once for all concurrent calls with the same name and parameters, and
+    whether this call shared another call's computation
+    """
+    digest = hashlib.sha256(json.dumps(parameters, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    lock_key = f'{KEY_PREFIX}:{name}:{digest}'
+
+    with _lock:
+        flight = _flights.get(lock_key)
+        leader = flight is None
+        if leader:
+            flight = _flights[lock_key] = _Flight()
+
+    if not leader:
+        # Another thread of this worker is computing it
+        flight.done.wait(settings.SINGLEFLIGHT_TIMEOUT)
+        if flight.result is not _MISSING:
+            _count(name, coalesced=True)
+            return flight.result, True
+        _count(name, coalesced=False)
+        return compute(), False
+
+    try:
+        if shared_cache():
+            flight.result, coalesced = _across_workers(lock_key, compute)
+        else:
+            # Other workers cannot see a lock or result kept in this one
+            flight.result, coalesced = compute(), False
+    finally:
+        with _lock:
+            del _flights[lock_key]
+        flight.done.set()
+    _count(name, coalesced)
+    return flight.result, coalesced
+
+
+def coalescing_stats(name):
+    """Calls made under ``name``, how many were coalesced, and their ratio"""
+    calls = cache.get(f'{KEY_PREFIX}:{name}:calls', 0)
+    coalesced = cache.get(f'{KEY_PREFIX}:{name}:coalesced', 0)
+    return {'calls': calls, 'coalesced': coalesced, 'ratio': coalesced / calls if calls else 0.0}
+
+
+def reset_stats(name):
+    cache.delete_many([f'{KEY_PREFIX}:{name}:calls', f'{KEY_PREFIX}:{name}:coalesced'])
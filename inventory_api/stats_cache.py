@@ -0,0 +1,106 @@
+"""
+Shared cache for the statistics endpoints.
+
+Dashboards poll the statistics endpoints far more often than sales come
+in. Results are cached per endpoint, parameters and business date, and
+stamped with the version of the data they were computed from, read from
+the database so that all workers agree on it whatever the cache backend:
+
+- the newest stock movement and payment ids, which every sale and payment
+  raises when it is inserted (checkouts write a movement per line), so
+  the write path pays nothing for them;
+- the 'stats' version (see versions.py), bumped only when sale items,
+  stock movements or payments are edited or deleted, or the rollup is
+  rebuilt.
+
+A change of either makes all cached results stale at once without having
+to know their keys. A transaction that commits after one holding a higher
+id raises neither; results computed in between stay stale until the next
+sale or STATS_CACHE_TIMEOUT.
+
+A stale result is recomputed by the first request that sees it; requests
+arriving while it runs get the stale result instead of queueing behind
+the same queries. The recompute lock expires after
+STATS_CACHE_LOCK_TIMEOUT seconds, so a worker that dies mid-computation
+only delays fresh data. With nothing cached yet, concurrent requests are
+coalesced into one computation (see singleflight.py).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from . import singleflight, versions
+from .models import Payment, Sale, SaleItem, StockMovement
+
+VERSION = 'stats'
+
+
+def _key(endpoint, parameters):
+    digest = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:16]
+    return f'inventory_api:stats:{endpoint}:{timezone.localdate().isoformat()}:{digest}'
+
+
+def data_version():
+    """The version of the data the statistics read"""
+    return (
+        StockMovement.objects.aggregate(last=Max('id'))['last'] or 0,
+        Payment.objects.aggregate(last=Max('id'))['last'] or 0,
+        versions.get(VERSION),
+    )
+
+
+def cached_stats(endpoint, parameters, compute):
+    """
+    Return ``(data, state)``: the statistics ``compute()`` returns for
+    ``endpoint`` and ``parameters`` today, and whether they came from the
+    cache ('hit'), were stale ('stale'), were just computed ('miss') or
+    were computed by a concurrent request ('coalesced')
+    """
+    key = _key(endpoint, parameters)
+    version = data_version()
+    entry = cache.get(key)
+    if entry is not None:
+        entry_version, data = entry
+        if entry_version == version:
+            return data, 'hit'
+        if not cache.add(f'{key}:lock', 1, timeout=settings.STATS_CACHE_LOCK_TIMEOUT):
+            # Another request is already recomputing this result
+            return data, 'stale'
+    try:
+        # Stamped with the version read before computing, so a sale that
+        # commits meanwhile leaves the result stale
+        data, coalesced = singleflight.do(endpoint, key, compute)
+        if not coalesced:
+            cache.set(key, (version, data), timeout=settings.STATS_CACHE_TIMEOUT)
+    finally:
+        if entry is not None:
+            cache.delete(f'{key}:lock')
+    return data, 'coalesced' if coalesced else 'miss'
+
+
+def invalidate():
+    """Mark every cached statistics result stale"""
+    versions.bump(VERSION)
+
+
+def invalidate_on_commit():
+    """Invalidate once the current transaction commits, so recomputes see the change"""
+    versions.bump_on_commit(VERSION)
+
+
+def _on_change(sender, created=False, **kwargs):
+    # Inserts raise the newest ids instead
+    if not created:
+        invalidate_on_commit()
+
+
+def connect_signals():
+    for model in (SaleItem, StockMovement, Payment):
+        post_save.connect(_on_change, sender=model, dispatch_uid=f'stats_cache_{model.__name__}_save')
+    for model in (Sale, SaleItem, StockMovement, Payment):
+        post_delete.connect(_on_change, sender=model, dispatch_uid=f'stats_cache_{model.__name__}_delete')
@@ -0,0 +1,221 @@
+"""
+Atomic stock adjustments.
+
+Stock is never read into Python, changed and written back. Every change is
+a single conditional UPDATE (``quantity = quantity - n WHERE quantity >= n``)
+that returns the new quantity, so concurrent terminals selling the same
+product cannot lose updates and only the quantity column is rewritten.
+
+Hot products (milk, bread) can be split into counter shards: a sale then
+decrements one of N ProductStockShard rows instead of the single Product
+row, and Product.quantity becomes a cached rollup refreshed by
+``refresh_rollups`` (``stock_shards --rollup``, run every minute by the
+cron job in render.yaml). Products are promoted automatically when waits
+for their row alone keep exceeding STOCK_LOCK_WAIT_THRESHOLD_MS.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Product, ProductStockShard
+
+# Slow lock waits are only counted within this many seconds
+CONTENTION_WINDOW = 60
+
+
+class InsufficientStock(Exception):
+    """Raised when a stock decrement would take a product below zero"""
+
+    def __init__(self, product_id, requested, available=None, name=None):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+        self.name = name
+        if name is None:
+            message = f"Product with ID {product_id} does not exist"
+        else:
+            message = f"Insufficient stock for product {name}. Available: {available}"
+        super().__init__(message)
+
+
+def adjust_stock(product_id, delta, shards=None):
+    """
+    Add ``delta`` (negative to remove stock) to a product.
+
+    Returns the new quantity, or None for a sharded product whose total is
+    spread over several rows. ``shards`` may be passed when the caller
+    already knows the product's stock_shards; otherwise an unsharded product
+    is assumed and checked only if the update misses. Raises
+    InsufficientStock instead of letting the quantity go below zero.
+    """
+    shards = shards or _known_shards.get(product_id)
+    if shards:
+        return _adjust_sharded(product_id, delta, shards)
+
+    start = time.perf_counter()
+    quantity = _adjust_row(product_id, delta)
+    record_lock_wait([product_id], time.perf_counter() - start)
+    if quantity is not None:
+        return quantity
+
+    product = Product.objects.filter(pk=product_id).only('name', 'quantity', 'stock_shards').first()
+    if product is None:
+        raise InsufficientStock(product_id, -delta)
+    if product.stock_shards:
+        _known_shards[product_id] = product.stock_shards
+        return _adjust_sharded(product_id, delta, product.stock_shards)
+    raise InsufficientStock(product_id, -delta, product.quantity, product.name)
+
+
+# Products this process has seen in sharded mode, so their sales skip the
+# product row entirely. Entries are dropped when the shards are gone.
+_known_shards = {}
+
+
+def _adjust_row(product_id, delta):
+    """Conditional update of an unsharded product row; None when it did not apply"""
+    # RETURNING is available wherever the backend can return columns from an
+    # INSERT (PostgreSQL, SQLite >= 3.35); otherwise read the value back.
+    if connection.features.can_return_columns_from_insert:
+        table = connection.ops.quote_name(Product._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET quantity = quantity + %s '
+                f'WHERE id = %s AND stock_shards = 0 AND quantity + %s >= 0 RETURNING quantity',
+                [delta, product_id, delta]
+            )
+            row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    updated = Product.objects.filter(
+        pk=product_id, stock_shards=0, quantity__gte=-delta
+    ).update(quantity=F('quantity') + delta)
+    if updated:
+        return Product.objects.values_list('quantity', flat=True).get(pk=product_id)
+    return None
+
+
+def _adjust_sharded(product_id, delta, shards):
+    """Apply ``delta`` to one shard, starting from a random one"""
+    first = random.randrange(shards)
+    if delta >= 0:
+        if not ProductStockShard.objects.filter(
+            product_id=product_id, shard=first
+        ).update(quantity=F('quantity') + delta):
+            # Unsharded since the caller looked
+            _known_shards.pop(product_id, None)
+            return adjust_stock(product_id, delta)
+        return None
+
+    for offset in range(shards):
+        shard = (first + offset) % shards
+        if ProductStockShard.objects.filter(
+            product_id=product_id, shard=shard, quantity__gte=-delta
+        ).update(quantity=F('quantity') + delta):
+            return None
+
+    # No single shard covers the sale: take it from several under one lock
+    with transaction.atomic():
+        rows = list(ProductStockShard.objects.select_for_update().filter(
+            product_id=product_id
+        ).order_by('shard'))
+        if not rows:
+            # Unsharded since the caller looked
+            _known_shards.pop(product_id, None)
+            return adjust_stock(product_id, delta)
+        available = sum(row.quantity for row in rows)
+        if available + delta < 0:
+            name = Product.objects.values_list('name', flat=True).get(pk=product_id)
+            raise InsufficientStock(product_id, -delta, available, name)
+        remaining = -delta
+        for row in rows:
+            taken = min(row.quantity, remaining)
+            row.quantity -= taken
+            remaining -= taken
+        ProductStockShard.objects.bulk_update(rows, ['quantity'])
+    return None
+
+
+def total_stock(product_id):
+    """Live stock of a product, summing its shards if it has any"""
+    product = Product.objects.only('quantity', 'stock_shards').get(pk=product_id)
+    if not product.stock_shards:
+        return product.quantity
+    return ProductStockShard.objects.filter(
+        product_id=product_id
+    ).aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def shard_product(product_id, shards=None):
+    """Split a product's stock over ``shards`` counter rows"""
+    shards = shards or settings.STOCK_SHARD_COUNT
+    with transaction.atomic():
+        product = Product.objects.select_for_update().only('quantity', 'stock_shards').get(pk=product_id)
+        if product.stock_shards:
+            return False
+        base, remainder = divmod(product.quantity, shards)
+        ProductStockShard.objects.bulk_create([
+            ProductStockShard(product_id=product_id, shard=shard, quantity=base + (remainder if shard == 0 else 0))
+            for shard in range(shards)
+        ])
+        Product.objects.filter(pk=product_id).update(stock_shards=shards)
+    return True
+
+
+def unshard_product(product_id):
+    """Fold a sharded product's stock back onto its product row"""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().only('stock_shards').get(pk=product_id)
+        if not product.stock_shards:
+            return False
+        rows = ProductStockShard.objects.select_for_update().filter(product_id=product_id)
+        total = sum(row.quantity for row in rows)
+        rows.delete()
+        Product.objects.filter(pk=product_id).update(quantity=total, stock_shards=0)
+    return True
+
+
+def refresh_rollups():
+    """Copy the sum of every sharded product's shards into Product.quantity"""
+    shard_total = ProductStockShard.objects.filter(
+        product=OuterRef('pk')
+    ).order_by().values('product').annotate(total=Sum('quantity')).values('total')
+    return Product.objects.filter(stock_shards__gt=0).update(quantity=Coalesce(Subquery(shard_total), 0))
+
+
+_contention = {}
+_contention_lock = threading.Lock()
+
+
+def record_lock_wait(product_ids, seconds):
+    """
+    Count a slow stock update against the given products.
+
+    A product whose row keeps being slow to lock is promoted to sharded
+    mode once the surrounding transaction commits.
+    """
+    if not settings.STOCK_SHARD_AUTO_PROMOTE:
+        return
+    if seconds * 1000 < settings.STOCK_LOCK_WAIT_THRESHOLD_MS:
+        return
+
+    now = time.monotonic()
+    hot = []
+    with _contention_lock:
+        for product_id in product_ids:
+            hits = _contention.setdefault(product_id, deque())
+            hits.append(now)
+            while hits and now - hits[0] > CONTENTION_WINDOW:
+                hits.popleft()
+            if len(hits) >= settings.STOCK_SHARD_PROMOTE_AFTER:
+                hot.append(product_id)
+                del _contention[product_id]
+
+    for product_id in hot:
+        transaction.on_commit(lambda product_id=product_id: shard_product(product_id))
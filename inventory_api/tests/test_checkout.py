@@ -0,0 +1,70 @@
+"""Query counts of the checkout endpoint (see checkout.py)"""
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from inventory_api import order_numbers
+from inventory_api.models import Product, Sale, User
+
+
+class CheckoutQueryCountTests(TestCase):
+    LARGE_BASKET = 40
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cashier', role='staff')
+        cls.products = [
+            Product.objects.create(
+                name=f'Product {i}',
+                sku=f'CHECKOUT-{i}',
+                quantity=100,
+                unit_price=Decimal('2.00'),
+                cost_price=Decimal('1.00'),
+            )
+            for i in range(cls.LARGE_BASKET)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # A block of order numbers for this test alone, reserved by the
+        # warm-up checkout, so that no checkout measured reserves one (on
+        # SQLite every checkout reserves its own number instead)
+        allocator = order_numbers.OrderNumberAllocator(block_size=100)
+        patcher = mock.patch.object(order_numbers, 'allocator', allocator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checkout(self, lines):
+        total = Decimal('2.00') * lines
+        response = self.client.post('/api/sales/', {
+            'total_amount': str(total),
+            'items': [
+                {'product_id': product.pk, 'quantity': 1, 'unit_price': '2.00'}
+                for product in self.products[:lines]
+            ],
+            'payments': [{'payment_method': 'cash', 'amount': str(total)}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response
+
+    def test_query_count_does_not_depend_on_basket_size(self):
+        # The first checkout reserves order numbers and warms per-process caches
+        self.checkout(1)
+        with CaptureQueriesContext(connection) as small:
+            self.checkout(1)
+        with self.assertNumQueries(len(small.captured_queries)):
+            self.checkout(self.LARGE_BASKET)
+
+    def test_large_basket_is_written_in_full(self):
+        response = self.checkout(self.LARGE_BASKET)
+        sale = Sale.objects.get(pk=response.data['id'])
+        self.assertEqual(sale.items.count(), self.LARGE_BASKET)
+        self.assertEqual(sale.status, 'paid')
+        self.assertEqual(
+            set(Product.objects.values_list('quantity', flat=True)), {99}
+        )
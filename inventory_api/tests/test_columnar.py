@@ -0,0 +1,64 @@
+"""Columnar store reads (see columnar.py)"""
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from inventory_api import columnar
+from inventory_api.models import Product, User
+
+
+class ColumnarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='manager', role='manager')
+        cls.product = Product.objects.create(
+            name='Bread', sku='BREAD-1', quantity=50, unit_price=Decimal('2.00'), cost_price=Decimal('1.00'),
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = os.path.join(directory.name, 'columnar')
+        settings = override_settings(COLUMNAR_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.today = timezone.localdate()
+
+    def figures(self):
+        return (
+            columnar.totals(self.today, self.today),
+            columnar.group_by('product', self.today, self.today),
+            columnar.group_by_name('product', Product, self.today, self.today),
+        )
+
+    def test_reads_fall_back_to_the_rollup_without_writing_a_store(self):
+        self.product.stockmovement_set.create(
+            movement_type='out', quantity=3, reason='sale', created_by=self.user,
+        )
+        totals, by_product, by_name = self.figures()
+        self.assertEqual(totals, {'quantity': 3, 'revenue': Decimal('6.00'), 'cost': Decimal('3.00')})
+        self.assertEqual(by_product, [{'key': self.product.pk, **totals}])
+        self.assertEqual(by_name, [{'key': 'Bread', **totals}])
+        self.assertFalse(os.path.exists(self.directory))
+
+        # The store gives the same figures once synced
+        expected = self.figures()
+        call_command('sync_columnar', stdout=StringIO())
+        self.assertEqual(self.figures(), expected)
+
+    def test_reads_serve_the_last_sync(self):
+        self.product.stockmovement_set.create(
+            movement_type='out', quantity=3, reason='sale', created_by=self.user,
+        )
+        columnar.sync()
+        self.product.stockmovement_set.create(
+            movement_type='out', quantity=2, reason='sale', created_by=self.user,
+        )
+        self.assertEqual(columnar.totals(self.today, self.today)['quantity'], 3)
+        columnar.sync()
+        self.assertEqual(columnar.totals(self.today, self.today)['quantity'], 5)
@@ -0,0 +1,79 @@
+"""Compiled list rendering against the DRF serializers (see fast_serializers.py)"""
+from decimal import Decimal
+
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from inventory_api.fast_serializers import compile_serializer, serialize_queryset
+from inventory_api.models import Customer, Payment, Product, Sale, StockMovement, Terminal, User
+from inventory_api.serializers import PaymentSerializer, SaleSerializer, StockMovementSerializer
+
+SALE_FIELDS = (
+    'id', 'order_number', 'status', 'total_amount', 'amount_paid', 'terminal', 'terminal_name',
+    'customer', 'customer_name', 'created_at', 'created_by', 'created_by_username',
+)
+
+
+class FastSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='cashier', role='staff')
+        customer = Customer.objects.create(name='Regular')
+        terminal = Terminal.objects.create(name='Till 1')
+        product = Product.objects.create(
+            name='Bread', sku='BREAD-1', quantity=50, unit_price=Decimal('2.5'), cost_price=Decimal('1.05'),
+        )
+        # One sale with every relation set, one with none (created by 'System')
+        sales = [
+            Sale.objects.create(
+                total_amount=Decimal('1234.5'), status='pending', terminal=terminal,
+                customer=customer, created_by=user,
+            ),
+            Sale.objects.create(total_amount=Decimal('0.05'), status='pending'),
+        ]
+        for sale, created_by in zip(sales, (user, None)):
+            Payment.objects.create(
+                sale=sale, payment_method='cash', amount=Decimal('0.5'), created_by=created_by,
+                terminal=sale.terminal,
+            )
+            Payment.objects.create(sale=sale, payment_method='credit', amount=Decimal('1000'))
+        StockMovement.objects.create(
+            product=product, movement_type='out', quantity=3, reason='sale', created_by=user,
+        )
+        StockMovement.objects.create(
+            product=product, movement_type='in', quantity=10, reason='purchase',
+            unit_price=Decimal('2.499'), unit_cost=Decimal('1'), notes='',
+        )
+
+    def assertRendersAlike(self, serializer_class, queryset, expected, field_names=None):
+        self.assertIsNotNone(compile_serializer(serializer_class, field_names))
+        fast = serialize_queryset(serializer_class, queryset, field_names)
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+
+    def test_payments(self):
+        queryset = Payment.objects.select_related('created_by', 'sale__customer').order_by('id')
+        expected = PaymentSerializer(queryset, many=True).data
+        self.assertEqual(
+            [payment['created_by_username'] for payment in expected], ['cashier', 'System', 'System', 'System']
+        )
+        self.assertEqual(expected[0]['amount'], '0.50')
+        self.assertRendersAlike(PaymentSerializer, queryset, expected)
+
+    def test_stock_movements(self):
+        queryset = StockMovement.objects.select_related('product', 'created_by').order_by('id')
+        expected = StockMovementSerializer(queryset, many=True).data
+        # Left out, as DRF does, where there is no user
+        self.assertNotIn('created_by_username', expected[1])
+        self.assertEqual(expected[1]['created_by'], None)
+        self.assertRendersAlike(StockMovementSerializer, queryset, expected)
+
+    def test_sale_summaries(self):
+        queryset = Sale.objects.select_related('created_by', 'customer', 'terminal').order_by('id')
+        request = Request(APIRequestFactory().get('/api/sales/', {'fields': ','.join(SALE_FIELDS)}))
+        expected = SaleSerializer(queryset, many=True, context={'request': request}).data
+        self.assertEqual(expected[0]['total_amount'], '1234.50')
+        self.assertEqual(expected[1]['created_by_username'], 'System')
+        self.assertEqual(expected[1]['customer_name'], None)
+        self.assertRendersAlike(SaleSerializer, queryset, expected, SALE_FIELDS)
@@ -0,0 +1,118 @@
+"""Idempotency-Key replay of write endpoints (see idempotency.py)"""
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from inventory_api import idempotency
+from inventory_api.models import IdempotencyKey, Product, Sale, User
+
+
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cashier', role='staff')
+        cls.product = Product.objects.create(
+            name='Bread', sku='BREAD-1', quantity=50, unit_price=Decimal('2.00'), cost_price=Decimal('1.00'),
+        )
+
+    def setUp(self):
+        # Completed responses are kept per process across tests otherwise
+        idempotency._responses.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sale(self, quantity=1, key='retry-1'):
+        total = str(Decimal('2.00') * quantity)
+        return self.client.post('/api/sales/', {
+            'total_amount': total,
+            'items': [{'product_id': self.product.pk, 'quantity': quantity, 'unit_price': '2.00'}],
+            'payments': [{'payment_method': 'cash', 'amount': total}],
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def key_row(self, **fields):
+        now = timezone.now()
+        return IdempotencyKey.objects.create(**{
+            'user': self.user, 'key': 'retry-1', 'request_hash': '0' * 64, 'request_path': '/api/sales/',
+            'locked_at': now, 'expires_at': now + timedelta(hours=1), **fields,
+        })
+
+    def test_retry_replays_the_first_response(self):
+        first = self.sale()
+        self.assertEqual(first.status_code, 201, first.content)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        retry = self.sale()
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        # From the table, as another worker would see it
+        idempotency._responses.clear()
+        retry = self.sale()
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self.assertEqual(self.sale().status_code, 201)
+        response = self.sale(quantity=2)
+        self.assertEqual(response.status_code, 422)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+        idempotency._responses.clear()
+        self.assertEqual(self.sale(quantity=2).status_code, 422)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_retry_while_the_first_attempt_is_in_flight(self):
+        retries = []
+        store = idempotency._store
+
+        def retry_then_store(row, response):
+            # The sale is written but its response not stored yet
+            retries.append(self.sale())
+            return store(row, response)
+
+        with mock.patch.object(idempotency, '_store', retry_then_store):
+            first = self.sale()
+        self.assertEqual(first.status_code, 201, first.content)
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(self.sale().json(), first.json())
+
+    def test_abandoned_attempt_is_taken_over(self):
+        # The worker holding the key died mid-request
+        self.key_row(status='in_progress', locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.sale().status_code, 201)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().status, 'completed')
+
+    def test_expired_keys_are_purged_and_reusable(self):
+        past = timezone.now() - timedelta(minutes=1)
+        self.key_row(status='completed', response_code=201, response_body={}, expires_at=past)
+        self.key_row(key='retry-2', status='completed', response_code=201, response_body={})
+
+        # An expired key starts over instead of replaying
+        self.assertEqual(self.sale().status_code, 201)
+        self.assertEqual(Sale.objects.count(), 1)
+
+        IdempotencyKey.objects.filter(key='retry-1').update(expires_at=past)
+        self.assertEqual(idempotency.purge_expired(batch_size=1), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['retry-2'])
+
+    def test_request_fingerprint(self):
+        factory = APIRequestFactory()
+
+        def fingerprint(path, data):
+            request = Request(factory.post(path, data, format='json'), parsers=[JSONParser()])
+            return idempotency.request_fingerprint(request)
+
+        same = fingerprint('/api/sales/', {'a': 1, 'b': '2.00'})
+        self.assertEqual(fingerprint('/api/sales/', {'b': '2.00', 'a': 1}), same)
+        self.assertNotEqual(fingerprint('/api/sales/', {'a': 1, 'b': '2.50'}), same)
+        self.assertNotEqual(fingerprint('/api/payments/', {'a': 1, 'b': '2.00'}), same)
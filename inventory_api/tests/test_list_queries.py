@@ -0,0 +1,37 @@
+"""Query counts of the list endpoints (see query_plans.py and check_list_queries)"""
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from inventory_api.management.commands.check_list_queries import ENDPOINTS, list_request, seed_sales
+from inventory_api.models import User
+
+
+class ListQueryCountTests(TestCase):
+    ROWS = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='lister', role='admin')
+        seed_sales(cls.user, cls.ROWS, 'A')
+
+    def label(self, endpoint):
+        name, _, params = endpoint
+        return f'/{name}/' + (f'?{params}' if params else '')
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        expected = {}
+        for endpoint in ENDPOINTS:
+            # The first request also fills per-process caches
+            list_request(self.user, endpoint)
+            with CaptureQueriesContext(connection) as ctx:
+                response = list_request(self.user, endpoint)
+            self.assertEqual(response.status_code, 200, self.label(endpoint))
+            expected[endpoint] = len(ctx.captured_queries)
+
+        seed_sales(self.user, self.ROWS, 'B')
+        for endpoint in ENDPOINTS:
+            with self.subTest(endpoint=self.label(endpoint)):
+                with self.assertNumQueries(expected[endpoint]):
+                    response = list_request(self.user, endpoint)
+                self.assertEqual(response.status_code, 200)
@@ -0,0 +1,67 @@
+"""Report watermarks (see reports.py)"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from inventory_api import rollups
+from inventory_api.models import Product, StockMovement, User
+from inventory_api.reports import data_watermark
+
+
+class ReportWatermarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='manager', role='manager')
+        cls.product = Product.objects.create(
+            name='Bread', sku='BREAD-1', quantity=50, unit_price=Decimal('2.00'), cost_price=Decimal('1.00'),
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        today = timezone.localdate()
+        self.closed = {'start_date': (today - timedelta(days=7)).isoformat(),
+                       'end_date': (today - timedelta(days=1)).isoformat()}
+        self.open = {'start_date': (today - timedelta(days=7)).isoformat(), 'end_date': today.isoformat()}
+
+    def watermarks(self):
+        return (data_watermark('sales', self.closed), data_watermark('sales', self.open),
+                data_watermark('inventory', {}))
+
+    def checkout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/sales/', {
+                'total_amount': '2.00',
+                'items': [{'product_id': self.product.pk, 'quantity': 1, 'unit_price': '2.00'}],
+                'payments': [{'payment_method': 'cash', 'amount': '2.00'}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_sales_leave_reports_of_past_days_current(self):
+        closed, open_range, inventory = self.watermarks()
+        self.checkout()
+        after = self.watermarks()
+        self.assertEqual(after[0], closed)
+        self.assertNotEqual(after[1], open_range)
+        self.assertNotEqual(after[2], inventory)
+
+    def test_edits_and_past_sales_refresh_reports_of_past_days(self):
+        self.checkout()
+        closed = data_watermark('sales', self.closed)
+        movement = StockMovement.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            movement.notes = 'recounted'
+            movement.save()
+        self.assertNotEqual(data_watermark('sales', self.closed), closed)
+
+        # A sale of yesterday (committed after midnight) lands in the range
+        closed = data_watermark('sales', self.closed)
+        yesterday = timezone.localdate() - timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            rollups.record_lines([rollups.sale_line(
+                yesterday, self.product, None, self.user.pk, 1, Decimal('2.00'), Decimal('1.00'),
+            )])
+        self.assertNotEqual(data_watermark('sales', self.closed), closed)
@@ -0,0 +1,94 @@
+"""Batch ingest of offline terminals' sales (see sale_batches.py)"""
+import json
+import uuid
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from inventory_api.models import Product, Sale, User
+
+
+class SaleBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cashier', role='staff')
+        cls.product = Product.objects.create(
+            name='Bread', sku='BREAD-1', quantity=10, unit_price=Decimal('2.00'), cost_price=Decimal('1.00'),
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sale(self, quantity=1, client_uuid=None):
+        total = str(Decimal('2.00') * quantity)
+        return {
+            'client_uuid': str(client_uuid or uuid.uuid4()),
+            'total_amount': total,
+            'items': [{'product_id': self.product.pk, 'quantity': quantity, 'unit_price': '2.00'}],
+            'payments': [{'payment_method': 'cash', 'amount': total}],
+        }
+
+    def batch(self, sales):
+        response = self.client.post('/api/sales/batch/', sales, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def statuses(self, data):
+        return [result['status'] for result in data['results']]
+
+    def test_uuid_repeated_within_a_batch_is_sold_once(self):
+        sale = self.sale(quantity=2)
+        data = self.batch([sale, self.sale(), sale])
+        self.assertEqual(self.statuses(data), ['created', 'created', 'duplicate'])
+        self.assertEqual(data['results'][2]['id'], data['results'][0]['id'])
+        self.assertEqual(Sale.objects.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 7)
+
+    @override_settings(SALE_BATCH_CHUNK_SIZE=1)
+    def test_uuid_repeated_in_a_later_chunk_is_sold_once(self):
+        sale = self.sale()
+        data = self.batch([sale, sale])
+        self.assertEqual(self.statuses(data), ['created', 'duplicate'])
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_reposted_batch_reports_duplicates(self):
+        sales = [self.sale(), self.sale()]
+        first = self.batch(sales)
+        again = self.batch({'sales': sales})
+        self.assertEqual(self.statuses(again), ['duplicate', 'duplicate'])
+        self.assertEqual(
+            [(result['id'], result['order_number']) for result in again['results']],
+            [(result['id'], result['order_number']) for result in first['results']],
+        )
+        self.assertEqual((again['created'], again['duplicates'], again['failed']), (0, 2, 0))
+        self.assertEqual(Sale.objects.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 8)
+
+    def test_failed_sales_do_not_undo_the_others(self):
+        invalid = self.sale()
+        del invalid['items']
+        data = self.batch([
+            self.sale(),
+            # More than is in stock
+            self.sale(quantity=50),
+            invalid,
+            {'total_amount': '2.00'},
+            self.sale(quantity=2),
+        ])
+        self.assertEqual(self.statuses(data), ['created', 'failed', 'failed', 'failed', 'created'])
+        self.assertEqual((data['created'], data['duplicates'], data['failed']), (2, 0, 3))
+        self.assertEqual(Sale.objects.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 7)
+
+    def test_ndjson_with_a_broken_line(self):
+        sale = self.sale()
+        body = f'{json.dumps(sale)}\n{{not json\n\n'
+        response = self.client.post('/api/sales/batch/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.statuses(response.data), ['created', 'failed'])
+        self.assertEqual(response.data['results'][1]['errors'], 'Invalid JSON on line 2')
@@ -0,0 +1,54 @@
+"""Payments recorded against a sale (see Sale.record_payments)"""
+from decimal import Decimal
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from inventory_api.models import Payment, Sale, User
+
+
+class RecordPaymentsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cashier', role='staff')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.sale = Sale.objects.create(total_amount=Decimal('10.00'), status='pending', created_by=self.user)
+
+    def pay(self, *payments):
+        response = self.client.post(f'/api/sales/{self.sale.pk}/payments/', [
+            {'payment_method': method, 'amount': amount} for method, amount in payments
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.sale.refresh_from_db()
+        return response
+
+    def test_split_tender(self):
+        self.pay(('cash', '4.00'), ('card', '3.00'))
+        self.assertEqual(self.sale.amount_paid, Decimal('7.00'))
+        self.assertEqual(self.sale.status, 'partial')
+
+        response = self.pay(('mpesa', '3.00'))
+        self.assertEqual(self.sale.amount_paid, Decimal('10.00'))
+        self.assertEqual(self.sale.status, 'paid')
+        self.assertEqual(response.data['balance_due'], Decimal('0.00'))
+        self.assertEqual(self.sale.payments.count(), 3)
+
+    def test_credit_and_cash(self):
+        # Credit is owed, not at hand, so it leaves amount_paid alone
+        self.pay(('credit', '6.00'), ('cash', '4.00'))
+        self.assertEqual(self.sale.amount_paid, Decimal('4.00'))
+        self.assertEqual(self.sale.status, 'partial')
+
+        self.pay(('cash', '6.00'))
+        self.assertEqual(self.sale.amount_paid, Decimal('10.00'))
+        self.assertEqual(self.sale.status, 'paid')
+
+    def test_earlier_credit_is_read_from_the_payments(self):
+        # A credit payment written without updating the sale's status
+        Payment.objects.bulk_create([Payment(sale=self.sale, payment_method='credit', amount=Decimal('10.00'))])
+        self.pay(('cash', '0.00'))
+        self.assertEqual(self.sale.amount_paid, Decimal('0.00'))
+        self.assertEqual(self.sale.status, 'partial')
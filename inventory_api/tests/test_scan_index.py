@@ -0,0 +1,30 @@
+"""Barcode scan index (see scan_index.py)"""
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from inventory_api import scan_index, versions
+from inventory_api.models import Product
+
+
+@override_settings(SCAN_INDEX_CHECK_INTERVAL=0)
+class ScanIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Milk', sku='MILK-1', quantity=10, unit_price=Decimal('1.50'), cost_price=Decimal('1.00'),
+        )
+
+    def setUp(self):
+        scan_index.invalidate()
+
+    def test_lookup_by_sku(self):
+        self.assertEqual(scan_index.lookup(' MILK-1 ')['unit_price'], '1.50')
+        self.assertIsNone(scan_index.lookup('NOPE'))
+
+    def test_change_made_by_another_worker_is_seen(self):
+        scan_index.lookup('MILK-1')
+        # Another worker's edit: no signal here, only the shared version moves
+        Product.objects.filter(pk=self.product.pk).update(unit_price=Decimal('1.75'))
+        versions.bump(scan_index.GENERATION)
+        self.assertEqual(scan_index.lookup('MILK-1')['unit_price'], '1.75')
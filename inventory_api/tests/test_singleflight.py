@@ -0,0 +1,56 @@
+"""Single-flight coalescing (see singleflight.py)"""
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from inventory_api import singleflight
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_calls_in_a_worker_share_one_computation(self):
+        started, release = threading.Event(), threading.Event()
+        computed = []
+
+        def compute():
+            computed.append(1)
+            started.set()
+            release.wait(5)
+            return {'total': 1}
+
+        results = {}
+
+        def call(index):
+            results[index] = singleflight.do('test', {'days': 1}, compute)
+
+        leader = threading.Thread(target=call, args=(0,))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call, args=(1,))
+        follower.start()
+        # Give the follower time to find the leader's flight
+        time.sleep(0.2)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(results[0], ({'total': 1}, False))
+        self.assertEqual(results[1], ({'total': 1}, True))
+
+    def test_no_cross_worker_lock_without_a_shared_cache(self):
+        # Tests run on the per-process LocMemCache
+        self.assertFalse(singleflight.shared_cache())
+        with mock.patch.object(singleflight, '_across_workers') as across_workers:
+            self.assertEqual(singleflight.do('test', {'days': 1}, lambda: 1), (1, False))
+        across_workers.assert_not_called()
+
+    def test_stats_need_a_shared_cache(self):
+        with self.assertRaises(CommandError):
+            call_command('singleflight_stats')
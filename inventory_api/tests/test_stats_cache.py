@@ -0,0 +1,65 @@
+"""Statistics cache (see stats_cache.py)"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from inventory_api.models import DataVersion, Payment, Product, StockMovement, User
+
+
+class StatsCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='manager', role='manager')
+        cls.product = Product.objects.create(
+            name='Bread', sku='BREAD-1', quantity=50, unit_price=Decimal('2.00'), cost_price=Decimal('1.00'),
+        )
+
+    def setUp(self):
+        # Ids are reused after each test's rollback, so results cached by
+        # an earlier test could look current
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def daily(self):
+        response = self.client.get('/api/statistics/daily/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def checkout(self, quantity):
+        total = str(Decimal('2.00') * quantity)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/sales/', {
+                'total_amount': total,
+                'items': [{'product_id': self.product.pk, 'quantity': quantity, 'unit_price': '2.00'}],
+                'payments': [{'payment_method': 'cash', 'amount': total}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_sales_refresh_cached_figures_without_writing_a_version(self):
+        self.checkout(1)
+        self.assertEqual(self.daily()['X-Stats-Cache'], 'miss')
+        self.assertEqual(self.daily()['X-Stats-Cache'], 'hit')
+
+        self.checkout(2)
+        response = self.daily()
+        self.assertEqual(response['X-Stats-Cache'], 'miss')
+        self.assertEqual(response.data['items_sold'], 3)
+        # Checkouts only insert rows; the shared version row is left alone
+        self.assertFalse(DataVersion.objects.exists())
+
+    def test_edits_refresh_cached_figures(self):
+        self.checkout(1)
+        self.daily()
+        payment = Payment.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.notes = 'counted twice'
+            payment.save()
+        self.assertEqual(self.daily()['X-Stats-Cache'], 'miss')
+
+        movement = StockMovement.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            movement.delete()
+        self.assertEqual(self.daily()['X-Stats-Cache'], 'miss')
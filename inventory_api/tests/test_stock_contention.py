@@ -0,0 +1,82 @@
+"""Concurrent sales of one product (see stock.py and bench_stock_contention)"""
+import threading
+import time
+from decimal import Decimal
+
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase
+
+from inventory_api.models import Product, StockMovement
+from inventory_api.stock import InsufficientStock, shard_product, total_stock
+
+
+class ConcurrentStockTests(TransactionTestCase):
+    THREADS = 4
+    SALES = 15
+    # Less than the threads try to sell, so that some sales must be refused
+    STOCK = 40
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Hot product',
+            sku='HOT-SKU',
+            quantity=self.STOCK,
+            unit_price=Decimal('1.00'),
+            cost_price=Decimal('0.50'),
+        )
+
+    def _sell(self, results):
+        sold = rejected = 0
+        try:
+            for _ in range(self.SALES):
+                while True:
+                    try:
+                        StockMovement.objects.create(
+                            product_id=self.product.pk,
+                            movement_type='out',
+                            quantity=1,
+                            reason='sale',
+                        )
+                        sold += 1
+                    except InsufficientStock:
+                        rejected += 1
+                    except OperationalError:
+                        # SQLite lets one writer in at a time; try the sale again
+                        time.sleep(0.001)
+                        continue
+                    break
+        finally:
+            connection.close()
+        results.append((sold, rejected))
+
+    def _run(self):
+        results = []
+        threads = [threading.Thread(target=self._sell, args=(results,)) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        sold = sum(result[0] for result in results)
+        rejected = sum(result[1] for result in results)
+        self.assertEqual(len(results), self.THREADS)
+        return sold, rejected
+
+    def assertConserved(self, sold, rejected):
+        final = total_stock(self.product.pk)
+        self.assertEqual(final, self.STOCK - sold)
+        self.assertGreaterEqual(final, 0)
+        # Every unit in stock was sold and every sale beyond it refused
+        self.assertEqual(sold, self.STOCK)
+        self.assertEqual(rejected, self.THREADS * self.SALES - self.STOCK)
+        self.assertEqual(StockMovement.objects.filter(product=self.product, movement_type='out').count(), sold)
+
+    def test_concurrent_sales_never_oversell(self):
+        sold, rejected = self._run()
+        self.assertConserved(sold, rejected)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+
+    def test_concurrent_sales_of_sharded_product_never_oversell(self):
+        shard_product(self.product.pk, 4)
+        sold, rejected = self._run()
+        self.assertConserved(sold, rejected)
@@ -14,6 +14,7 @@ router.register(r'sales', views.SaleViewSet)
 router.register(r'payments', views.PaymentViewSet)
 router.register(r'terminals', views.TerminalViewSet)
 router.register(r'business-settings', views.BusinessSettingsViewSet)
+router.register(r'reports/jobs', views.ReportJobViewSet)
 
 urlpatterns = [
     # ViewSet routes
@@ -29,6 +30,7 @@ urlpatterns = [
     
     # AI/ML endpoints
     path('ai/forecast/', views.DemandForecastView.as_view(), name='demand-forecast'),
+    path('ai/forecast/batch/', views.BatchDemandForecastView.as_view(), name='batch-demand-forecast'),
     path('ai/restock-suggestion/', views.RestockSuggestionView.as_view(), name='restock-suggestion'),
     path('ai/anomaly-detection/', views.AnomalyDetectionView.as_view(), name='anomaly-detection'),
     
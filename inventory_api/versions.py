@@ -0,0 +1,43 @@
+"""
+Version numbers shared by all workers, kept in the database.
+
+Caches that are only valid until some data changes (stats_cache.py,
+columnar.py) stamp what they keep with a version number and bump it on
+changes. The default cache backend (LocMemCache) is per process, so a
+version kept there would only be bumped in the worker that saw the
+change; DataVersion rows are seen by all of them. Reading a version is one
+primary-key-sized lookup, and bumps run after the commit that made the
+change, in their own short statement. A bump that fails there is logged
+rather than raised, since the change it follows is already committed.
+"""
+import logging
+
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from .models import DataVersion
+
+logger = logging.getLogger(__name__)
+
+
+def get(name):
+    """Current version of ``name``, 0 before its first bump"""
+    return DataVersion.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+
+def bump(name):
+    """Make everything stamped with the current version of ``name`` stale"""
+    if not DataVersion.objects.filter(name=name).update(version=F('version') + 1):
+        DataVersion.objects.get_or_create(name=name)
+        DataVersion.objects.filter(name=name).update(version=F('version') + 1)
+
+
+def bump_on_commit(name):
+    """Bump once the current transaction commits, so recomputes see the change"""
+    def bump_committed():
+        try:
+            bump(name)
+        except DatabaseError:
+            logger.exception('Could not bump the %s version', name)
+
+    transaction.on_commit(bump_committed)
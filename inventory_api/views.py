@@ -52,31 +52,52 @@ class CashReportView(APIView):
             'summary': list(summary),
             'payments': list(payment_list)
         })
-from rest_framework import viewsets, views, permissions, status, serializers
+from rest_framework import viewsets, views, permissions, status, serializers, mixins
+from rest_framework.generics import get_object_or_404
+from rest_framework.reverse import reverse
 from rest_framework.response import Response
 from rest_framework.decorators import action, permission_classes, api_view
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import update_session_auth_hash, get_user_model
+from django.db import transaction
 from django.db.models import Sum, Count, F, ExpressionWrapper, DecimalField, Avg
-from django.db.models.functions import TruncDate, TruncMonth, TruncYear
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncYear
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from collections import OrderedDict
 from datetime import timedelta, datetime
+from decimal import Decimal
 import pandas as pd
 import numpy as np
 
 from .models import (
     User, Product, Category, Supplier,
-    StockMovement, Sale, SaleItem, BusinessSettings, Payment, Terminal
+    StockMovement, Sale, SaleItem, BusinessSettings, Payment, Terminal, ReportJob,
+    DailySalesRollup
 )
 from .serializers import (
     UserSerializer, ProductSerializer, CategorySerializer,
     SupplierSerializer, StockMovementSerializer,
-    DailyStatsSerializer, MonthlyStatsSerializer, AIForecastSerializer,
+    DailyStatsSerializer, MonthlyStatsSerializer, YearlyStatsSerializer, AIForecastSerializer,
     SaleSerializer, SaleItemSerializer,
     RegisterSerializer, UserManagementSerializer, BusinessSettingsSerializer,
-    ChangePasswordSerializer, PaymentSerializer, TerminalSerializer
+    ChangePasswordSerializer, PaymentSerializer, TerminalSerializer, ReportJobSerializer
 )
+from . import columnar, forecasting, scan_index, singleflight
+from .checkout import check_stock, decrement_stock, fetch_products, lock_products
+from .closed_periods import CLOSED_MAX_AGE, cash_report, etag_for, period_end, sales_by_period
+from .exports import ExportContentNegotiation, export_response, requested_format
+from .fast_serializers import FastListMixin, serialize_queryset
+from .idempotency import idempotent
+from .pagination import KeysetPagination
+from .reports import (
+    InvalidReport, report_parameters, request_report, sales_movements
+)
+from .query_plans import PlannedQuerysetMixin
+from .rollups import record_lines, sale_line
+from .sale_batches import ingest_sales, iter_ndjson
+from .stats_cache import cached_stats
 
 # Custom permissions
 class IsAdminOrManager(permissions.BasePermission):
@@ -269,10 +290,11 @@ class SupplierViewSet(viewsets.ModelViewSet):
     serializer_class = SupplierSerializer
     permission_classes = [IsAuthenticated]
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class ProductViewSet(PlannedQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.all().prefetch_related('barcodes')
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -303,22 +325,40 @@ class ProductViewSet(viewsets.ModelViewSet):
             response.data['message'] = 'Product updated successfully'
         return response
 
+    @action(detail=False, methods=['get'], url_path=r'scan/(?P<code>[^/]+)')
+    def scan(self, request, code=None):
+        """
+        Look up a product by barcode or SKU for the POS scanner.
+
+        Served from the in-memory scan index, so it does not hit the
+        database once the index is warm. Stock is not included.
+        """
+        product = scan_index.lookup(code)
+        if product is None:
+            return Response({'error': f'No product with barcode or SKU {code}'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(product)
+
 
-class StockMovementViewSet(viewsets.ModelViewSet):
+class StockMovementViewSet(FastListMixin, PlannedQuerysetMixin, viewsets.ModelViewSet):
     queryset = StockMovement.objects.all()
     serializer_class = StockMovementSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
-class SaleViewSet(viewsets.ModelViewSet):
+class SaleViewSet(PlannedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Sale.objects.all().select_related('customer', 'created_by', 'terminal').prefetch_related('items', 'payments')
     serializer_class = SaleSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    # Numeric ids only, so sales/record/ and sales/analytics reach their own views
+    lookup_value_regex = r'\d+'
 
     def get_queryset(self):
         queryset = super().get_queryset()
+
         
         # Filter by date range if provided
         start_date = self.request.query_params.get('start_date')
@@ -336,6 +376,7 @@ class SaleViewSet(viewsets.ModelViewSet):
         
         return queryset.order_by('-created_at')
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         try:
             serializer = self.get_serializer(data=request.data)
@@ -354,10 +395,70 @@ class SaleViewSet(viewsets.ModelViewSet):
         # Set created_by from authenticated user
         sale = serializer.save(created_by=self.request.user)
 
-class PaymentViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Ingest sales queued by an offline terminal.
+
+        Accepts a JSON list of sales (or {"sales": [...]}) or an
+        application/x-ndjson stream with one sale per line. Each sale needs a
+        client_uuid; sales already ingested are reported as duplicates.
+        """
+        if request.content_type.startswith('application/x-ndjson'):
+            records = iter_ndjson(request.stream)
+        else:
+            records = request.data.get('sales') if isinstance(request.data, dict) else request.data
+            if not isinstance(records, list):
+                return Response({'error': 'Expected a list of sales'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = ingest_sales(records, user=request.user, context=self.get_serializer_context())
+        counts = {'created': 0, 'duplicate': 0, 'failed': 0}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({
+            'created': counts['created'],
+            'duplicates': counts['duplicate'],
+            'failed': counts['failed'],
+            'results': results
+        })
+
+    @action(detail=True, methods=['post'], url_path='payments')
+    @idempotent
+    def record_payments(self, request, pk=None):
+        """
+        Record several payments (e.g. a split tender) against one sale with a
+        single lock and a single update of the sale totals
+        """
+        sale = self.get_object()
+        serializer = PaymentSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response({'error': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        payments = []
+        for payment_data in serializer.validated_data:
+            # Automatically assign the same terminal as the sale if not provided
+            if not payment_data.get('terminal'):
+                payment_data['terminal'] = sale.terminal
+            payments.append(Payment(created_by=request.user, **payment_data))
+        payments = sale.record_payments(payments)
+
+        return Response({
+            'sale': sale.id,
+            'status': sale.status,
+            'amount_paid': sale.amount_paid,
+            'balance_due': sale.balance_due,
+            'payments': PaymentSerializer(payments, many=True).data
+        }, status=status.HTTP_201_CREATED)
+
+class PaymentViewSet(FastListMixin, PlannedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all().select_related('sale__customer', 'created_by', 'sale__terminal', 'terminal')
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -376,6 +477,20 @@ class TerminalViewSet(viewsets.ModelViewSet):
 
 class CashReportView(views.APIView):
     permission_classes = [IsAuthenticated]
+    content_negotiation_class = ExportContentNegotiation
+
+    # Columns of ?format=csv|ndjson|xlsx exports: one row per payment
+    EXPORT_COLUMNS = (
+        ('id', 'id'),
+        ('created_at', 'created_at'),
+        ('payment_method', 'payment_method'),
+        ('amount', 'amount'),
+        ('sale', 'sale_id'),
+        ('order_number', 'sale__order_number'),
+        ('customer_name', 'sale__customer__name'),
+        ('terminal', 'terminal__name'),
+        ('created_by_username', 'created_by__username'),
+    )
 
     def get(self, request):
         # Allow filtering by date range
@@ -398,92 +513,161 @@ class CashReportView(views.APIView):
             except ValueError:
                 end_date = timezone.now().date()
 
-        payments = Payment.objects.filter(
-            created_at__date__range=[start_date, end_date]
-        ).select_related('sale__customer', 'created_by', 'sale__terminal', 'terminal')
-        
-        # Aggregate by payment method
-        report = payments.values('payment_method').annotate(
-            total_amount=Sum('amount'),
-            count=Count('id')
-        )
+        export_format = requested_format(request)
+        if export_format:
+            payments = Payment.objects.filter(
+                created_at__date__range=[start_date, end_date]
+            ).select_related('sale__customer', 'created_by', 'sale__terminal', 'terminal')
+            return export_response(
+                export_format, payments.order_by('created_at', 'id'), self.EXPORT_COLUMNS,
+                f'cash-report-{start_date}-{end_date}'
+            )
         
-        # Use serializer to get individual payments with customer info
-        from .serializers import PaymentSerializer
-        individual_payments = PaymentSerializer(payments, many=True).data
+        # Summary by payment method and individual payments; past days are
+        # stored once computed and only today is read live
+        report, etag, closed = cash_report(start_date, end_date)
         
         # Calculate totals - include all payment methods
-        total_amount = sum(p['total_amount'] for p in report)
-        total_cash = sum(p['total_amount'] for p in report if p['payment_method'] == 'cash')
+        total_amount = sum(p['total_amount'] for p in report['summary'])
+        total_cash = sum(p['total_amount'] for p in report['summary'] if p['payment_method'] == 'cash')
         
-        return Response({
+        return conditional_response(request, {
             'start_date': start_date,
             'end_date': end_date,
-            'summary': list(report),
-            'payments': individual_payments,
+            'summary': report['summary'],
+            'payments': report['payments'],
             'total_amount': total_amount,
             'total_cash': total_cash
-        })
+        }, etag_for([etag, str(start_date), str(end_date)]), closed)
+
+def rollup_totals(rows):
+    """Sales, cost and units of some DailySalesRollup rows"""
+    return rows.aggregate(
+        total_sales=Coalesce(Sum('revenue'), Decimal('0')),
+        total_cost=Coalesce(Sum('cost'), Decimal('0')),
+        items_sold=Coalesce(Sum('quantity'), 0),
+    )
+
+
+def period_stats(periods, key):
+    """
+    Sales per month or year from closed_periods.sales_by_period, keyed by
+    ``key``, with profit and growth in sales over the previous period as a
+    percentage. Periods without sales are left out.
+    """
+    results = []
+    previous = None
+    for start, totals in periods:
+        if not totals['items_sold']:
+            previous = None
+            continue
+        stats = dict(totals, **{key: start})
+        stats['profit'] = stats['total_sales'] - stats['total_cost']
+        growth = Decimal('0')
+        if previous:
+            growth = (stats['total_sales'] - previous) * 100 / previous
+        # Keep within what the serializer's growth_rate field can hold
+        stats['growth_rate'] = max(Decimal('-999.99'), min(Decimal('999.99'), growth)).quantize(Decimal('0.01'))
+        previous = stats['total_sales']
+        results.append(stats)
+    return results
+
+
+def conditional_response(request, data, etag, closed):
+    """
+    Response tagged with ``etag`` that answers a matching If-None-Match
+    with 304. Figures of closed periods change only when history is edited,
+    so clients may reuse them for CLOSED_MAX_AGE seconds; others must be
+    revalidated.
+    """
+    etag = f'"{etag}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    if closed:
+        patch_cache_control(response, private=True, max_age=CLOSED_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def parse_period(value, pattern):
+    """Date from a ?month=YYYY-MM or ?year=YYYY parameter, or None"""
+    try:
+        return datetime.strptime(value, pattern).date()
+    except ValueError:
+        return None
+
+
+def stats_response(request, endpoint, parameters, compute):
+    """Response with the cached statistics, saying how fresh they are"""
+    data, state = cached_stats(endpoint, parameters, compute)
+    response = conditional_response(request, data, etag_for(data), closed=False)
+    response['X-Stats-Cache'] = state
+    return response
+
 
 class DailyStatsView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        today = timezone.now().date()
-        movements = StockMovement.objects.filter(
-            created_at__date=today,
-            movement_type='out'
-        )
-        
-        stats = {
-            'date': today,
-            'total_sales': movements.aggregate(
-                total=Sum(F('quantity') * F('product__unit_price'))
-            )['total'] or 0,
-            'total_cost': movements.aggregate(
-                total=Sum(F('quantity') * F('product__cost_price'))
-            )['total'] or 0,
-            'items_sold': movements.aggregate(
-                total=Sum('quantity')
-            )['total'] or 0,
-            'top_products': self._get_top_products(movements)
-        }
-        
+        return stats_response(request, 'daily', {}, self._compute)
+
+    def _compute(self):
+        today = timezone.localdate()
+        rows = DailySalesRollup.objects.filter(date=today)
+
+        stats = rollup_totals(rows)
+        stats['date'] = today
+        stats['top_products'] = self._get_top_products(rows)
         stats['profit'] = stats['total_sales'] - stats['total_cost']
         
         serializer = DailyStatsSerializer(stats)
-        return Response(serializer.data)
-
-    def _get_top_products(self, movements):
-        return movements.values(
-            'product__name'
-        ).annotate(
-            quantity=Sum('quantity'),
-            revenue=Sum(F('quantity') * F('product__unit_price'))
-        ).order_by('-quantity')[:5]
+        return serializer.data
+
+    def _get_top_products(self, rows):
+        top = rows.values('product__name').annotate(
+            units=Sum('quantity'),
+            total_revenue=Sum('revenue')
+        ).order_by('-units')[:5]
+        return [
+            {'product__name': row['product__name'], 'quantity': row['units'], 'revenue': row['total_revenue']}
+            for row in top
+        ]
 
 class MonthlyStatsView(views.APIView):
+    """
+    Sales per month over the last 30 days, or for one calendar month with
+    ?month=YYYY-MM (with growth over the month before), which clients may
+    cache for a few minutes once the month is over
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        end_date = timezone.now().date()
+        if 'month' not in request.query_params:
+            return stats_response(request, 'monthly', {}, self._compute)
+
+        month = parse_period(request.query_params['month'], '%Y-%m')
+        if month is None or month > timezone.localdate():
+            return Response(
+                {'error': 'month must be a month that has started, as YYYY-MM'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        previous = (month - timedelta(days=1)).replace(day=1)
+        periods, etag, closed = sales_by_period(previous, period_end('sales_month', month), 'sales_month')
+        monthly_data = [stats for stats in period_stats(periods, 'month') if stats['month'] == month]
+        serializer = MonthlyStatsSerializer(monthly_data, many=True)
+        return conditional_response(request, serializer.data, etag, closed)
+
+    def _compute(self):
+        end_date = timezone.localdate()
         start_date = end_date - timedelta(days=30)
         
-        movements = StockMovement.objects.filter(
-            created_at__date__range=[start_date, end_date],
-            movement_type='out'
-        )
-        
-        monthly_data = movements.annotate(
-            month=TruncMonth('created_at')
-        ).values('month').annotate(
-            total_sales=Sum(F('quantity') * F('product__unit_price')),
-            total_cost=Sum(F('quantity') * F('product__cost_price')),
-            items_sold=Sum('quantity')
-        ).order_by('month')
-        
-        serializer = MonthlyStatsSerializer(monthly_data, many=True)
-        return Response(serializer.data)
+        periods, _, _ = sales_by_period(start_date, end_date, 'sales_month')
+        serializer = MonthlyStatsSerializer(period_stats(periods, 'month'), many=True)
+        return serializer.data
 
 class DemandForecastView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -492,34 +676,16 @@ class DemandForecastView(views.APIView):
         product_id = request.data.get('product_id')
         try:
             product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+        except (Product.DoesNotExist, ValueError, TypeError):
             return Response(
                 {'error': 'Product not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Get historical data
-        movements = StockMovement.objects.filter(
-            product=product,
-            created_at__gte=timezone.now() - timedelta(days=90)
-        ).values('created_at__date').annotate(
-            quantity=Sum('quantity')
-        ).order_by('created_at__date')
-
-        # Simple moving average forecast
-        if movements:
-            df = pd.DataFrame(movements)
-            ma = df['quantity'].rolling(window=7).mean()
-            forecast = int(ma.iloc[-1]) if not np.isnan(ma.iloc[-1]) else 0
-            
-            forecast_data = {
-                'product_id': product_id,
-                'forecast_quantity': max(0, forecast),
-                'confidence_score': 0.7,  # Placeholder
-                'suggested_restock_date': timezone.now().date() + timedelta(days=7)
-            }
-            
-            serializer = AIForecastSerializer(forecast_data)
+        # Simple moving average forecast, stored by the batch forecast
+        forecast = forecasting.current(product)
+        if forecast.history_days:
+            serializer = AIForecastSerializer(forecast)
             return Response(serializer.data)
         
         return Response(
@@ -527,6 +693,36 @@ class DemandForecastView(views.APIView):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+
+class BatchDemandForecastView(views.APIView):
+    """
+    Forecast and store the demand of the products in ``product_ids``, or of
+    the whole catalog without it, in one pass (see forecasting.py)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        product_ids = request.data.get('product_ids')
+        if product_ids is not None:
+            try:
+                if not isinstance(product_ids, list):
+                    raise TypeError
+                product_ids = [int(product_id) for product_id in product_ids]
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'product_ids must be a list of product ids'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            product_ids = Product.objects.filter(id__in=product_ids).values_list('id', flat=True)
+
+        forecasts = forecasting.forecast(product_ids)
+        return Response({
+            'forecasts': AIForecastSerializer(
+                [forecast for forecast in forecasts if forecast.history_days], many=True
+            ).data,
+            'insufficient_data': [forecast.product_id for forecast in forecasts if not forecast.history_days],
+        })
+
 class RestockSuggestionView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -558,27 +754,36 @@ class RestockSuggestionView(views.APIView):
         return Response(suggestions)
 
 class YearlyStatsView(views.APIView):
+    """
+    Sales per year over the last 365 days, or for one calendar year with
+    ?year=YYYY (with growth over the year before), which clients may cache
+    for a few minutes once the year is over
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        end_date = timezone.now().date()
+        if 'year' not in request.query_params:
+            return stats_response(request, 'yearly', {}, self._compute)
+
+        year = parse_period(request.query_params['year'], '%Y')
+        if year is None or year > timezone.localdate():
+            return Response(
+                {'error': 'year must be a year that has started, as YYYY'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        previous = year.replace(year=year.year - 1)
+        periods, etag, closed = sales_by_period(previous, period_end('sales_year', year), 'sales_year')
+        yearly_data = [stats for stats in period_stats(periods, 'year') if stats['year'] == year]
+        serializer = YearlyStatsSerializer(yearly_data, many=True)
+        return conditional_response(request, serializer.data, etag, closed)
+
+    def _compute(self):
+        end_date = timezone.localdate()
         start_date = end_date - timedelta(days=365)
         
-        movements = StockMovement.objects.filter(
-            created_at__date__range=[start_date, end_date],
-            movement_type='out'
-        )
-        
-        yearly_data = movements.annotate(
-            year=TruncYear('created_at')
-        ).values('year').annotate(
-            total_sales=Sum(F('quantity') * F('product__unit_price')),
-            total_cost=Sum(F('quantity') * F('product__cost_price')),
-            items_sold=Sum('quantity')
-        ).order_by('year')
-        
-        serializer = MonthlyStatsSerializer(yearly_data, many=True)
-        return Response(serializer.data)
+        periods, _, _ = sales_by_period(start_date, end_date, 'sales_year')
+        serializer = YearlyStatsSerializer(period_stats(periods, 'year'), many=True)
+        return serializer.data
 
 class DairyStatsView(views.APIView):
     """
@@ -607,7 +812,14 @@ class DairyStatsView(views.APIView):
             end_date = timezone.now().date()
             start_date = end_date - timedelta(days=days-1)
         
-        
+        # Dashboards opening together ask for the same figures; compute them once
+        data, coalesced = singleflight.do(
+            'dairy-stats', {'start_date': start_date, 'end_date': end_date},
+            lambda: self._compute(start_date, end_date)
+        )
+        return Response(data)
+
+    def _compute(self, start_date, end_date):
         # Get ALL products to ensure we don't miss any sales
         all_products = Product.objects.all()
         
@@ -660,7 +872,7 @@ class DairyStatsView(views.APIView):
             try:
                 # Calculate statistics using SaleItem data
                 total_revenue = sum(item.quantity * item.unit_price for item in sale_items)
-                total_cost = sum(item.quantity * item.product.cost_price for item in sale_items)
+                total_cost = sum(item.quantity * item.unit_cost for item in sale_items)
                 total_quantity = sum(item.quantity for item in sale_items)
                 total_profit = total_revenue - total_cost
                 
@@ -682,8 +894,8 @@ class DairyStatsView(views.APIView):
                     
                     product_summary[product_id]['total_quantity'] += item.quantity
                     product_summary[product_id]['total_revenue'] += (item.quantity * item.unit_price)
-                    product_summary[product_id]['total_cost'] += (item.quantity * item.product.cost_price)
-                    product_summary[product_id]['profit'] += (item.quantity * (item.unit_price - item.product.cost_price))
+                    product_summary[product_id]['total_cost'] += (item.quantity * item.unit_cost)
+                    product_summary[product_id]['profit'] += (item.quantity * (item.unit_price - item.unit_cost))
                 
                 # Convert to list and sort by revenue
                 product_stats = list(product_summary.values())
@@ -713,8 +925,8 @@ class DairyStatsView(views.APIView):
                 try:
                     # Calculate statistics
                     total_stats = movements.aggregate(
-                        total_revenue=Sum(F('quantity') * F('product__unit_price')),
-                        total_cost=Sum(F('quantity') * F('product__cost_price')),
+                        total_revenue=Sum(F('quantity') * F('unit_price')),
+                        total_cost=Sum(F('quantity') * F('unit_cost')),
                         total_quantity=Sum('quantity')
                     )
                     
@@ -729,10 +941,10 @@ class DairyStatsView(views.APIView):
                         'product__id'
                     ).annotate(
                         total_quantity=Sum('quantity'),
-                        total_revenue=Sum(F('quantity') * F('product__unit_price')),
-                        total_cost=Sum(F('quantity') * F('product__cost_price')),
+                        total_revenue=Sum(F('quantity') * F('unit_price')),
+                        total_cost=Sum(F('quantity') * F('unit_cost')),
                         profit=Sum(
-                            F('quantity') * (F('product__unit_price') - F('product__cost_price'))
+                            F('quantity') * (F('unit_price') - F('unit_cost'))
                         )
                     ).order_by('-total_revenue')
                     
@@ -766,7 +978,7 @@ class DairyStatsView(views.APIView):
                 pass
         
         # Return comprehensive response with debug info
-        return Response({
+        return {
             'period': {
                 'start_date': str(start_date),
                 'end_date': str(end_date),
@@ -778,7 +990,7 @@ class DairyStatsView(views.APIView):
                 'profit': float(total_profit),
                 'quantity': total_quantity
             },
-            'dairy_products': product_stats,
+            'dairy_products': list(product_stats),
             'categories_used': [cat.name for cat in dairy_categories],
             'product_count': dairy_products.count(),
             'debug_info': {
@@ -787,7 +999,7 @@ class DairyStatsView(views.APIView):
                 'date_range': f"{start_date} to {end_date}",
                 'data_source': 'SaleItems' if sale_items else ('StockMovements' if 'movements' in locals() and movements.exists() else 'No data')
             }
-        })
+        }
 
 class AnomalyDetectionView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -848,8 +1060,14 @@ class AnomalyDetectionView(views.APIView):
         )
 
 class RecordSaleView(views.APIView):
+    """
+    Quick sale: record stock going out for a list of items without creating
+    a Sale. Every line is checked before anything is written, and the query
+    count does not depend on the number of items.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         items = request.data.get('items', [])
         if not items:
@@ -857,42 +1075,69 @@ class RecordSaleView(views.APIView):
                 {'error': 'No items provided'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        sale_movements = []
-        total_amount = 0
-        
+
+        lines = []
         for item in items:
             try:
-                product = Product.objects.get(id=item['product_id'])
-            except Product.DoesNotExist:
+                product_id = int(item['product_id'])
+                quantity = int(item.get('quantity', 1))
+            except (KeyError, TypeError, ValueError):
                 return Response(
-                    {'error': f'Product {item["product_id"]} not found'},
-                    status=status.HTTP_404_NOT_FOUND
+                    {'error': 'Each item needs a numeric product_id and quantity'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            quantity = int(item.get('quantity', 1))
-            if quantity > product.quantity:
+            if quantity < 1:
                 return Response(
-                    {'error': f'Insufficient stock for product {product.name}'},
+                    {'error': f'Quantity for product {product_id} must be at least 1'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            # Create stock movement
-            movement = StockMovement.objects.create(
-                product=product,
-                quantity=quantity,
-                movement_type='out',
-                reason='sale',
-                created_by=request.user
+            lines.append((product_id, quantity))
+
+        products = fetch_products(product_id for product_id, _ in lines)
+        for product_id, _ in lines:
+            if product_id not in products:
+                return Response(
+                    {'error': f'Product {product_id} not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+        quantities = OrderedDict()
+        for product_id, quantity in lines:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+        try:
+            with transaction.atomic():
+                locked = lock_products(list(quantities))
+                check_stock(locked, quantities)
+                # The movements are the record of the sale; stock is taken off
+                # below in one statement, not by StockMovement.save
+                sale_movements = StockMovement.objects.bulk_create([
+                    StockMovement(
+                        product=products[product_id],
+                        quantity=quantity,
+                        movement_type='out',
+                        reason='sale',
+                        unit_price=products[product_id].unit_price,
+                        unit_cost=products[product_id].cost_price,
+                        created_by=request.user
+                    )
+                    for product_id, quantity in lines
+                ])
+                decrement_stock(quantities, locked)
+                record_lines(
+                    sale_line(
+                        timezone.localdate(movement.created_at), movement.product, None,
+                        request.user.pk, movement.quantity, movement.unit_price, movement.unit_cost
+                    )
+                    for movement in sale_movements
+                )
+        except serializers.ValidationError as e:
+            return Response(
+                {'error': e.detail[0] if isinstance(e.detail, list) else e.detail},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            # Update product quantity
-            product.quantity -= quantity
-            product.save()
-            
-            sale_movements.append(movement)
-            total_amount += quantity * product.unit_price
-        
+
+        total_amount = sum(quantity * products[product_id].unit_price for product_id, quantity in lines)
         return Response({
             'status': 'success',
             'total_amount': total_amount,
@@ -900,150 +1145,207 @@ class RecordSaleView(views.APIView):
             'movements': StockMovementSerializer(sale_movements, many=True).data
         })
 
+def sales_sums(row):
+    """Sales analytics figures of a columnar.group_by row"""
+    return {
+        'total_quantity': row['quantity'],
+        'total_revenue': row['revenue'],
+        'total_cost': row['cost'],
+        'profit': row['revenue'] - row['cost'],
+    }
+
+
 class SalesAnalyticsView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
+    GROUPINGS = ('product', 'category', 'date', 'payment_method')
 
     def get(self, request):
         days = int(request.query_params.get('days', 30))
         group_by = request.query_params.get('group_by', 'product')
-        
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=days)
-        
-        movements = StockMovement.objects.filter(
-            created_at__date__range=[start_date, end_date],
-            movement_type='out',
-            reason='sale'
+        if group_by not in self.GROUPINGS:
+            return Response(
+                {'error': 'Invalid group_by parameter'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return stats_response(
+            request,
+            'sales-analytics', {'days': days, 'group_by': group_by},
+            lambda: self._compute(days, group_by)
         )
+
+    def _compute(self, days, group_by):
+        end_date = timezone.localdate()
+        start_date = end_date - timedelta(days=days)
         
+        # Sales are grouped in memory by the columnar store, see columnar.py
         if group_by == 'product':
-            analytics = movements.values(
-                'product__name'
-            ).annotate(
-                total_quantity=Sum('quantity'),
-                total_revenue=Sum(F('quantity') * F('product__unit_price')),
-                total_cost=Sum(F('quantity') * F('product__cost_price')),
-                profit=Sum(
-                    F('quantity') * (F('product__unit_price') - F('product__cost_price'))
-                )
-            ).order_by('-total_revenue')
+            analytics = [
+                dict(sales_sums(row), product__name=row['key'])
+                for row in columnar.group_by_name('product', Product, start_date, end_date)
+            ]
         elif group_by == 'category':
-            analytics = movements.values(
-                'product__category__name'
-            ).annotate(
-                total_quantity=Sum('quantity'),
-                total_revenue=Sum(F('quantity') * F('product__unit_price')),
-                total_cost=Sum(F('quantity') * F('product__cost_price')),
-                profit=Sum(
-                    F('quantity') * (F('product__unit_price') - F('product__cost_price'))
-                )
-            ).order_by('-total_revenue')
+            analytics = [
+                dict(sales_sums(row), product__category__name=row['key'])
+                for row in columnar.group_by_name('category', Category, start_date, end_date)
+            ]
         elif group_by == 'date':
-            analytics = movements.annotate(
-                date=TruncDate('created_at')
-            ).values('date').annotate(
-                total_quantity=Sum('quantity'),
-                total_revenue=Sum(F('quantity') * F('product__unit_price')),
-                total_cost=Sum(F('quantity') * F('product__cost_price')),
-                profit=Sum(
-                    F('quantity') * (F('product__unit_price') - F('product__cost_price'))
-                )
-            ).order_by('date')
-        elif group_by == 'payment_method':
+            analytics = [
+                dict(sales_sums(row), date=row['key'])
+                for row in columnar.group_by('date', start_date, end_date)
+            ]
+        else:
             # Payments are separate from StockMovements, so we query Payment model
             payments = Payment.objects.filter(
                 created_at__date__range=[start_date, end_date]
             )
-            analytics = payments.values(
+            analytics = list(payments.values(
                 'payment_method'
             ).annotate(
                 total_revenue=Sum('amount'),
                 count=Count('id')
-            ).order_by('-total_revenue')
-        else:
-            return Response(
-                {'error': 'Invalid group_by parameter'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            ).order_by('-total_revenue'))
         
-        total_stats = movements.aggregate(
-            total_revenue=Sum(F('quantity') * F('product__unit_price')),
-            total_cost=Sum(F('quantity') * F('product__cost_price')),
-            total_quantity=Sum('quantity')
-        )
+        total_stats = columnar.totals(start_date, end_date)
         
-        return Response({
+        return {
             'period': {
                 'start_date': start_date,
                 'end_date': end_date,
                 'days': days
             },
             'total_stats': {
-                'revenue': total_stats['total_revenue'] or 0,
-                'cost': total_stats['total_cost'] or 0,
-                'profit': (total_stats['total_revenue'] or 0) - (total_stats['total_cost'] or 0),
-                'quantity': total_stats['total_quantity'] or 0
+                'revenue': total_stats['revenue'],
+                'cost': total_stats['cost'],
+                'profit': total_stats['revenue'] - total_stats['cost'],
+                'quantity': total_stats['quantity']
             },
             'analytics': analytics
-        })
+        }
 
 class GenerateReportView(views.APIView):
+    """
+    A report computed by the report worker: returned if a job already
+    computed it for the current data, else queued, answering 202 with the
+    job's URLs to poll. Exports (?format=) are streamed right away.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    content_negotiation_class = ExportContentNegotiation
+
+    # Columns of ?format=csv|ndjson|xlsx exports: one row per sold movement
+    # for sales reports and one per product for inventory reports
+    SALES_EXPORT_COLUMNS = (
+        ('created_at', 'created_at'),
+        ('product_sku', 'product__sku'),
+        ('product_name', 'product__name'),
+        ('quantity', 'quantity'),
+        ('unit_price', 'unit_price'),
+        ('unit_cost', 'unit_cost'),
+        ('revenue', 'revenue'),
+        ('notes', 'notes'),
+    )
+    INVENTORY_EXPORT_COLUMNS = (
+        ('sku', 'sku'),
+        ('name', 'name'),
+        ('category_name', 'category__name'),
+        ('quantity', 'quantity'),
+        ('cost_price', 'cost_price'),
+        ('value', 'value'),
+    )
 
     def post(self, request):
         report_type = request.data.get('type', 'sales')
-        start_date = request.data.get('start_date')
-        end_date = request.data.get('end_date')
-        
+        try:
+            parameters = report_parameters(report_type, request.data)
+        except InvalidReport as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        export_format = requested_format(request)
+        if export_format:
+            return self._export(export_format, report_type, parameters)
+
+        # Serve what a background job already computed for the current data;
+        # otherwise queue one and point the client at it
+        job, created = request_report(report_type, parameters, request.user)
+        if job.status == 'done':
+            return Response(job.result)
+        url = reverse('reportjob-detail', args=[job.pk], request=request)
+        return Response(
+            {
+                **ReportJobSerializer(job).data,
+                'url': url,
+                'result_url': reverse('reportjob-result', args=[job.pk], request=request),
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': url},
+        )
+
+    def _export(self, export_format, report_type, parameters):
         if report_type == 'sales':
-            data = self._generate_sales_report(start_date, end_date)
-        elif report_type == 'inventory':
-            data = self._generate_inventory_report()
-        else:
-            return Response(
-                {'error': 'Invalid report type'},
-                status=status.HTTP_400_BAD_REQUEST
+            movements = sales_movements(**parameters).annotate(
+                revenue=F('quantity') * F('unit_price')
+            ).order_by('created_at', 'id')
+            return export_response(
+                export_format, movements, self.SALES_EXPORT_COLUMNS,
+                f"sales-report-{parameters['start_date']}-{parameters['end_date']}"
             )
-        
-        return Response(data)
+        products = Product.objects.annotate(
+            value=F('quantity') * F('cost_price')
+        ).order_by('name', 'id')
+        return export_response(
+            export_format, products, self.INVENTORY_EXPORT_COLUMNS, 'inventory-report'
+        )
 
-    def _generate_sales_report(self, start_date, end_date):
-        movements = StockMovement.objects.filter(
-            movement_type='out',
-            created_at__date__range=[start_date, end_date]
+
+class ReportJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                       mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Background report jobs.
+
+    POST queues a report (or returns the job that already covers the same
+    report, parameters and data), GET .../<id>/ shows its status and
+    GET .../<id>/result/ returns the report once it is done. Users see
+    their own jobs, admins everyone's.
+    """
+    queryset = ReportJob.objects.all()
+    serializer_class = ReportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        queryset = self.visible_jobs().defer('result')
+        if self.action == 'list':
+            queryset = queryset[:50]
+        return queryset
+
+    def visible_jobs(self):
+        user = self.request.user
+        queryset = super().get_queryset()
+        if user.role != 'admin':
+            queryset = queryset.filter(requested_by=user)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        report_type = request.data.get('type', 'sales')
+        try:
+            parameters = report_parameters(report_type, request.data)
+        except InvalidReport as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        job, created = request_report(report_type, parameters, request.user)
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_200_OK if job.status == 'done' else status.HTTP_202_ACCEPTED
         )
-        
-        return {
-            'total_sales': movements.aggregate(
-                total=Sum(F('quantity') * F('product__unit_price'))
-            )['total'] or 0,
-            'total_items': movements.aggregate(
-                total=Sum('quantity')
-            )['total'] or 0,
-            'by_product': movements.values(
-                'product__name'
-            ).annotate(
-                quantity=Sum('quantity'),
-                revenue=Sum(F('quantity') * F('product__unit_price'))
-            ).order_by('-revenue')
-        }
 
-    def _generate_inventory_report(self):
-        return {
-            'total_products': Product.objects.count(),
-            'total_value': Product.objects.aggregate(
-                total=Sum(F('quantity') * F('cost_price'))
-            )['total'] or 0,
-            'low_stock': Product.objects.filter(
-                quantity__lte=F('reorder_point')
-            ).count(),
-            'by_category': Product.objects.values(
-                'category__name'
-            ).annotate(
-                count=Count('id'),
-                value=Sum(F('quantity') * F('cost_price'))
-            )
-        }
+    @action(detail=True, methods=['get'])
+    def result(self, request, pk=None):
+        """The finished report, or the job's status while it is not done"""
+        job = get_object_or_404(self.visible_jobs(), pk=pk)
+        if job.status == 'done':
+            return Response(job.result)
+        if job.status == 'failed':
+            return Response({'error': job.error}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 
 class BusinessSettingsViewSet(viewsets.ModelViewSet):